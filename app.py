@@ -1,448 +1,744 @@
-from flask import Flask, render_template, request, jsonify
-from pyetc_wst.wst import WST
+from flask import Flask, Response, g, redirect, render_template, request, jsonify, stream_with_context, url_for
 import warnings
 import traceback
 import json
+import time
+import os
+import tempfile
 import numpy as np
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.utils import secure_filename
+import assets
+import catalogue
+import compression
+import etc_core
+import exposure
+import jobs
+import metrics
+import settings
+import sweep
+import transport
+import warmup
+import wst_pool
+from result_cache import canonical_value
 warnings.filterwarnings('ignore')
 
-app = Flask(__name__)
-
-# All possible instruments and channels
-INSTRUMENTS = ['ifs', 'moshr', 'moslr']
-CHANNELS = {
-    'ifs': ['blue', 'red'],
-    'moslr': ['blue', 'green', 'red'],
-    'moshr': ['U', 'B', 'V', 'I']
-}
-
-# Color mapping for plots (matching HTML colors)
-COLORS = {
-    'ifs-red': '#c62828',
-    'ifs-blue': '#1565c0',
-    'moshr-U': '#6a1b9a',
-    'moshr-B': '#01579b',
-    'moshr-V': '#2e7d32',
-    'moshr-I': '#d84315',
-    'moslr-blue': '#0d47a1',
-    'moslr-green': '#388e3c',  
-    'moslr-red': '#b71c1c'
-}
-
-# All parameter keys (excluding INS/CHAN)
-ALL_PARAM_KEYS = [
-    "NDIT", "DIT", "SNR", "Lam_Ref", "OBJ_FIB_DISP", "MOON", "PWV", "FLI", "SEE", "AM", "SKYCALC",
-    "Obj_SED", "SED_Name", "OBJ_MAG", "MAG_SYS", "MAG_FIL", "Z", "BB_Temp", "PL_Index", 
-    "SEL_FLUX", "SEL_CWAV", "SEL_FWHM",
-    "Obj_Spat_Dis", "IMA", "Ext_Ell", "IMA_FWHM", "IMA_BETA", "IMA_KFWHM", "Sersic_Reff", "Sersic_Ind", "IMA_KREFF",
-    "SPEC_RANGE", "SPEC_KFWHM", "SPEC_HSIZE", "COADD_WL", "IMA_RANGE", "COADD_XY", "OPT_SPEC", "OPT_IMA", "FRAC_SPEC_MEAN_OPT_IMAGE"
-]
+app = Flask(__name__, static_folder=None)
+if settings.PROXY_HOPS:
+    # Behind reverse proxies, the client address is the one they forward
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=settings.PROXY_HOPS, x_proto=settings.PROXY_HOPS)
+app.jinja_env.globals.update(asset_url=assets.asset_url, plotly_url=assets.plotly_url)
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
-    result = None
-    res_time = None
-    res_snr = None
+def load_backend():
+    """Load the WST instrument models, which are reused by every request.
+
+    The instances of the shared pool serve the computations run in this
+    process, if any (see ``etc_core.uses_local_pool``); the worker processes
+    (see ``etc_core.uses_worker_processes``) load their own.
+    """
+    if etc_core.uses_local_pool():
+        wst_pool.pool.start()
+    if settings.PROCESS_PRESTART and etc_core.uses_worker_processes():
+        etc_core.start_executor()
+
+# Loaded in the background: the server answers (health checks, "warming up"
+# replies) while the models load
+backend_warmup = warmup.Warmup(load_backend)
+# Not in the ETC worker processes, which import the main module of the
+# server again ('__mp_main__') when it is this file
+if __name__ != '__mp_main__':
+    backend_warmup.start()
+
+# Routes computing with the WST models, refused until they are loaded
+COMPUTE_ENDPOINTS = {'index', 'submit_job', 'api_compute', 'api_sweep', 'api_curve', 'compute_catalogue'}
+
+# Background computations submitted by the page
+job_queue = jobs.JobQueue(workers=settings.JOB_WORKERS, max_queued=settings.JOB_QUEUE_SIZE,
+                          max_per_client=settings.JOB_MAX_PER_CLIENT, ttl=settings.JOB_TTL,
+                          directory=settings.JOB_DIR)
+
+@app.before_request
+def start_timing():
+    g.start_time = time.perf_counter()
+    metrics.start_request()
+
+@app.before_request
+def refuse_until_warm():
+    if request.method != 'POST' or request.endpoint not in COMPUTE_ENDPOINTS or backend_warmup.ready:
+        return None
+    if backend_warmup.state == 'failed':
+        message = f"The ETC backend failed to load: {backend_warmup.error}"
+    else:
+        message = "The ETC is starting up (loading the instrument models), please retry in a moment."
+    if request.endpoint == 'index':
+        response = app.make_response((render_index(params=etc_core.DEFAULT_PARAMS.copy(), selected_configs=[],
+                                                   debug_output=f"ERROR: {message}", plot_data=None), 503))
+    else:
+        response = jsonify({'error': message, 'status': backend_warmup.state})
+        response.status_code = 503
+    if backend_warmup.state != 'failed':
+        response.headers['Retry-After'] = '5'
+    return response
+
+@app.after_request
+def add_server_timing(response):
+    # Streamed responses are timed up to their headers
+    total = time.perf_counter() - g.start_time
+    timings = metrics.end_request()
+    metrics.request_seconds.observe(total, endpoint=request.endpoint or 'none', method=request.method,
+                                    status=response.status_code)
+    response.headers['Server-Timing'] = metrics.server_timing(timings, total)
+    return response
+
+@app.after_request
+def compress_response(response):
+    return compression.compress_response(response, request)
+
+def render_index(**context):
+    with metrics.timer('render'):
+        return render_template('index.html', result=None, res_time=None, res_snr=None, **context)
+
+SWEEP_QUANTITY_LABELS = {'snr': 'SNR', 'ndit': 'Required NDIT', 'dit': 'Required DIT [s]'}
+
+def _describe_axis(name, values):
+    if len(values) > 1 and all(isinstance(v, (int, float)) for v in values):
+        return f"  {name}: {len(values)} values from {values[0]:g} to {values[-1]:g}"
+    return f"  {name}: {', '.join(str(v) for v in values)}"
+
+def run_form_sweep(configs, compute_mode, axes, progress=None, deadline=None):
+    """Run a parameter sweep for every configuration; return the debug text and plot data."""
+    debug_lines = []
+    debug_lines.append("=" * 80)
+    debug_lines.append("WST ETC - PARAMETER SWEEP")
+    debug_lines.append("=" * 80)
+    debug_lines.append("")
+    sweep_data = []
+    has_errors = False
+    for idx, config in enumerate(configs):
+        inst = config['INS']
+        chan = config['CH']
+        block = []
+        block.append(f"Configuration {idx+1}: {inst.upper()} - {chan.upper()}")
+        block.append("-" * 80)
+        res = sweep.run_sweep(config, compute_mode, axes, deadline=deadline)
+        with metrics.timer('serialize', ins=inst, ch=chan, mode=compute_mode):
+            values = sweep.grid_payload(res)
+        quantity = SWEEP_QUANTITY_LABELS[res['quantity']]
+        block.append(f"  Swept quantity: {quantity}")
+        for name, axis_values in axes:
+            block.append(_describe_axis(name, axis_values))
+        block.append(f"  Grid points: {res['values'].size} ({res['n_points']} computed)")
+        if res['errors']:
+            has_errors = True
+            n_failed = int(np.isnan(res['values']).sum())
+            block.append(f"  ⚠ WARNING: {n_failed} grid points could not be computed, e.g.: {res['errors'][0]}")
+        n_saturated = int(res['saturated'].sum())
+        if n_saturated:
+            block.append(f"  ⚠ Saturated grid points: {n_saturated}")
+        block.append("")
+        debug_lines.extend(block)
+        if progress:
+            progress('progress', done=idx + 1, total=len(configs), name=f"{inst.upper()} {chan.upper()}",
+                     text='\n'.join(block))
+        sweep_data.append({
+            'name': f"{inst.upper()} {chan.upper()}",
+            'color': etc_core.COLORS.get(f"{inst}-{chan}", '#000000'),
+            'quantity': quantity,
+            'axes': res['axes'],
+            'values': values,
+            'saturated': res['saturated'].tolist(),
+        })
+    debug_lines.append("=" * 80)
+    if has_errors:
+        debug_lines.append("Sweep completed with warnings/errors (see above)")
+    else:
+        debug_lines.append("Sweep completed successfully")
+    debug_lines.append("=" * 80)
+    return '\n'.join(debug_lines), sweep_data
+
+def _curve_lines(curve, config):
+    axis = curve['axis']
+    fixed = 'NDIT' if axis == 'DIT' else 'DIT'
+    unit = ' s' if axis == 'DIT' else ''
+    lines = [f"  Mode: Exposure curve ({axis})",
+             f"  {fixed}: {config[fixed]}{' s' if fixed == 'DIT' else ''}",
+             _describe_axis(axis, [float(v) for v in curve['values']]),
+             f"  Target SNR: {config['SNR']}"]
+    if curve['ref_wave'] is not None:
+        lines.append(f"  Reference wavelength: {curve['ref_wave']:.1f} Å")
+    target = curve['target']
+    if target is None:
+        lines.append("  → Target SNR not reached")
+    else:
+        lines.append(f"  → Target SNR reached at {axis} = {target['value']:.2f}{unit} "
+                     f"(total exposure {target['exposure']:.1f} s)")
+        if target['index'] is None:
+            lines.append(f"  ⚠ WARNING: beyond the largest {axis} of the curve")
+        elif target['value'] < curve['values'][0]:
+            lines.append(f"  (extrapolated below the smallest {axis} of the curve)")
+        if target['saturated']:
+            lines.append("  ⚠ WARNING: some pixels saturate at this exposure")
+    saturation = curve['saturation']
+    if saturation is None:
+        lines.append("  → No saturation over the curve")
+    else:
+        lines.append(f"  → Saturation starts at {axis} = {saturation['value']:g}{unit} "
+                     f"(total exposure {saturation['exposure']:.1f} s, "
+                     f"fraction saturated {saturation['frac_sat']*100:.1f}%)")
+    if curve['errors']:
+        failed = np.flatnonzero(~np.isfinite(curve['snr']))
+        if len(failed) == len(curve['values']):
+            lines.append(f"  ⚠ WARNING: SNR not computed: {curve['errors'][0]}")
+        else:
+            lines.append(f"  ⚠ WARNING: SNR not computed from {axis} = {curve['values'][failed[0]]:g}{unit}: "
+                         f"{curve['errors'][0]}")
+    lines.append(f"  Solver calls: {curve['n_solves']} for {len(curve['values'])} values")
+    return lines
+
+def run_form_curve(configs, axis, values, progress=None, deadline=None):
+    """Compute an exposure-time curve for every configuration; return the debug text and plot data."""
+    debug_lines = []
+    debug_lines.append("=" * 80)
+    debug_lines.append("WST ETC - EXPOSURE CURVE")
+    debug_lines.append("=" * 80)
+    debug_lines.append("")
+    blocks = [None] * len(configs)
+    curve_data = [None] * len(configs)
+    has_errors = False
+    tasks = [(config, axis, values) for config in configs]
+    for n_done, (idx, curve, error) in enumerate(etc_core.map_tasks(exposure.exposure_curve, tasks, deadline=deadline), 1):
+        config = configs[idx]
+        inst = config['INS']
+        chan = config['CH']
+        block = [f"Configuration {idx+1}: {inst.upper()} - {chan.upper()}", "-" * 80]
+        if error is not None:
+            block.append(f"  ERROR: {error}")
+            has_errors = True
+        else:
+            block.extend(_curve_lines(curve, config))
+            has_errors = has_errors or bool(curve['errors'])
+            with metrics.timer('serialize', ins=inst, ch=chan, mode=exposure.CURVE_MODE):
+                curve_data[idx] = {
+                    'name': f"{inst.upper()} {chan.upper()}",
+                    'color': etc_core.COLORS.get(f"{inst}-{chan}", '#000000'),
+                    'axis': axis,
+                    'values': curve['values'].tolist(),
+                    'exposure': curve['exposure'].tolist(),
+                    'snr': np.where(np.isfinite(curve['snr']), curve['snr'], None).tolist(),
+                    'saturated': curve['saturated'].tolist(),
+                    'target_snr': curve['target_snr'],
+                    'target': curve['target'],
+                    'saturation': curve['saturation'],
+                }
+        block.append("")
+        blocks[idx] = block
+        if progress:
+            progress('progress', done=n_done, total=len(configs), name=f"{inst.upper()} {chan.upper()}",
+                     text='\n'.join(block))
+    for block in blocks:
+        debug_lines.extend(block)
+    debug_lines.append("=" * 80)
+    if has_errors:
+        debug_lines.append("Computation completed with warnings/errors (see above)")
+    else:
+        debug_lines.append("Computation completed successfully")
+    debug_lines.append("=" * 80)
+    return '\n'.join(debug_lines), [c for c in curve_data if c is not None]
+
+def update_params(params, form):
+    """Update ``params`` with the parameter values submitted in ``form``."""
+    for k in etc_core.ALL_PARAM_KEYS:
+        v = form.get(k)
+        if v is not None and v != '':
+            params[k] = etc_core.parse_value(v)
+
+def compute_form(form, progress=None):
+    """Run the computation requested by the page form.
+
+    ``form`` is the submitted form (a ``MultiDict``). Returns the context of
+    the result page. ``progress(event, **data)``, if given, is called each
+    time an instrument-channel configuration is done.
+    """
     debug_output = ""
     plot_data = None
+    sweep_data = None
+    # Time budget of the whole computation
+    deadline = etc_core.request_deadline()
     
-    # Default values for all parameters
-    default_params = {
-        "NDIT": 1,
-        "DIT": 600, 
-        "SNR": 10,
-        "Lam_Ref": 5000,
-        "OBJ_FIB_DISP": 0,
-        "MOON": None,
-        "PWV": 10,
-        "FLI": 0,
-        "SEE": 0.8,
-        "AM": 1.,
-        "SKYCALC": True,
-        "Obj_SED": 'template',
-        "SED_Name": 'Kinney_s0',
-        "OBJ_MAG": 12,
-        "MAG_SYS": 'Vega',
-        "MAG_FIL": 'V',
-        "Z": 0,
-        "BB_Temp": 9000.,
-        "PL_Index": -2,
-        "SEL_FLUX": 50e-16,
-        "SEL_CWAV": 5000,
-        "SEL_FWHM": 20,
-        "Obj_Spat_Dis": 'ps',
-        "IMA": 'sersic',
-        "Ext_Ell": None,
-        "IMA_FWHM": None,
-        "IMA_BETA": None,
-        "IMA_KFWHM": None,
-        "Sersic_Reff": 3.0,
-        "Sersic_Ind": 1.0,
-        "IMA_KREFF": 5,
-        "SPEC_RANGE": 'fixed',
-        "SPEC_KFWHM": None,
-        "SPEC_HSIZE": 999999,
-        "COADD_WL": 1,
-        "IMA_RANGE": 'square_fixed',
-        "COADD_XY": 1,
-        "OPT_SPEC": False,
-        "OPT_IMA": False,
-        "FRAC_SPEC_MEAN_OPT_IMAGE": 1
-    }
-    
-    params = default_params.copy()
+    params = etc_core.DEFAULT_PARAMS.copy()
     configs = []
     
+    # Get selected configurations
+    selected_configs = form.getlist('config')
+    context = dict(params=params, selected_configs=selected_configs)
+    
+    try:
+        # Get compute mode
+        compute_mode = form.get('compute_mode', 'dit_ndit')
+
+        # Persist compute_mode in params so it stays selected after Compute
+        params['compute_mode'] = compute_mode
+        
+        # If no configuration is selected, show warning
+        if not selected_configs:
+            debug_output = "ERROR: No configuration selected. Please select at least one instrument-channel pair."
+            return dict(context, debug_output=debug_output, plot_data=plot_data)
+        
+        # Update params with user-provided values
+        update_params(params, form)
+        
+        # Parse selected instrument-channel pairs and create configs
+        configs = []
+        for pair in selected_configs:
+            inst, chan = pair.split('-')
+            configs.append(etc_core.make_config(inst, chan, params))
+        
+        # Parameter sweep: up to three swept parameters with their ranges
+        sweep_pairs = []
+        for n in range(1, sweep.MAX_SWEEP_AXES + 1):
+            name = form.get(f'sweep_param_{n}', '')
+            values = form.get(f'sweep_values_{n}', '')
+            params[f'sweep_param_{n}'] = name
+            params[f'sweep_values_{n}'] = values
+            if name:
+                sweep_pairs.append((name, values))
+        # Exposure-time curve over NDIT or DIT values
+        params['curve_axis'] = form.get('curve_axis', 'NDIT')
+        params['curve_values'] = form.get('curve_values', '')
+        if compute_mode == exposure.CURVE_MODE:
+            if sweep_pairs:
+                debug_output = "ERROR: A parameter sweep cannot be combined with the exposure curve mode."
+                return dict(context, debug_output=debug_output, plot_data=plot_data)
+            try:
+                values = exposure.parse_curve(params['curve_axis'], params['curve_values'])
+            except ValueError as e:
+                return dict(context, debug_output=f"ERROR: {e}", plot_data=plot_data)
+            debug_output, curve_data = run_form_curve(configs, params['curve_axis'], values, progress, deadline)
+            return dict(context, debug_output=debug_output, plot_data=plot_data, curve_data=curve_data)
+        if sweep_pairs:
+            try:
+                axes = sweep.parse_axes(sweep_pairs)
+                debug_output, sweep_data = run_form_sweep(configs, compute_mode, axes, progress, deadline)
+            except ValueError as e:
+                debug_output, sweep_data = f"ERROR: {e}", None
+            return dict(context, debug_output=debug_output, plot_data=plot_data, sweep_data=sweep_data)
+        
+        # Run ETC for each configuration
+        debug_lines = []
+        debug_lines.append("=" * 80)
+        debug_lines.append("WST ETC - COMPUTATION RESULTS")
+        debug_lines.append("=" * 80)
+        debug_lines.append("")
+        
+        # Store plot data
+        plot_traces = []
+        summary_table = []
+        has_errors = False
+        
+        # Evaluate all configurations, serially or in the worker process pool,
+        # reporting each one as soon as it is done
+        results = [None] * len(configs)
+        tasks = [(config, compute_mode) for config in configs]
+        for n_done, (idx, res) in enumerate(etc_core.iter_results(tasks, deadline=deadline), 1):
+            results[idx] = res
+            if progress:
+                inst = configs[idx]['INS']
+                chan = configs[idx]['CH']
+                progress('progress', done=n_done, total=len(configs), name=f"{inst.upper()} {chan.upper()}",
+                         text='\n'.join([f"Configuration {idx+1}: {inst.upper()} - {chan.upper()}",
+                                         "-" * 80] + res['lines'] + [""]))
+        
+        for idx, (config, res) in enumerate(zip(configs, results)):
+            inst = config['INS']
+            chan = config['CH']
+            debug_lines.append(f"Configuration {idx+1}: {inst.upper()} - {chan.upper()}")
+            debug_lines.append("-" * 80)
+            debug_lines.extend(res['lines'])
+            debug_lines.append("")
+            has_errors = has_errors or res['has_errors']
+            with metrics.timer('serialize', ins=inst, ch=chan, mode=compute_mode):
+                plot_traces.extend(transport.plot_traces(res))
+            if res['summary'] is not None:
+                summary_table.append(res['summary'])
+        
+        debug_lines.append("=" * 80)
+        if has_errors:
+            debug_lines.append("Computation completed with warnings/errors (see above)")
+        else:
+            debug_lines.append("Computation completed successfully")
+        debug_lines.append("=" * 80)
+        
+        debug_output = '\n'.join(debug_lines)
+        
+        # Prepare plot data for frontend only if we have valid traces
+        if plot_traces:
+            plot_data = {
+                'traces': plot_traces,
+                'summary': summary_table,
+                'compute_mode': compute_mode
+            }
+        
+    except Exception as e:
+        debug_output = f"CRITICAL ERROR: {str(e)}\n\nFull traceback:\n{traceback.format_exc()}"
+    
+    return dict(context, debug_output=debug_output, plot_data=plot_data)
+
+@app.route('/', methods=['GET', 'POST'])
+def index():
     if request.method == 'POST':
+        context = compute_form(request.form)
+    else:
+        context = dict(params=etc_core.DEFAULT_PARAMS.copy(), selected_configs=[], debug_output="", plot_data=None)
+    return render_index(**context)
+
+def _client_id():
+    # The address forwarded by the trusted proxies, see PROXY_HOPS
+    return request.remote_addr or 'unknown'
+
+def _form_key(form):
+    # Identical submissions, up to the formatting of the numbers, share a job
+    return tuple(sorted((k, tuple(canonical_value(v) for v in values)) for k, values in form.lists()))
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue the computation of the submitted form in the background.
+
+    Returns the job id at once, with the URLs of its progress event stream
+    and of its result page.
+    """
+    form = request.form.copy()
+    try:
+        job, coalesced = job_queue.submit(_form_key(form), _client_id(),
+                                          lambda emit: compute_form(form, emit))
+    except jobs.ClientLimitError as e:
+        return jsonify({'error': str(e)}), 429
+    except jobs.QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'coalesced': coalesced,
+        'events_url': url_for('job_events', job_id=job.id),
+        'result_url': url_for('job_result', job_id=job.id),
+        'fragment_url': url_for('job_result', job_id=job.id, fragment=1),
+    }), 202
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-Sent Events stream of the progress of a job.
+
+    Events are ``status``, ``progress`` (one per configuration done, with
+    its debug lines) and finally ``done`` or ``failed``. Reconnecting
+    clients resume after their ``Last-Event-ID``.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': "Unknown or expired job"}), 404
+    try:
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+
+    def generate():
+        n = start
+        while True:
+            events = job.wait_events(n, timeout=15)
+            if not events:
+                if job.done:
+                    return
+                # Keep idle connections open through proxies
+                yield ": keepalive\n\n"
+                continue
+            for event, data in events:
+                yield f"id: {n}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+                n += 1
+                if event in jobs.FINAL_EVENTS:
+                    return
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_result(job_id):
+    """Result page of a job, as rendered by a plain form submission.
+
+    With ``?fragment=1``, only the results section of the page, which the
+    page script swaps in without rendering the form again.
+    """
+    fragment = request.args.get('fragment') == '1'
+    job = job_queue.get(job_id)
+    if job is None:
+        if fragment:
+            return jsonify({'error': "Unknown or expired job"}), 404
+        return redirect(url_for('index'))
+    if job.status == 'done':
+        context = job.result
+    else:
+        message = f"ERROR: {job.error}" if job.status == 'failed' else "Computation still in progress, reload this page in a moment."
+        context = dict(params=etc_core.DEFAULT_PARAMS.copy(), selected_configs=[], debug_output=message, plot_data=None)
+    if fragment:
+        with metrics.timer('render'):
+            return render_template('results.html', **context)
+    return render_index(**context)
+
+def _api_record(index, config, compute_mode, res, arrays):
+    record = {
+        'index': index,
+        'INS': config['INS'],
+        'CH': config['CH'],
+        'compute_mode': compute_mode,
+        'ok': not res['has_errors'],
+    }
+    record.update(res['scalars'])
+    if res['has_errors']:
+        record['log'] = '\n'.join(res['lines'])
+    with metrics.timer('serialize', ins=config['INS'], ch=config['CH'], mode=compute_mode):
+        if arrays:
+            # arrays="f32": base64 little-endian float32 instead of JSON numbers
+            encode = transport.encode_f32 if arrays == 'f32' else (lambda a: a.tolist())
+            for trace in res['traces']:
+                suffix = '_rebin' if trace.get('secondary') else ''
+                record['wave' + suffix] = encode(trace['x'])
+                record['snr' + suffix] = encode(trace['y'])
+        return json.dumps(record) + '\n'
+
+@app.route('/api/compute', methods=['POST'])
+def api_compute():
+    """Batch computation API for scripts, without any HTML rendering.
+
+    The body is a JSON list of observation specs, or an object
+    ``{"specs": [...], "arrays": false}``. Each spec is
+    ``{"INS": "ifs", "CH": "blue", "compute_mode": "dit_snr", "params": {...}}``
+    and may set its own ``arrays`` flag to get the SNR spectra back, as JSON
+    numbers (``true``) or base64 little-endian float32 (``"f32"``).
+    One NDJSON record is streamed per spec as soon as it is computed; records
+    carry the ``index`` of their spec since they may come out of order.
+    """
+    payload = request.get_json(silent=True)
+    arrays = False
+    if isinstance(payload, dict):
+        arrays = payload.get('arrays', False)
+        payload = payload.get('specs')
+    if not isinstance(payload, list):
+        return jsonify({'error': "Expected a JSON list of observation specs"}), 400
+    if len(payload) > settings.API_MAX_SPECS:
+        return jsonify({'error': f"Too many observation specs (maximum {settings.API_MAX_SPECS})"}), 413
+    
+    tasks = []
+    task_index = []
+    task_arrays = []
+    invalid = []
+    for index, spec in enumerate(payload):
         try:
-            # Get selected configurations
-            selected_configs = request.form.getlist('config')
-            
-            # Get compute mode
-            compute_mode = request.form.get('compute_mode', 'dit_ndit')
-
-            # Persist compute_mode in params so it stays selected after Compute
-            params['compute_mode'] = compute_mode
-            
-            # If no configuration is selected, show warning
-            if not selected_configs:
-                debug_output = "ERROR: No configuration selected. Please select at least one instrument-channel pair."
-                return render_template('index.html', result=result, res_time=res_time, res_snr=res_snr, params=params, debug_output=debug_output, plot_data=plot_data)
-            
-            # Parse selected instrument-channel pairs and create configs
-            configs = []
-            for pair in selected_configs:
-                inst, chan = pair.split('-')
-                config = default_params.copy()
-                config['INS'] = inst
-                config['CH'] = chan
-                configs.append(config)
-            
-            # Update all configs and params with user-provided values
-            for config in configs:
-                for k in ALL_PARAM_KEYS:
-                    v = request.form.get(k)
-                    if v is not None and v != '':
-                        if v == 'True':
-                            config[k] = True
-                            params[k] = True
-                        elif v == 'False':
-                            config[k] = False
-                            params[k] = False
-                        elif v.replace('.', '', 1).replace('-', '', 1).replace('e', '', 1).replace('E', '', 1).replace('+','',1).isdigit():
-                            try:
-                                # Check if it's a float or int
-                                if '.' in v or 'e' in v.lower():
-                                    config[k] = float(v)
-                                    params[k] = float(v)
-                                else:
-                                    config[k] = int(v)
-                                    params[k] = int(v)
-                            except:
-                                config[k] = v
-                                params[k] = v
-                        else:
-                            config[k] = v
-                            params[k] = v
-            
-            # Run ETC for each configuration
-            debug_lines = []
-            debug_lines.append("=" * 80)
-            debug_lines.append("WST ETC - COMPUTATION RESULTS")
-            debug_lines.append("=" * 80)
-            debug_lines.append("")
-            
-            # Create a single WST object
-            obj = WST(log='DEBUG', skip_dataload=False)
-            
-            # Store plot data
-            plot_traces = []
-            summary_table = []
-            has_errors = False
-            
-            for idx, config in enumerate(configs):
-                try:
-                    inst = config['INS']
-                    chan = config['CH']
-                    config_key = f"{inst}-{chan}"
-                    
-                    debug_lines.append(f"Configuration {idx+1}: {inst.upper()} - {chan.upper()}")
-                    debug_lines.append("-" * 80)
-                    # Assign is_ifs and is_mos before using them
-                    is_ifs = inst.lower() == 'ifs'
-                    is_mos = inst.lower() in ['moshr', 'moslr']
-                    # Show number of spaxels for IFS
-                    if is_ifs:
-                        n_spaxels = config.get('COADD_XY', params.get('COADD_XY', 1))
-                        debug_lines.append(f"  Number of spaxels (spatial coadding): {n_spaxels}x{n_spaxels}")
-                    
-                    # Build observation
-                    con, ob, spe, im, spe_input = obj.build_obs_full(config)
-                    
-                    # Determine if IFS or MOS
-                    is_ifs = inst.lower() == 'ifs'
-                    is_mos = inst.lower() in ['moshr', 'moslr']
-                    
-                    # Store results
-                    res_result = None
-                    computed_snr = None
-                    computed_time = None
-                    
-                    # Compute based on mode
-                    coadd_wl = config.get('COADD_WL', params.get('COADD_WL', 1))
-                    
-                    if compute_mode == 'dit_ndit':
-                        # Compute SNR from DIT & NDIT
-                        debug_lines.append(f"  Mode: DIT & NDIT")
-                        debug_lines.append(f"  DIT: {config['DIT']} s")
-                        debug_lines.append(f"  NDIT: {config['NDIT']}")
-                        
-                        if is_ifs:
-                            res_result = obj.snr_from_source(con, im, spe)
-                        elif is_mos:
-                            res_result = obj.snr_from_source_MOS(con, im, spe)
-                        
-                        # Check if result contains error message
-                        if 'message' in res_result:
-                            debug_lines.append(f"  ⚠ WARNING: {res_result['message']}")
-                            if 'frac_sat' in res_result:
-                                    if is_ifs:
-                                        debug_lines.append(f"  → Fraction of saturated voxels: {res_result['frac_sat']*100:.1f}%")
-                                    elif is_mos:
-                                        debug_lines.append(f"  → Fraction of saturated pixels: {res_result['frac_sat']*100:.1f}%")
-                            has_errors = True
-                        else:
-                            computed_snr = res_result
-                            wave_array = res_result['spec']['snr'].wave.coord()
-                            snr_array = res_result['spec']['snr'].data.data
-                            # Use SEL_CWAV as reference wavelength if Obj_SED is 'line', else Lam_Ref
-                            if config.get('Obj_SED', params.get('Obj_SED', 'template')) == 'line':
-                                ref_wave = config.get('SEL_CWAV', params.get('SEL_CWAV', 7000))
-                            else:
-                                ref_wave = 0.5 * (wave_array[-1] + wave_array[0])
-                            idx_closest = (np.abs(wave_array - ref_wave)).argmin()
-                            true_wave = wave_array[idx_closest]
-                            achieved_snr = snr_array[idx_closest]
-                            # Always print SNR per pixel
-                            debug_lines.append(f"  → Achieved SNR at central wavelength {true_wave:.1f} Å: {achieved_snr:.2f}")
-                            # Print SNR with spectral coadding if available
-                            if 'snr_rebin' in res_result['spec']:
-                                snr_array_rebin = res_result['spec']['snr_rebin'].data.data
-                                debug_lines.append(f"  → Achieved SNR at central wavelength {true_wave:.1f} Å (with spectral coadding): {snr_array_rebin[idx_closest]:.2f}")
-                            # Add saturation info
-                            if 'frac_sat' in res_result:
-                                    if is_ifs:
-                                        debug_lines.append(f"  → Fraction of saturated voxels: {res_result['frac_sat']*100:.1f}%")
-                                    elif is_mos:
-                                        debug_lines.append(f"  → Fraction of saturated pixels: {res_result['frac_sat']*100:.1f}%")
-                            
-                    elif compute_mode == 'dit_snr':
-                        # Compute NDIT from DIT & SNR
-                        debug_lines.append(f"  Mode: DIT & SNR")
-                        debug_lines.append(f"  DIT: {config['DIT']} s")
-                        debug_lines.append(f"  Target SNR: {config['SNR']}")
-                        
-                        if is_ifs:
-                            computed_time = obj.time_from_source(con, im, spe, dit=False)
-                        elif is_mos:
-                            computed_time = obj.time_from_source_MOS(con, im, spe, dit=False)
-                        
-                        # Check if result contains error message
-                        if 'message' in computed_time:
-                            debug_lines.append(f"  ⚠ WARNING: {computed_time['message']}")
-                            if 'frac_sat' in computed_time:
-                                        if is_ifs:
-                                            debug_lines.append(f"  → Fraction of saturated voxels: {computed_time['frac_sat']*100:.1f}%")
-                                        elif is_mos:
-                                            debug_lines.append(f"  → Fraction of saturated pixels: {computed_time['frac_sat']*100:.1f}%")
-                            has_errors = True
-                        else:
-                            debug_lines.append(f"  → Required NDIT: {computed_time['ndit']:.2f}")
-                            # Add saturation info
-                            if 'frac_sat' in computed_time:
-                                        if is_ifs:
-                                            debug_lines.append(f"  → Fraction of saturated voxels: {computed_time['frac_sat']*100:.1f}%")
-                                        elif is_mos:
-                                            debug_lines.append(f"  → Fraction of saturated pixels: {computed_time['frac_sat']*100:.1f}%")
-                            # Update config with computed NDIT
-                            config['NDIT'] = int(np.ceil(computed_time['ndit']))
-                            con, ob, spe, im, spe_input = obj.build_obs_full(config)
-                            # Compute achieved SNR
-                            if is_ifs:
-                                res_result = obj.snr_from_source(con, im, spe)
-                            elif is_mos:
-                                res_result = obj.snr_from_source_MOS(con, im, spe)
-                            
-                            # Check again for error message
-                            if 'message' in res_result:
-                                debug_lines.append(f"  ⚠ WARNING: {res_result['message']}")
-                                if 'frac_sat' in res_result:
-                                        if is_ifs:
-                                            debug_lines.append(f"  → Fraction of saturated voxels: {res_result['frac_sat']*100:.1f}%")
-                                        elif is_mos:
-                                            debug_lines.append(f"  → Fraction of saturated pixels: {res_result['frac_sat']*100:.1f}%")
-                                has_errors = True
-                            else:
-                                computed_snr = res_result
-                                # Use SEL_CWAV as reference wavelength if Obj_SED is 'line', else Lam_Ref
-                                if config.get('Obj_SED', params.get('Obj_SED', 'template')) == 'line':
-                                    ref_wave = config.get('SEL_CWAV', params.get('SEL_CWAV', 7000))
-                                else:
-                                    ref_wave = config.get('Lam_Ref', params.get('Lam_Ref', 7000))
-                                wave_array = res_result['spec']['snr'].wave.coord()
-                                snr_array = res_result['spec']['snr'].data.data
-                                idx_closest = (np.abs(wave_array - ref_wave)).argmin()
-                                true_wave = wave_array[idx_closest]
-                                achieved_snr = snr_array[idx_closest]
-                                # Always print SNR per pixel
-                                debug_lines.append(f"  → Achieved SNR at wavelength {true_wave:.1f} Å\n (closest to requested reference wavelength {ref_wave} Å): {achieved_snr:.2f}")
-                                # Print SNR with spectral coadding if available
-                                if 'snr_rebin' in res_result['spec']:
-                                    snr_array_rebin = res_result['spec']['snr_rebin'].data.data
-                                    debug_lines.append(f"  → Achieved SNR at wavelength {true_wave:.1f} Å\n (closest to requested reference wavelength {ref_wave} Å, with spectral coadding): {snr_array_rebin[idx_closest]:.2f}")
-                    
-                    elif compute_mode == 'ndit_snr':
-                        # Compute DIT from NDIT & SNR
-                        debug_lines.append(f"  Mode: NDIT & SNR")
-                        debug_lines.append(f"  NDIT: {config['NDIT']}")
-                        debug_lines.append(f"  Target SNR: {config['SNR']}")
-                        
-                        if is_ifs:
-                            computed_time = obj.time_from_source(con, im, spe, dit=True)
-                        elif is_mos:
-                            computed_time = obj.time_from_source_MOS(con, im, spe, dit=True)
-                        
-                        # Check if result contains error message
-                        if 'message' in computed_time:
-                            debug_lines.append(f"  ⚠ WARNING: {computed_time['message']}")
-                            if 'frac_sat' in computed_time:
-                                if is_ifs:
-                                    debug_lines.append(f"  → Fraction of saturated voxels: {computed_time['frac_sat']*100:.1f}%")
-                                elif is_mos:
-                                    debug_lines.append(f"  → Fraction of saturated pixels: {computed_time['frac_sat']*100:.1f}%")
-                            has_errors = True
-                        else:
-                            debug_lines.append(f"  → Required DIT: {computed_time['dit']:.2f} s")
-                            # Add saturation info
-                            if 'frac_sat' in computed_time:
-                                if is_ifs:
-                                    debug_lines.append(f"  → Fraction of saturated voxels: {computed_time['frac_sat']*100:.1f}%")
-                                elif is_mos:
-                                    debug_lines.append(f"  → Fraction of saturated pixels: {computed_time['frac_sat']*100:.1f}%")
-                            # Update config with computed DIT
-                            config['DIT'] = computed_time['dit']
-                            con, ob, spe, im, spe_input = obj.build_obs_full(config)
-                            # Compute achieved SNR
-                            if is_ifs:
-                                res_result = obj.snr_from_source(con, im, spe)
-                            elif is_mos:
-                                res_result = obj.snr_from_source_MOS(con, im, spe)
-                            
-                            # Check again for error message
-                            if 'message' in res_result:
-                                debug_lines.append(f"  ⚠ WARNING: {res_result['message']}")
-                                if 'frac_sat' in res_result:
-                                        if is_ifs:
-                                            debug_lines.append(f"  → Fraction of saturated voxels: {res_result['frac_sat']*100:.1f}%")
-                                        elif is_mos:
-                                            debug_lines.append(f"  → Fraction of saturated pixels: {res_result['frac_sat']*100:.1f}%")
-                                has_errors = True
-                            else:
-                                computed_snr = res_result
-                                # Use SEL_CWAV as reference wavelength if Obj_SED is 'line', else Lam_Ref
-                                if config.get('Obj_SED', params.get('Obj_SED', 'template')) == 'line':
-                                    ref_wave = config.get('SEL_CWAV', params.get('SEL_CWAV', 7000))
-                                else:
-                                    ref_wave = config.get('Lam_Ref', params.get('Lam_Ref', 7000))
-                                wave_array = res_result['spec']['snr'].wave.coord()
-                                snr_array = res_result['spec']['snr'].data.data
-                                idx_closest = (np.abs(wave_array - ref_wave)).argmin()
-                                true_wave = wave_array[idx_closest]
-                                achieved_snr = snr_array[idx_closest]
-                                if 'snr_rebin' in res_result['spec']:
-                                    snr_array_rebin = res_result['spec']['snr_rebin'].data.data
-                                    debug_lines.append(f"  → Achieved SNR at wavelength {true_wave:.1f} Å\n (closest to requested reference wavelength {ref_wave} Å, with spectral coadding): {snr_array_rebin[idx_closest]:.2f}")                            
-                                debug_lines.append(f"  → Achieved SNR at wavelength {true_wave:.1f} Å\n (closest to requested reference wavelength {ref_wave} Å): {achieved_snr:.2f}")
-                    
-                    # Extract plot data only if no error
-                    if computed_snr is not None and 'spec' in computed_snr:
-                        wave = computed_snr['spec']['snr'].wave.coord()
-                        snr_data = computed_snr['spec']['snr'].data.data
-                        wave_list = wave.tolist() if hasattr(wave, 'tolist') else list(wave)
-                        snr_list = snr_data.tolist() if hasattr(snr_data, 'tolist') else list(snr_data)
-                        plot_traces.append({
-                            'x': wave_list,
-                            'y': snr_list,
-                            'name': f"{inst.upper()} {chan.upper()} (SNR x spectral pixel)",
-                            'color': COLORS.get(config_key, '#000000')
-                        })
-                        coadd_wl = config.get('COADD_WL', params.get('COADD_WL', 1))
-                        if coadd_wl > 1 and 'snr_rebin' in computed_snr['spec']:
-                            wave_rebin = computed_snr['spec']['snr_rebin'].wave.coord()
-                            snr_rebin = computed_snr['spec']['snr_rebin'].data.data
-                            wave_rebin_list = wave_rebin.tolist() if hasattr(wave_rebin, 'tolist') else list(wave_rebin)
-                            snr_rebin_list = snr_rebin.tolist() if hasattr(snr_rebin, 'tolist') else list(snr_rebin)
-                            plot_traces.append({
-                                'x': wave_rebin_list,
-                                'y': snr_rebin_list,
-                                'name': f"{inst.upper()} {chan.upper()} (SNR x spectral coadding [{coadd_wl} pixels])",
-                                'color': COLORS.get(config_key, '#000000'),
-                                'secondary': True
-                            })
-                        
-                        # Get frac_sat from the appropriate source
-                        frac_sat_val = None
-                        if 'frac_sat' in computed_snr:
-                            frac_sat_val = computed_snr['frac_sat']
-                        elif computed_time and 'frac_sat' in computed_time:
-                            frac_sat_val = computed_time['frac_sat']
-                        elif res_result and 'frac_sat' in res_result:
-                            frac_sat_val = res_result['frac_sat']
-                        
-                        # Add to summary table
-                        summary_row = {
-                            'config': f"{inst.upper()} {chan.upper()}",
-                            'dit': config['DIT'],
-                            'ndit': config['NDIT'],
-                            'snr_target': config.get('SNR', '-'),
-                            'snr_achieved': f"{snr_data[len(snr_data)//2]:.2f}",
-                            'frac_sat': f"{frac_sat_val*100:.1f}%" if frac_sat_val is not None else '-'
-                        }
-                        summary_table.append(summary_row)
-                    
-                    debug_lines.append("")
-                    
-                except Exception as e:
-                    debug_lines.append(f"  ERROR: {str(e)}")
-                    debug_lines.append(f"  Traceback: {traceback.format_exc()}")
-                    debug_lines.append("")
-                    has_errors = True
-            
-            debug_lines.append("=" * 80)
-            if has_errors:
-                debug_lines.append("Computation completed with warnings/errors (see above)")
-            else:
-                debug_lines.append("Computation completed successfully")
-            debug_lines.append("=" * 80)
-            
-            debug_output = '\n'.join(debug_lines)
-            
-            # Prepare plot data for frontend only if we have valid traces
-            if plot_traces:
-                plot_data = {
-                    'traces': plot_traces,
-                    'summary': summary_table,
-                    'compute_mode': compute_mode
-                }
-            
-        except Exception as e:
-            debug_output = f"CRITICAL ERROR: {str(e)}\n\nFull traceback:\n{traceback.format_exc()}"
+            tasks.append(etc_core.config_from_spec(spec))
+        except ValueError as e:
+            invalid.append(json.dumps({'index': index, 'ok': False, 'error': str(e)}) + '\n')
+            continue
+        task_index.append(index)
+        task_arrays.append(spec.get('arrays', arrays))
+    
+    deadline = etc_core.request_deadline()
+    
+    def generate():
+        yield from invalid
+        for i, res in etc_core.iter_results(tasks, deadline=deadline):
+            config, compute_mode = tasks[i]
+            yield _api_record(task_index[i], config, compute_mode, res, task_arrays[i])
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/sweep', methods=['POST'])
+def api_sweep():
+    """Parameter-grid sweep API.
+
+    The body is an observation spec as for ``/api/compute`` with an extra
+    ``sweep`` object mapping up to three parameters to their values, a list
+    or a ``"start:stop:num"`` range. The response holds the swept
+    ``quantity``, the ``axes``, the n-dimensional ``values`` grid (null
+    where the computation failed) and the ``saturated`` grid, true where
+    some pixels saturate.
+    """
+    spec = request.get_json(silent=True)
+    try:
+        config, compute_mode = etc_core.config_from_spec(spec)
+        pairs = spec.get('sweep')
+        if not isinstance(pairs, dict) or not pairs:
+            raise ValueError("'sweep' must map the swept parameters to their values")
+        res = sweep.run_sweep(config, compute_mode, sweep.parse_axes(pairs.items()),
+                              deadline=etc_core.request_deadline())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with metrics.timer('serialize', ins=config['INS'], ch=config['CH'], mode=compute_mode):
+        values = sweep.grid_payload(res)
+    return jsonify({
+        'INS': config['INS'],
+        'CH': config['CH'],
+        'compute_mode': compute_mode,
+        'quantity': res['quantity'],
+        'axes': res['axes'],
+        'shape': list(res['values'].shape),
+        'values': values,
+        'saturated': res['saturated'].tolist(),
+        'errors': res['errors'],
+    })
+
+@app.route('/api/curve', methods=['POST'])
+def api_curve():
+    """Exposure-time curve API.
+
+    The body is an observation spec as for ``/api/compute`` (its
+    ``compute_mode`` is ignored) with an extra ``curve`` object giving the
+    values of NDIT or DIT, a list or a ``"start:stop:num"`` range, e.g.
+    ``{"NDIT": "1:40:40"}``. The response holds the total ``exposure`` and
+    ``snr`` (null where it cannot be computed) of every value, the exposure
+    reaching the target ``SNR`` and the start of the saturation.
+    """
+    spec = request.get_json(silent=True)
+    try:
+        if isinstance(spec, dict):
+            spec = dict(spec, compute_mode='dit_ndit')
+        config, _ = etc_core.config_from_spec(spec)
+        curve = spec.get('curve')
+        if not isinstance(curve, dict) or len(curve) != 1:
+            raise ValueError("'curve' must map NDIT or DIT to its values")
+        (axis, values), = curve.items()
+        values = exposure.parse_curve(axis, values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    _, res, error = next(etc_core.map_tasks(exposure.exposure_curve, [(config, axis, values)],
+                                            deadline=etc_core.request_deadline()))
+    if error is not None:
+        return jsonify({'error': error}), 500
+    with metrics.timer('serialize', ins=config['INS'], ch=config['CH'], mode=exposure.CURVE_MODE):
+        return jsonify({
+            'INS': config['INS'],
+            'CH': config['CH'],
+            'compute_mode': exposure.CURVE_MODE,
+            'axis': axis,
+            'values': res['values'].tolist(),
+            'exposure': res['exposure'].tolist(),
+            'snr': np.where(np.isfinite(res['snr']), res['snr'], None).tolist(),
+            'saturated': res['saturated'].tolist(),
+            'ref_wave': res['ref_wave'],
+            'target_snr': res['target_snr'],
+            'target': res['target'],
+            'saturation': res['saturation'],
+            'errors': res['errors'],
+        })
+
+@app.route('/catalogue', methods=['POST'])
+def compute_catalogue():
+    """Compute an uploaded MOS target catalogue, streamed back as CSV.
+
+    The multipart form holds the ``catalogue`` file (CSV or FITS table) and
+    the fields of the page form, which the page script copies into the
+    catalogue form: the selected MOS channels, the compute mode and the
+    parameters shared by all the rows. The output has one line per
+    row and channel, written as soon as its chunk of rows is computed.
+    """
+    def error(message):
+        return Response(f"ERROR: {message}\n", status=400, mimetype='text/plain')
+    
+    upload = request.files.get('catalogue')
+    if upload is None or not upload.filename:
+        return error("No catalogue file uploaded")
+    compute_mode = request.form.get('compute_mode', 'dit_ndit')
+    if compute_mode not in etc_core.COMPUTE_MODES:
+        return error(f"Unknown compute_mode: {compute_mode}")
+    pairs = [tuple(pair.split('-', 1)) for pair in request.form.getlist('config')]
+    pairs = [(inst, chan) for inst, chan in pairs if inst in catalogue.MOS_INSTRUMENTS
+             and chan in etc_core.CHANNELS[inst]]
+    if not pairs:
+        return error("Select at least one MOS channel (MOS-LR or MOS-HR) for a catalogue")
+    params = etc_core.DEFAULT_PARAMS.copy()
+    update_params(params, request.form)
+    # The uploaded file is closed with the request, before the end of the
+    # streamed response: read it from a temporary copy on disk instead
+    upload_copy = tempfile.TemporaryFile()
+    upload.save(upload_copy)
+    upload_copy.seek(0)
+    try:
+        columns, rows = catalogue.read_catalogue(upload_copy, upload.filename)
+    except (ValueError, OSError, UnicodeDecodeError) as e:
+        upload_copy.close()
+        return error(f"Cannot read the catalogue: {e}")
+    
+    def generate():
+        try:
+            yield from catalogue.stream_catalogue(columns, rows, pairs, params, compute_mode)
+        finally:
+            upload_copy.close()
     
-    return render_template('index.html', result=result, res_time=res_time, res_snr=res_snr, params=params, debug_output=debug_output, plot_data=plot_data)
+    name = secure_filename(os.path.splitext(upload.filename)[0]) or 'catalogue'
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}_etc.csv"'
+    return response
+
+@app.route('/plot/trace/<token>')
+def plot_trace(token):
+    """Full-resolution version of a downsampled plot trace.
+
+    Raw little-endian float32: the ``n_full`` wavelengths then the
+    ``n_full`` SNR values.
+    """
+    data = transport.trace_store.get(token)
+    if data is None:
+        return '', 404
+    response = Response(data, mimetype='application/octet-stream')
+    # The token is a hash of the data, which therefore never changes
+    response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    return response
+
+@app.route('/assets/<digest>/<path:name>')
+def serve_asset(digest, name):
+    """Page assets, under URLs holding a hash of their content (see ``assets``)."""
+    asset = assets.get_asset(name)
+    if asset is None:
+        return '', 404
+    encoding = compression.choose_encoding(request.accept_encodings) if settings.COMPRESS else None
+    response = Response(asset.encoded(encoding), mimetype=asset.mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(asset.digest)
+    if digest == asset.digest:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        # Linked from a page of another version of the app
+        response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process answers, whether or not the models are loaded."""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once the WST models are loaded, 503 before or if that failed."""
+    return jsonify(backend_warmup.status()), 200 if backend_warmup.ready else 503
+
+@app.route('/stats')
+def stats():
+    return jsonify({'result_cache': etc_core.result_cache.stats(),
+                    'result_store': etc_core.result_store.stats() if etc_core.result_store else None,
+                    'condition_cache': wst_pool.condition_cache.stats(),
+                    'worker_processes': etc_core.executor_stats(),
+                    'jobs': job_queue.stats()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage timings, request latencies and computation counters for Prometheus."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/favicon.ico')
 def favicon():
     return '', 204
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001)
\ No newline at end of file
+    # Development server; see gunicorn.conf.py for production
+    app.run(debug=settings.DEBUG, host=settings.HOST, port=settings.PORT)
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""Page assets (style sheet, scripts, Plotly.js) served by the app itself.
+
+Assets are served under a URL holding a hash of their content,
+``/assets/<hash>/<name>``, so that browsers and proxies can keep them for a
+year: a new version gets a new URL. They are read once into memory, with
+their compressed variants, and read again if the file changes.
+
+The assets are the files of the ``static`` directory, and ``plotly.min.js``,
+taken from (in this order) the ``PLOTLY_JS`` setting,
+``static/vendor/plotly.min.js`` or the ``plotly`` Python package when it is
+installed. Without a local copy, the page loads Plotly.js from its CDN.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import url_for
+
+import compression
+import settings
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+PLOTLY_NAME = 'plotly.min.js'
+PLOTLY_CDN_URL = 'https://cdn.plot.ly/plotly-latest.min.js'
+
+
+def _plotly_path():
+    candidates = [settings.PLOTLY_JS, os.path.join(STATIC_DIR, 'vendor', PLOTLY_NAME)]
+    try:
+        import plotly
+        candidates.append(os.path.join(os.path.dirname(plotly.__file__), 'package_data', PLOTLY_NAME))
+    except ImportError:
+        pass
+    return next((path for path in candidates if path and os.path.isfile(path)), None)
+
+
+def asset_path(name):
+    """File of an asset, None if there is no such asset."""
+    if name == PLOTLY_NAME:
+        return _plotly_path()
+    path = os.path.normpath(os.path.join(STATIC_DIR, name))
+    if not path.startswith(STATIC_DIR + os.sep) or not os.path.isfile(path):
+        return None
+    return path
+
+
+class Asset:
+    """Content of an asset file, its hash and its compressed variants."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.digest = hashlib.sha256(self.data).hexdigest()[:16]
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding):
+        """Content compressed with ``encoding``, compressed once."""
+        if encoding is None:
+            return self.data
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = compression.compress(self.data, encoding, best=True)
+            return self._encoded[encoding]
+
+
+_assets = {}
+_lock = threading.Lock()
+
+
+def get_asset(name):
+    """The ``Asset`` of a name, None if there is no such asset."""
+    path = asset_path(name)
+    if path is None:
+        return None
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    with _lock:
+        asset = _assets.get(name)
+    if asset is None or asset.path != path or asset.mtime != mtime:
+        asset = Asset(path)
+        with _lock:
+            _assets[name] = asset
+    return asset
+
+
+def asset_url(name):
+    """Content-hashed URL of an asset, for the templates."""
+    asset = get_asset(name)
+    if asset is None:
+        raise ValueError(f"No asset named {name}")
+    return url_for('serve_asset', digest=asset.digest, name=name)
+
+
+def plotly_url():
+    """URL of Plotly.js: the local copy when there is one, else the CDN."""
+    if asset_path(PLOTLY_NAME) is None:
+        return PLOTLY_CDN_URL
+    return asset_url(PLOTLY_NAME)
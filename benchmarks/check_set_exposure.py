@@ -0,0 +1,127 @@
+"""Check that changing the exposure of a built observation matches a rebuild.
+
+The solved modes, the parameter sweeps and the exposure curves build an
+observation once with ``build_obs_full`` and run the solvers again for other
+exposures after ``etc_core.set_exposure``. This assumes that the instrument,
+sky, source spectrum and image models returned by ``build_obs_full`` do not
+depend on DIT and NDIT. For every instrument channel, this script compares
+the SNR spectra of that path with those of an observation built from scratch
+with the same DIT and NDIT (the two-pass path), for the exposure found by the
+time solver and a few fixed ones::
+
+    python benchmarks/check_set_exposure.py --backend stub
+    python benchmarks/check_set_exposure.py --backend wst --rtol 1e-6
+
+It exits with status 1 when a difference exceeds the tolerance, e.g. after
+an update of pyetc_wst that makes a model depend on the exposure.
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALL_PAIRS = ['ifs-blue', 'ifs-red', 'moslr-blue', 'moslr-green', 'moslr-red',
+             'moshr-U', 'moshr-B', 'moshr-V', 'moshr-I']
+
+# (DIT, NDIT) checked besides the solved exposures, different from the
+# exposure of the built observation
+EXPOSURES = [(1., 1), (60., 4), (3600., 2)]
+
+
+def snr_spectra(res):
+    """``{name: array}`` of the SNR spectra of a solver result, None if it failed."""
+    if 'message' in res:
+        return None
+    return {name: np.asarray(spec.data.data, dtype=float) for name, spec in res['spec'].items()
+            if name.startswith('snr')}
+
+
+def difference(a, b):
+    """Largest relative difference between two solver results (inf if only one failed)."""
+    spectra_a, spectra_b = snr_spectra(a), snr_spectra(b)
+    if spectra_a is None or spectra_b is None:
+        return 0. if spectra_a is None and spectra_b is None else float('inf')
+    worst = 0.
+    for name in set(spectra_a) | set(spectra_b):
+        if name not in spectra_a or name not in spectra_b or spectra_a[name].shape != spectra_b[name].shape:
+            return float('inf')
+        x, y = spectra_a[name], spectra_b[name]
+        scale = np.maximum(np.abs(y), np.finfo(float).tiny)
+        finite = np.isfinite(x) & np.isfinite(y)
+        if not np.array_equal(finite, np.isfinite(x) | np.isfinite(y)):
+            return float('inf')
+        if finite.any():
+            worst = max(worst, float(np.max(np.abs(x - y)[finite] / scale[finite])))
+    if a.get('frac_sat') != b.get('frac_sat'):
+        worst = max(worst, abs(float(a.get('frac_sat') or 0) - float(b.get('frac_sat') or 0)))
+    return worst
+
+
+def check(obj, etc_core, config, exposures):
+    """Relative differences of the two paths, for every ``(dit, ndit)`` of ``exposures``."""
+    inst = config['INS'].lower()
+    solver = etc_core._snr_solver(obj, inst == 'ifs', inst in ['moshr', 'moslr'])
+    con, ob, spe, im, spe_input = obj.build_obs_full(config)
+    reused = {}
+    for dit, ndit in exposures:
+        etc_core.set_exposure(obj, ob, dit, ndit)
+        reused[dit, ndit] = solver(con, im, spe)
+    out = []
+    for dit, ndit in exposures:
+        con2, ob2, spe2, im2, _ = obj.build_obs_full(dict(config, DIT=dit, NDIT=ndit))
+        out.append((dit, ndit, difference(reused[dit, ndit], solver(con2, im2, spe2))))
+    return out
+
+
+def solved_exposures(obj, etc_core, config):
+    """Exposures found by the time solver for the target SNR, as in ``compute_config``."""
+    inst = config['INS'].lower()
+    solver = etc_core._time_solver(obj, inst == 'ifs', inst in ['moshr', 'moslr'])
+    con, ob, spe, im, spe_input = obj.build_obs_full(config)
+    exposures = []
+    for solve_dit in (False, True):
+        res = solver(con, im, spe, dit=solve_dit)
+        if 'message' in res:
+            continue
+        if solve_dit:
+            exposures.append((float(res['dit']), config['NDIT']))
+        else:
+            exposures.append((config['DIT'], int(np.ceil(res['ndit']))))
+    return exposures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=['stub', 'wst'], default=None,
+                        help="ETC backend (default: PYETC_WEB_BACKEND, else wst)")
+    parser.add_argument('--rtol', type=float, default=1e-6, help="tolerated relative difference")
+    parser.add_argument('--pairs', nargs='+', default=ALL_PAIRS, help="instrument channels to check")
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        os.environ['PYETC_WEB_BACKEND'] = args.backend
+    sys.path.insert(0, ROOT)
+    import etc_core
+    import wst_pool
+
+    obj = wst_pool.load_wst()
+    failed = 0
+    for pair in args.pairs:
+        inst, chan = pair.split('-', 1)
+        config = etc_core.make_config(inst, chan, dict(etc_core.DEFAULT_PARAMS))
+        exposures = solved_exposures(obj, etc_core, config) + EXPOSURES
+        for dit, ndit, diff in check(obj, etc_core, config, exposures):
+            ok = diff <= args.rtol
+            failed += not ok
+            print(f"  {pair:<12} DIT {dit:>10.4g} s  NDIT {ndit:>4}  max relative difference {diff:.3g}"
+                  f"{'' if ok else '  MISMATCH'}")
+    if failed:
+        sys.exit(f"{failed} exposures differ by more than {args.rtol:g} from a rebuilt observation")
+    print("Reusing a built observation matches rebuilding it for every exposure")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Benchmarks of the WST ETC web app, through its WSGI interface.
+
+Measures the latency of a single-channel computation in every compute mode,
+the scaling with the number of selected channels, the size of the page and
+API payloads and the throughput under concurrent requests, and writes the
+results as JSON so that runs can be compared::
+
+    python benchmarks/run_benchmarks.py --backend stub
+    python benchmarks/run_benchmarks.py --backend wst --compare benchmarks/results/previous.json
+
+The app settings (execution mode, pool size, stub costs...) are read from
+the usual ``PYETC_WEB_*`` environment variables.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALL_PAIRS = ['ifs-blue', 'ifs-red', 'moslr-blue', 'moslr-green', 'moslr-red',
+             'moshr-U', 'moshr-B', 'moshr-V', 'moshr-I']
+
+
+def summarize(samples):
+    """Latency statistics of a list of durations, in seconds."""
+    samples = sorted(samples)
+    return {
+        'n': len(samples),
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'p90': samples[min(len(samples) - 1, int(round(0.9 * (len(samples) - 1))))],
+        'mean': statistics.fmean(samples),
+        'max': samples[-1],
+    }
+
+
+class Bench:
+    """Runs the benchmarks on an imported app module."""
+
+    def __init__(self, app_module, repeat):
+        self.app = app_module
+        self.client = app_module.app.test_client()
+        self.repeat = repeat
+        self._mag = 0
+
+    def form(self, pairs, mode, **params):
+        # Every request gets its own source magnitude so that it misses the
+        # result cache, while the sky/throughput cache stays warm
+        self._mag += 1
+        data = {'config': pairs, 'compute_mode': mode, 'OBJ_MAG': f"{20 + self._mag * 1e-6:.6f}",
+                'COADD_WL': '2'}
+        data.update(params)
+        return data
+
+    def post(self, data, client=None):
+        start = time.perf_counter()
+        response = (client or self.client).post('/', data=data)
+        body = response.get_data()
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"POST / returned {response.status_code}")
+        return elapsed, len(body)
+
+    def latency(self):
+        results = {}
+        for mode in self.app.etc_core.COMPUTE_MODES:
+            self.post(self.form(['ifs-blue'], mode))
+            samples = [self.post(self.form(['ifs-blue'], mode))[0] for _ in range(self.repeat)]
+            cached = self.form(['ifs-blue'], mode)
+            self.post(cached)
+            results[mode] = dict(summarize(samples),
+                                 cached=summarize([self.post(cached)[0] for _ in range(self.repeat)]))
+        return results
+
+    def scaling(self):
+        results = {}
+        for n in (1, 3, 6, 9):
+            samples = [self.post(self.form(ALL_PAIRS[:n], 'dit_ndit'))[0] for _ in range(self.repeat)]
+            results[str(n)] = summarize(samples)
+        return results
+
+    def payload(self):
+        results = {}
+        for n in (1, 9):
+            results[f'page_{n}_channels_bytes'] = self.post(self.form(ALL_PAIRS[:n], 'dit_ndit'))[1]
+        specs = [{'INS': p.split('-')[0], 'CH': p.split('-')[1], 'params': {'COADD_WL': 2, 'OBJ_MAG': 20}} for p in ALL_PAIRS]
+        for arrays in (False, True, 'f32'):
+            response = self.client.post('/api/compute', json={'specs': specs, 'arrays': arrays})
+            results[f'api_9_specs_arrays_{str(arrays).lower()}_bytes'] = len(response.get_data())
+        return results
+
+    def throughput(self, concurrencies):
+        results = {}
+        for concurrency in concurrencies:
+            n_requests = max(2 * concurrency, self.repeat)
+            forms = [self.form(['ifs-blue', 'moslr-red'], 'dit_snr') for _ in range(n_requests)]
+            latencies = []
+            errors = []
+            lock = threading.Lock()
+
+            def worker(chunk):
+                client = self.app.app.test_client()
+                for data in chunk:
+                    try:
+                        elapsed, _ = self.post(data, client)
+                    except Exception as e:
+                        with lock:
+                            errors.append(str(e))
+                    else:
+                        with lock:
+                            latencies.append(elapsed)
+
+            threads = [threading.Thread(target=worker, args=(forms[i::concurrency],))
+                       for i in range(concurrency)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - start
+            results[str(concurrency)] = {
+                'requests': n_requests,
+                'errors': len(errors),
+                'wall_seconds': wall,
+                'requests_per_second': len(latencies) / wall,
+                'latency': summarize(latencies) if latencies else None,
+            }
+        return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """``{"a.b.median": value}`` for the comparable numbers of a result tree."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and (key in ('median', 'requests_per_second')
+                                                  or key.endswith('_bytes')):
+            flat[name] = value
+    return flat
+
+
+def compare(current, previous):
+    old = flatten(previous['results'])
+    new = flatten(current['results'])
+    print(f"\nComparison with {previous['meta'].get('commit') or 'previous run'}:")
+    for name in sorted(set(old) & set(new)):
+        ratio = new[name] / old[name] if old[name] else float('nan')
+        print(f"  {name:<55} {old[name]:>12.4g} -> {new[name]:>12.4g}  ({ratio:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--backend', choices=['stub', 'wst'], default=None,
+                        help="ETC backend (default: PYETC_WEB_BACKEND, else wst)")
+    parser.add_argument('--repeat', type=int, default=10, help="samples per measurement")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="numbers of concurrent clients for the throughput benchmark")
+    parser.add_argument('--out', help="result file (default: benchmarks/results/<backend>-<time>.json)")
+    parser.add_argument('--compare', help="previous result file to compare with")
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        os.environ['PYETC_WEB_BACKEND'] = args.backend
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import app as app_module
+    startup = time.perf_counter() - start
+    if not app_module.backend_warmup.wait():
+        sys.exit(f"The backend failed to load: {app_module.backend_warmup.error}")
+    warm = time.perf_counter() - start
+    settings = app_module.settings
+
+    bench = Bench(app_module, args.repeat)
+    results = {'startup_seconds': startup, 'ready_seconds': warm}
+    for name, run in [('latency', bench.latency), ('scaling', bench.scaling), ('payload', bench.payload),
+                      ('throughput', lambda: bench.throughput(args.concurrency))]:
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = run()
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    report = {
+        'meta': {
+            'time': now.isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'settings': {k: getattr(settings, k) for k in dir(settings)
+                         if k.isupper() and isinstance(getattr(settings, k), (str, int, float, bool, type(None)))},
+        },
+        'results': results,
+    }
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results',
+                                   f"{settings.BACKEND}-{now.strftime('%Y%m%dT%H%M%SZ')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, value in sorted(flatten(results).items()):
+        print(f"  {name:<55} {value:>12.4g}")
+    print(f"Results written to {out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""Exposure times or SNRs for whole MOS target catalogues.
+
+A catalogue is a CSV or FITS table with one target per row. Columns named
+after ETC parameters (``OBJ_MAG``, ``Z``, ``SED_Name``...) override the
+parameters set on the page for that row, the others are copied to the
+output to identify the targets. The rows go through a pipeline of
+generators: read, grouped in chunks, computed (one chunk per task, spread
+over the worker processes in ``process`` execution) and written back as CSV
+text, so that only a few chunks are in memory at any time whatever the size
+of the catalogue. Within a task the rows are sorted by channel and run on
+the same WST instance, whose condition cache then computes the sky and
+throughput models of each channel once for all the rows. A task has the time
+budget of all its computations; the rows of a task that fails (over budget,
+or its worker process died) are computed again one per task, so that a
+single runaway row does not fail the rows around it.
+"""
+import csv
+import io
+import itertools
+
+import numpy as np
+
+import etc_core
+import metrics
+import settings
+
+MOS_INSTRUMENTS = ['moslr', 'moshr']
+
+# Result columns of the output, after the copied catalogue columns
+RESULT_COLUMNS = ['INS', 'CH', 'ok', 'dit', 'ndit', 'snr_ref', 'snr_rebin_ref',
+                  'required_dit', 'required_ndit', 'frac_sat', 'message']
+
+_PARAM_NAMES = {k.lower(): k for k in etc_core.ALL_PARAM_KEYS}
+
+
+def _python_value(v):
+    if isinstance(v, bytes):
+        v = v.decode('utf-8', 'replace')
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, str):
+        v = v.strip()
+    return v
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    columns = reader.fieldnames
+    if not columns:
+        raise ValueError("The catalogue is empty")
+    return list(columns), reader
+
+
+def _fits_rows(stream):
+    try:
+        from astropy.io import fits
+    except ImportError:
+        raise ValueError("Reading FITS catalogues needs astropy, please upload a CSV file") from None
+    hdul = fits.open(stream)
+    table = next((hdu for hdu in hdul if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU))), None)
+    if table is None:
+        hdul.close()
+        raise ValueError("No table found in the FITS file")
+    columns = list(table.columns.names)
+
+    def rows():
+        try:
+            for record in table.data:
+                yield {name: _python_value(record[name]) for name in columns}
+        finally:
+            hdul.close()
+    return columns, rows()
+
+
+def read_catalogue(stream, filename):
+    """Open an uploaded catalogue.
+
+    Returns ``(columns, rows)``, ``rows`` being an iterator of dicts.
+    FITS files (``.fits``, ``.fit``, ``.fits.gz``) need astropy; any other
+    file is read as CSV with a header line.
+    """
+    name = (filename or '').lower()
+    if name.endswith(('.fits', '.fit', '.fts', '.fits.gz')):
+        return _fits_rows(stream)
+    return _csv_rows(stream)
+
+
+def row_params(row):
+    """ETC parameters set by a catalogue row; empty cells are ignored."""
+    params = {}
+    for column, value in row.items():
+        key = _PARAM_NAMES.get(str(column).strip().lower())
+        if key is None or value is None or value == '':
+            continue
+        params[key] = etc_core.parse_value(value) if isinstance(value, str) else _python_value(value)
+    return params
+
+
+def compute_rows(obj, configs, compute_mode):
+    """Run ``compute_config`` for the configurations of a chunk of rows.
+
+    Only the scalars, error flag and timings are returned, not the spectra.
+    """
+    out = []
+    for config in configs:
+        res = etc_core.compute_config(obj, config, compute_mode)
+        scalars = dict(res['scalars'])
+        if res['has_errors'] and 'message' not in scalars:
+            scalars['message'] = next((line.strip() for line in res['lines'] if 'ERROR' in line), 'Error')
+        out.append({'scalars': scalars, 'has_errors': res['has_errors'], 'timings': res['timings']})
+    return out
+
+
+def _compute_one_by_one(configs, compute_mode, execution):
+    # compute_rows for every configuration alone, within the time budget of
+    # one computation each
+    results = [None] * len(configs)
+    tasks = [([config], compute_mode) for config in configs]
+    for i, res, error in etc_core.map_tasks(compute_rows, tasks, execution):
+        results[i] = res[0] if error is None else {'scalars': {'message': error}, 'has_errors': True, 'timings': {}}
+    return results
+
+
+def _chunks(rows, size, max_rows):
+    rows = iter(rows)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        if start + len(chunk) > max_rows:
+            raise ValueError(f"The catalogue has more than {max_rows} rows")
+        yield start, chunk
+        start += len(chunk)
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return '' if value is None else value
+
+
+def stream_catalogue(columns, rows, pairs, params, compute_mode, execution=None):
+    """Compute a catalogue and yield the output CSV text, chunk by chunk.
+
+    Parameters
+    ----------
+    columns : list of str
+        Columns of the catalogue, copied to the output.
+    rows : iterable of dict
+        Catalogue rows.
+    pairs : list of (str, str)
+        MOS instrument-channel pairs computed for every row.
+    params : dict
+        Parameters shared by all the rows.
+    compute_mode : str
+        One of ``etc_core.COMPUTE_MODES``.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['row'] + list(columns) + RESULT_COLUMNS)
+    yield buffer.getvalue()
+
+    chunks = _chunks(rows, settings.CATALOGUE_CHUNK_ROWS, settings.CATALOGUE_MAX_ROWS)
+    pending = []
+
+    def tasks():
+        for start, chunk in chunks:
+            # Channel-major order: consecutive rows share the channel models
+            configs = [etc_core.make_config(inst, chan, dict(params, **row_params(row)))
+                       for inst, chan in pairs for row in chunk]
+            pending.append((start, chunk, configs))
+            yield configs, compute_mode
+
+    try:
+        # The time budget of a task covers all its computations
+        timeout = settings.CHANNEL_TIMEOUT * settings.CATALOGUE_CHUNK_ROWS * len(pairs)
+        for _, results, error in etc_core.imap_tasks(compute_rows, tasks(), execution, timeout=timeout):
+            start, chunk, configs = pending.pop(0)
+            if error is not None:
+                results = _compute_one_by_one(configs, compute_mode, execution)
+            buffer.seek(0)
+            buffer.truncate()
+            for k, row in enumerate(chunk):
+                for c, (inst, chan) in enumerate(pairs):
+                    res = results[c * len(chunk) + k]
+                    metrics.record_result(configs[c * len(chunk) + k], compute_mode, res)
+                    scalars = res['scalars']
+                    writer.writerow([start + k] + [_format(row.get(col)) for col in columns]
+                                    + [inst, chan, not res['has_errors']]
+                                    + [_format(scalars.get(col)) for col in RESULT_COLUMNS[3:]])
+            yield buffer.getvalue()
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        # The response has started: report the problem in the file itself
+        yield f"# ERROR: {e}\n"
@@ -0,0 +1,102 @@
+"""Compression of the text responses (HTML, JSON, NDJSON, CSV, scripts).
+
+Responses are compressed with brotli when the client accepts it and the
+optional ``brotli`` module is installed, with gzip otherwise. Streamed
+responses (``/api/compute`` NDJSON, catalogue CSV) are compressed on the fly
+and flushed after every chunk, so that the client still receives each record
+as soon as it is computed; Server-Sent Events are never compressed, since
+browsers expect the event stream as it is written.
+"""
+import zlib
+
+import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Preferred first
+ENCODINGS = (['br'] if brotli is not None else []) + ['gzip']
+
+# Compression levels of the responses, compressed for each request, and of
+# the assets, compressed once
+GZIP_LEVEL = 6
+GZIP_BEST_LEVEL = 9
+BROTLI_QUALITY = 5
+BROTLI_BEST_QUALITY = 11
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'application/javascript',
+                      'application/xml', 'image/svg+xml'}
+UNCOMPRESSED_TYPES = {'text/event-stream'}
+
+
+def compressible(mimetype):
+    if mimetype in UNCOMPRESSED_TYPES:
+        return False
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def choose_encoding(accept_encodings):
+    """Preferred encoding accepted by the client (werkzeug ``Accept``), or None."""
+    best = accept_encodings.best_match(ENCODINGS)
+    return best if best in ENCODINGS else None
+
+
+def compress(data, encoding, best=False):
+    """``data`` compressed with ``encoding``: ``'br'`` or ``'gzip'``."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_BEST_QUALITY if best else BROTLI_QUALITY)
+    compressor = zlib.compressobj(GZIP_BEST_LEVEL if best else GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+        def process(data):
+            return compressor.process(data) + compressor.flush()
+
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        def process(data):
+            return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        finish = compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield process(chunk)
+        yield finish()
+    finally:
+        # Runs the clean-up of the wrapped generator (e.g. temporary files)
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, request):
+    """Compress a Flask response in place if worthwhile; return it."""
+    if (not settings.COMPRESS or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or not compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < settings.COMPRESS_MIN_BYTES:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
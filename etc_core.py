@@ -0,0 +1,791 @@
+"""Computation core of the WST ETC web app.
+
+``compute_config`` runs the ETC for a single instrument-channel configuration
+and ``run_configs`` evaluates a list of them, either one after the other with
+a WST instance from the shared pool or in parallel in a pool of worker
+processes, each holding its own warm WST instance. Results are memoized in
+``result_cache`` so that resubmitted configurations skip the WST entirely,
+and optionally in the persistent ``result_store`` shared by all the
+processes. Computations have a time budget, per channel and per request:
+in process execution the worker running a computation over budget is
+killed and replaced, and the computation reported as timed out.
+"""
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import CancelledError, as_completed
+
+import numpy as np
+
+import metrics
+import settings
+import wst_pool
+from result_cache import LRUCache, canonical_key
+from result_store import ResultStore, store_key
+from worker_pool import TaskTimeout, WorkerPool
+
+# All possible instruments and channels
+INSTRUMENTS = ['ifs', 'moshr', 'moslr']
+CHANNELS = {
+    'ifs': ['blue', 'red'],
+    'moslr': ['blue', 'green', 'red'],
+    'moshr': ['U', 'B', 'V', 'I']
+}
+
+# Color mapping for plots (matching HTML colors)
+COLORS = {
+    'ifs-red': '#c62828',
+    'ifs-blue': '#1565c0',
+    'moshr-U': '#6a1b9a',
+    'moshr-B': '#01579b',
+    'moshr-V': '#2e7d32',
+    'moshr-I': '#d84315',
+    'moslr-blue': '#0d47a1',
+    'moslr-green': '#388e3c',
+    'moslr-red': '#b71c1c'
+}
+
+# All parameter keys (excluding INS/CHAN)
+ALL_PARAM_KEYS = [
+    "NDIT", "DIT", "SNR", "Lam_Ref", "OBJ_FIB_DISP", "MOON", "PWV", "FLI", "SEE", "AM", "SKYCALC",
+    "Obj_SED", "SED_Name", "OBJ_MAG", "MAG_SYS", "MAG_FIL", "Z", "BB_Temp", "PL_Index",
+    "SEL_FLUX", "SEL_CWAV", "SEL_FWHM",
+    "Obj_Spat_Dis", "IMA", "Ext_Ell", "IMA_FWHM", "IMA_BETA", "IMA_KFWHM", "Sersic_Reff", "Sersic_Ind", "IMA_KREFF",
+    "SPEC_RANGE", "SPEC_KFWHM", "SPEC_HSIZE", "COADD_WL", "IMA_RANGE", "COADD_XY", "OPT_SPEC", "OPT_IMA", "FRAC_SPEC_MEAN_OPT_IMAGE"
+]
+
+# Default values for all parameters
+DEFAULT_PARAMS = {
+    "NDIT": 1,
+    "DIT": 600,
+    "SNR": 10,
+    "Lam_Ref": 5000,
+    "OBJ_FIB_DISP": 0,
+    "MOON": None,
+    "PWV": 10,
+    "FLI": 0,
+    "SEE": 0.8,
+    "AM": 1.,
+    "SKYCALC": True,
+    "Obj_SED": 'template',
+    "SED_Name": 'Kinney_s0',
+    "OBJ_MAG": 12,
+    "MAG_SYS": 'Vega',
+    "MAG_FIL": 'V',
+    "Z": 0,
+    "BB_Temp": 9000.,
+    "PL_Index": -2,
+    "SEL_FLUX": 50e-16,
+    "SEL_CWAV": 5000,
+    "SEL_FWHM": 20,
+    "Obj_Spat_Dis": 'ps',
+    "IMA": 'sersic',
+    "Ext_Ell": None,
+    "IMA_FWHM": None,
+    "IMA_BETA": None,
+    "IMA_KFWHM": None,
+    "Sersic_Reff": 3.0,
+    "Sersic_Ind": 1.0,
+    "IMA_KREFF": 5,
+    "SPEC_RANGE": 'fixed',
+    "SPEC_KFWHM": None,
+    "SPEC_HSIZE": 999999,
+    "COADD_WL": 1,
+    "IMA_RANGE": 'square_fixed',
+    "COADD_XY": 1,
+    "OPT_SPEC": False,
+    "OPT_IMA": False,
+    "FRAC_SPEC_MEAN_OPT_IMAGE": 1
+}
+
+COMPUTE_MODES = ['dit_ndit', 'dit_snr', 'ndit_snr']
+
+# Results of compute_config, keyed by result_key
+result_cache = LRUCache(settings.RESULT_CACHE_MAX_MB * 2**20)
+
+# Results on disk, keyed by persistent_key (None when disabled)
+result_store = (ResultStore(settings.RESULT_STORE_PATH, settings.RESULT_STORE_MAX_MB * 2**20)
+                if settings.RESULT_STORE_PATH else None)
+
+
+def parse_value(v):
+    """Convert a parameter value submitted as text to its Python type."""
+    if v == 'True':
+        return True
+    elif v == 'False':
+        return False
+    elif v.replace('.', '', 1).replace('-', '', 1).replace('e', '', 1).replace('E', '', 1).replace('+', '', 1).isdigit():
+        try:
+            # Check if it's a float or int
+            if '.' in v or 'e' in v.lower():
+                return float(v)
+            else:
+                return int(v)
+        except ValueError:
+            return v
+    return v
+
+
+def make_config(inst, chan, params):
+    """Build the full parameter dictionary of an instrument-channel pair.
+
+    Parameters missing from ``params`` take their default value.
+    """
+    config = DEFAULT_PARAMS.copy()
+    config.update((k, params[k]) for k in ALL_PARAM_KEYS if k in params)
+    config['INS'] = inst
+    config['CH'] = chan
+    return config
+
+
+def config_from_spec(spec):
+    """Validate an API observation spec and build its configuration.
+
+    A spec is a dict ``{"INS": ..., "CH": ..., "compute_mode": ...,
+    "params": {...}}``; parameters given as text are converted like the form
+    values. Returns ``(config, compute_mode)`` or raises ``ValueError``.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("Observation spec must be a JSON object")
+    inst = spec.get('INS')
+    chan = spec.get('CH')
+    if inst not in CHANNELS or chan not in CHANNELS[inst]:
+        raise ValueError(f"Unknown instrument-channel pair: {inst}-{chan}")
+    compute_mode = spec.get('compute_mode', 'dit_ndit')
+    if compute_mode not in COMPUTE_MODES:
+        raise ValueError(f"Unknown compute_mode: {compute_mode}")
+    params = spec.get('params', {})
+    if not isinstance(params, dict):
+        raise ValueError("'params' must be a JSON object")
+    unknown = sorted(set(params) - set(ALL_PARAM_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(unknown)}")
+    params = {k: parse_value(v) if isinstance(v, str) else v for k, v in params.items()}
+    return make_config(inst, chan, params), compute_mode
+
+
+def reference_wave(config, compute_mode, wave_array=None):
+    """Wavelength at which the achieved SNR is reported.
+
+    SEL_CWAV for an emission line, else the central wavelength of the
+    channel in ``dit_ndit`` mode and Lam_Ref in the time-solving modes.
+    """
+    if config.get('Obj_SED', 'template') == 'line':
+        return config.get('SEL_CWAV', 7000)
+    if compute_mode == 'dit_ndit':
+        return 0.5 * (wave_array[-1] + wave_array[0])
+    return config.get('Lam_Ref', 7000)
+
+
+def set_exposure(obj, ob, dit, ndit):
+    """Change the exposure of an observation returned by ``build_obs_full``.
+
+    The instrument, sky, source spectrum and image models do not depend on
+    DIT and NDIT, which only enter the SNR and time solvers through the
+    observation: after this call the solvers can be run again on the same
+    models without rebuilding the observation. This is an assumption on
+    ``build_obs_full``, checked against rebuilt observations by
+    ``benchmarks/check_set_exposure.py``.
+    """
+    ob['dit'] = dit
+    ob['ndit'] = ndit
+    obj.set_obs(ob)
+
+
+def reference_probe(obj, config, compute_mode):
+    """Build the observation once and return a probe of its reference pixel.
+
+    Returns a function ``probe(dit, ndit)`` running the SNR solver for any
+    exposure, by default the one of ``config``, without rebuilding the
+    observation. The probe returns a dict with the ``snr`` at the reference
+    wavelength (None if the solver failed, ``message`` then holding its
+    warning), the ``ref_wave`` and the ``frac_sat`` of the exposure (None if
+    unknown).
+    """
+    inst = config['INS'].lower()
+    solver = _snr_solver(obj, inst == 'ifs', inst in ['moshr', 'moslr'])
+    con, ob, spe, im, spe_input = obj.build_obs_full(config)
+
+    def probe(dit=config['DIT'], ndit=config['NDIT']):
+        set_exposure(obj, ob, dit, ndit)
+        res = solver(con, im, spe)
+        frac_sat = float(res['frac_sat']) if 'frac_sat' in res else None
+        if 'message' in res:
+            return {'snr': None, 'ref_wave': None, 'frac_sat': frac_sat, 'message': str(res['message'])}
+        wave_array = res['spec']['snr'].wave.coord()
+        ref_wave = reference_wave(config, compute_mode, wave_array)
+        idx_closest = (np.abs(wave_array - ref_wave)).argmin()
+        return {'snr': float(res['spec']['snr'].data.data[idx_closest]),
+                'ref_wave': float(wave_array[idx_closest]), 'frac_sat': frac_sat}
+    return probe
+
+
+def reference_snr(obj, config, compute_mode):
+    """Build the observation once and return its SNR at the reference wavelength.
+
+    Returns a function ``snr(dit, ndit)`` giving that SNR for any exposure,
+    by default the one of ``config``, without rebuilding the observation.
+    Several of these functions can be used in turn on the same WST instance.
+    The function raises ``ValueError`` with the backend message if the SNR
+    cannot be computed (e.g. saturation).
+    """
+    probe = reference_probe(obj, config, compute_mode)
+
+    def snr(dit=config['DIT'], ndit=config['NDIT']):
+        res = probe(dit, ndit)
+        if res['snr'] is None:
+            raise ValueError(res['message'])
+        return res['snr']
+    return snr
+
+
+def _frac_sat_line(res, is_ifs, is_mos):
+    if 'frac_sat' not in res:
+        return None
+    if is_ifs:
+        return f"  → Fraction of saturated voxels: {res['frac_sat']*100:.1f}%"
+    elif is_mos:
+        return f"  → Fraction of saturated pixels: {res['frac_sat']*100:.1f}%"
+    return None
+
+
+def _error_frac_sat(scalars, res):
+    # Saturation is the usual reason for a solver warning: keep its extent
+    if 'frac_sat' in res:
+        scalars['frac_sat'] = float(res['frac_sat'])
+
+
+def _snr_solver(obj, is_ifs, is_mos):
+    if is_ifs:
+        return obj.snr_from_source
+    elif is_mos:
+        return obj.snr_from_source_MOS
+    return None
+
+
+def _time_solver(obj, is_ifs, is_mos):
+    if is_ifs:
+        return obj.time_from_source
+    elif is_mos:
+        return obj.time_from_source_MOS
+    return None
+
+
+def compute_config(obj, config, compute_mode):
+    """Run the ETC for one instrument-channel configuration.
+
+    Parameters
+    ----------
+    obj : WST
+        Instrument model, used by this call only.
+    config : dict
+        Full parameter dictionary, including ``INS`` and ``CH``.
+    compute_mode : str
+        One of ``dit_ndit``, ``dit_snr`` or ``ndit_snr``.
+
+    Returns
+    -------
+    dict
+        ``lines``: debug lines, ``traces``: plot traces with the wavelength
+        and SNR numpy arrays, ``summary``: summary table row (None if the
+        computation failed), ``scalars``: numeric results (exposure, SNR at
+        the reference wavelength, saturation, warning message),
+        ``has_errors`` and ``timings``: seconds spent in each stage.
+    """
+    lines = []
+    traces = []
+    summary_row = None
+    scalars = {}
+    timings = {}
+    has_errors = False
+    # The solved DIT/NDIT are written back into the config
+    config = dict(config)
+    try:
+        inst = config['INS']
+        chan = config['CH']
+        config_key = f"{inst}-{chan}"
+
+        # Assign is_ifs and is_mos before using them
+        is_ifs = inst.lower() == 'ifs'
+        is_mos = inst.lower() in ['moshr', 'moslr']
+        # Show number of spaxels for IFS
+        if is_ifs:
+            n_spaxels = config.get('COADD_XY', 1)
+            lines.append(f"  Number of spaxels (spatial coadding): {n_spaxels}x{n_spaxels}")
+
+        # Build observation
+        with metrics.timed(timings, 'build_obs'):
+            con, ob, spe, im, spe_input = obj.build_obs_full(config)
+        snr_solver = _snr_solver(obj, is_ifs, is_mos)
+        time_solver = _time_solver(obj, is_ifs, is_mos)
+
+        # Store results
+        res_result = None
+        computed_snr = None
+        computed_time = None
+
+        if compute_mode == 'dit_ndit':
+            # Compute SNR from DIT & NDIT
+            lines.append(f"  Mode: DIT & NDIT")
+            lines.append(f"  DIT: {config['DIT']} s")
+            lines.append(f"  NDIT: {config['NDIT']}")
+
+            with metrics.timed(timings, 'snr_solver'):
+                res_result = snr_solver(con, im, spe)
+
+            # Check if result contains error message
+            if 'message' in res_result:
+                lines.append(f"  ⚠ WARNING: {res_result['message']}")
+                scalars['message'] = str(res_result['message'])
+                _error_frac_sat(scalars, res_result)
+                sat_line = _frac_sat_line(res_result, is_ifs, is_mos)
+                if sat_line:
+                    lines.append(sat_line)
+                has_errors = True
+            else:
+                computed_snr = res_result
+                wave_array = res_result['spec']['snr'].wave.coord()
+                snr_array = res_result['spec']['snr'].data.data
+                ref_wave = reference_wave(config, compute_mode, wave_array)
+                idx_closest = (np.abs(wave_array - ref_wave)).argmin()
+                true_wave = wave_array[idx_closest]
+                achieved_snr = snr_array[idx_closest]
+                scalars.update(ref_wave=float(true_wave), snr_ref=float(achieved_snr))
+                # Always print SNR per pixel
+                lines.append(f"  → Achieved SNR at central wavelength {true_wave:.1f} Å: {achieved_snr:.2f}")
+                # Print SNR with spectral coadding if available
+                if 'snr_rebin' in res_result['spec']:
+                    snr_array_rebin = res_result['spec']['snr_rebin'].data.data
+                    lines.append(f"  → Achieved SNR at central wavelength {true_wave:.1f} Å (with spectral coadding): {snr_array_rebin[idx_closest]:.2f}")
+                    scalars['snr_rebin_ref'] = float(snr_array_rebin[idx_closest])
+                # Add saturation info
+                sat_line = _frac_sat_line(res_result, is_ifs, is_mos)
+                if sat_line:
+                    lines.append(sat_line)
+
+        elif compute_mode in ('dit_snr', 'ndit_snr'):
+            # Solve for NDIT (dit_snr) or DIT (ndit_snr) at the target SNR
+            solve_dit = compute_mode == 'ndit_snr'
+            if solve_dit:
+                lines.append(f"  Mode: NDIT & SNR")
+                lines.append(f"  NDIT: {config['NDIT']}")
+            else:
+                lines.append(f"  Mode: DIT & SNR")
+                lines.append(f"  DIT: {config['DIT']} s")
+            lines.append(f"  Target SNR: {config['SNR']}")
+
+            with metrics.timed(timings, 'time_solver'):
+                computed_time = time_solver(con, im, spe, dit=solve_dit)
+
+            # Check if result contains error message
+            if 'message' in computed_time:
+                lines.append(f"  ⚠ WARNING: {computed_time['message']}")
+                scalars['message'] = str(computed_time['message'])
+                _error_frac_sat(scalars, computed_time)
+                sat_line = _frac_sat_line(computed_time, is_ifs, is_mos)
+                if sat_line:
+                    lines.append(sat_line)
+                has_errors = True
+            else:
+                if solve_dit:
+                    lines.append(f"  → Required DIT: {computed_time['dit']:.2f} s")
+                    scalars['required_dit'] = float(computed_time['dit'])
+                else:
+                    lines.append(f"  → Required NDIT: {computed_time['ndit']:.2f}")
+                    scalars['required_ndit'] = float(computed_time['ndit'])
+                # Add saturation info
+                sat_line = _frac_sat_line(computed_time, is_ifs, is_mos)
+                if sat_line:
+                    lines.append(sat_line)
+                # Update config with computed DIT or NDIT
+                if solve_dit:
+                    config['DIT'] = computed_time['dit']
+                else:
+                    config['NDIT'] = int(np.ceil(computed_time['ndit']))
+                # Compute achieved SNR, reusing the observation already built
+                set_exposure(obj, ob, config['DIT'], config['NDIT'])
+                with metrics.timed(timings, 'snr_solver'):
+                    res_result = snr_solver(con, im, spe)
+
+                # Check again for error message
+                if 'message' in res_result:
+                    lines.append(f"  ⚠ WARNING: {res_result['message']}")
+                    scalars['message'] = str(res_result['message'])
+                    _error_frac_sat(scalars, res_result)
+                    sat_line = _frac_sat_line(res_result, is_ifs, is_mos)
+                    if sat_line:
+                        lines.append(sat_line)
+                    has_errors = True
+                else:
+                    computed_snr = res_result
+                    ref_wave = reference_wave(config, compute_mode)
+                    wave_array = res_result['spec']['snr'].wave.coord()
+                    snr_array = res_result['spec']['snr'].data.data
+                    idx_closest = (np.abs(wave_array - ref_wave)).argmin()
+                    true_wave = wave_array[idx_closest]
+                    achieved_snr = snr_array[idx_closest]
+                    scalars.update(ref_wave=float(true_wave), snr_ref=float(achieved_snr))
+                    snr_line = f"  → Achieved SNR at wavelength {true_wave:.1f} Å\n (closest to requested reference wavelength {ref_wave} Å): {achieved_snr:.2f}"
+                    # Print SNR per pixel first in dit_snr mode, after the spectral coadding one in ndit_snr mode
+                    if not solve_dit:
+                        lines.append(snr_line)
+                    # Print SNR with spectral coadding if available
+                    if 'snr_rebin' in res_result['spec']:
+                        snr_array_rebin = res_result['spec']['snr_rebin'].data.data
+                        lines.append(f"  → Achieved SNR at wavelength {true_wave:.1f} Å\n (closest to requested reference wavelength {ref_wave} Å, with spectral coadding): {snr_array_rebin[idx_closest]:.2f}")
+                        scalars['snr_rebin_ref'] = float(snr_array_rebin[idx_closest])
+                    if solve_dit:
+                        lines.append(snr_line)
+
+        # Extract plot data only if no error
+        if computed_snr is not None and 'spec' in computed_snr:
+            wave = np.asarray(computed_snr['spec']['snr'].wave.coord())
+            snr_data = np.asarray(computed_snr['spec']['snr'].data.data)
+            traces.append({
+                'x': wave,
+                'y': snr_data,
+                'name': f"{inst.upper()} {chan.upper()} (SNR x spectral pixel)",
+                'color': COLORS.get(config_key, '#000000')
+            })
+            coadd_wl = config.get('COADD_WL', 1)
+            if coadd_wl > 1 and 'snr_rebin' in computed_snr['spec']:
+                wave_rebin = np.asarray(computed_snr['spec']['snr_rebin'].wave.coord())
+                snr_rebin = np.asarray(computed_snr['spec']['snr_rebin'].data.data)
+                traces.append({
+                    'x': wave_rebin,
+                    'y': snr_rebin,
+                    'name': f"{inst.upper()} {chan.upper()} (SNR x spectral coadding [{coadd_wl} pixels])",
+                    'color': COLORS.get(config_key, '#000000'),
+                    'secondary': True
+                })
+
+            # Get frac_sat from the appropriate source
+            frac_sat_val = None
+            if 'frac_sat' in computed_snr:
+                frac_sat_val = computed_snr['frac_sat']
+            elif computed_time and 'frac_sat' in computed_time:
+                frac_sat_val = computed_time['frac_sat']
+            elif res_result and 'frac_sat' in res_result:
+                frac_sat_val = res_result['frac_sat']
+
+            # Add to summary table
+            summary_row = {
+                'config': f"{inst.upper()} {chan.upper()}",
+                'dit': config['DIT'],
+                'ndit': config['NDIT'],
+                'snr_target': config.get('SNR', '-'),
+                'snr_achieved': f"{snr_data[len(snr_data)//2]:.2f}",
+                'frac_sat': f"{frac_sat_val*100:.1f}%" if frac_sat_val is not None else '-'
+            }
+            scalars.update(dit=float(config['DIT']), ndit=int(config['NDIT']),
+                           snr_achieved=float(snr_data[len(snr_data)//2]),
+                           frac_sat=float(frac_sat_val) if frac_sat_val is not None else None)
+
+    except Exception as e:
+        lines.append(f"  ERROR: {str(e)}")
+        lines.append(f"  Traceback: {traceback.format_exc()}")
+        has_errors = True
+
+    return {'lines': lines, 'traces': traces, 'summary': summary_row, 'scalars': scalars,
+            'has_errors': has_errors, 'timings': timings}
+
+
+def result_key(config, compute_mode):
+    """Cache key of the result of ``compute_config(obj, config, compute_mode)``.
+
+    It changes with the reloads of the models (``wst_pool.pool.generation``).
+    """
+    return canonical_key(config, ['INS', 'CH'] + ALL_PARAM_KEYS,
+                         compute_mode, wst_pool.pool.generation)
+
+
+def persistent_key(config, compute_mode):
+    """Key of the result of ``compute_config`` in ``result_store``.
+
+    Unlike ``result_key``, which changes with the pool reloads of this
+    process, it depends on the backend and data version the models were
+    loaded with (``wst_pool.backend_version``).
+    """
+    return store_key(canonical_key(config, ['INS', 'CH'] + ALL_PARAM_KEYS,
+                                   compute_mode, wst_pool.backend_version()))
+
+
+def _error_result(message):
+    return {'lines': [f"  ERROR: {message}"], 'traces': [], 'summary': None, 'scalars': {},
+            'has_errors': True, 'timings': {}}
+
+
+def _timeout_result(message):
+    return {'lines': [f"  ⚠ TIMEOUT: {message}"], 'traces': [], 'summary': None,
+            'scalars': {'message': message, 'timeout': True}, 'has_errors': True, 'timings': {},
+            'timed_out': True}
+
+
+def request_deadline():
+    """``time.monotonic()`` time by which a request starting now must be done.
+
+    None when ``settings.REQUEST_TIMEOUT`` is 0 (no limit).
+    """
+    if settings.REQUEST_TIMEOUT > 0:
+        return time.monotonic() + settings.REQUEST_TIMEOUT
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Process-pool execution: every worker process builds its own WST instance
+# once, when it starts, and reuses it for all its tasks. A worker running a
+# computation over its time budget is killed and replaced (see worker_pool).
+
+_worker_wst = None
+
+
+def _init_worker():
+    global _worker_wst
+    _worker_wst = wst_pool.load_wst()
+
+
+def _call_in_worker(func, args):
+    return func(_worker_wst, *args)
+
+
+_executor = None
+_executor_generation = None
+_executor_lock = threading.Lock()
+
+
+def uses_worker_processes():
+    """Whether the computations run in the pool of worker processes.
+
+    Always in 'process' execution. In 'serial' execution too when a time
+    budget is set, since only a computation running in a worker process
+    can be stopped; they then run there one at a time.
+    """
+    return (settings.EXECUTION == 'process' or settings.CHANNEL_TIMEOUT > 0
+            or settings.REQUEST_TIMEOUT > 0)
+
+
+def uses_local_pool():
+    """Whether some computations run in this process, with ``wst_pool.pool``.
+
+    Not with a channel budget, which sends every computation to the worker
+    processes. Without one, a single computation runs in this process in
+    'process' execution, and so does a catalogue when only the request
+    budget is set.
+    """
+    return settings.CHANNEL_TIMEOUT <= 0
+
+
+def get_executor():
+    """Return the shared pool of worker processes, starting it on first use.
+
+    It has ``PROCESS_WORKERS`` processes in 'process' execution and
+    ``WST_POOL_SIZE`` in 'serial' execution, as many as the computations
+    this process runs at the same time. The worker processes never borrow
+    from ``wst_pool.pool``, so the data files are checked for changes here,
+    before submitting tasks: when they changed, the processes are restarted
+    to load them again.
+    """
+    global _executor, _executor_generation
+    wst_pool.pool.check_for_changes()
+    generation = wst_pool.pool.generation
+    if _executor is None or _executor_generation != generation:
+        with _executor_lock:
+            if _executor is None:
+                size = settings.PROCESS_WORKERS if settings.EXECUTION == 'process' else settings.WST_POOL_SIZE
+                _executor = WorkerPool(size, initializer=_init_worker,
+                                       start_timeout=settings.PROCESS_START_TIMEOUT)
+            elif _executor_generation != generation:
+                _executor.restart()
+            _executor_generation = generation
+    return _executor
+
+
+def start_executor():
+    """Start all worker processes and wait until their WST instances are loaded."""
+    get_executor().start(wait=True)
+
+
+def shutdown_executor():
+    """Stop the worker processes, if any.
+
+    Used before forking web server workers, which cannot use the pool of
+    their parent and start their own on first use.
+    """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+def executor_stats():
+    executor = _executor
+    return executor.stats() if executor is not None else None
+
+
+def _channel_timeout(timeout):
+    if timeout is None:
+        timeout = settings.CHANNEL_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def _run_tasks(func, arglist, execution=None, deadline=None, timeout=None):
+    # map_tasks, with the exceptions of the failed tasks instead of messages
+    execution = execution or settings.EXECUTION
+    timeout = _channel_timeout(timeout)
+    # A single computation runs in this process, unless it must be killable
+    if execution == 'process' and (len(arglist) > 1 or timeout or deadline):
+        executor = get_executor()
+        futures = {executor.submit(_call_in_worker, func, args, timeout=timeout, deadline=deadline): i
+                   for i, args in enumerate(arglist)}
+        for future in as_completed(futures):
+            yield _collect(futures[future], future)
+    elif timeout or deadline:
+        # Serial, in a worker process so that a computation over budget can
+        # be killed
+        executor = get_executor()
+        for i, args in enumerate(arglist):
+            yield _collect(i, executor.submit(_call_in_worker, func, args, timeout=timeout, deadline=deadline))
+    else:
+        for i, args in enumerate(arglist):
+            yield (i,) + _run_serial(func, args, deadline)
+
+
+def map_tasks(func, arglist, execution=None, deadline=None, timeout=None):
+    """Evaluate ``func(obj, *args)`` for every ``args`` in ``arglist``.
+
+    ``obj`` is a WST instance: a borrowed one from the shared pool in
+    ``'serial'`` execution (tasks run one after the other, in order), the
+    warm instance of a worker process in ``'process'`` execution (tasks run
+    in parallel and come out in completion order). ``func`` must be a
+    module-level function so that it can be sent to the workers.
+
+    ``deadline`` (see ``request_deadline``) is the time by which all the
+    tasks must be done and ``timeout`` the time budget of each task, by
+    default ``settings.CHANNEL_TIMEOUT``. A task over budget is killed: with
+    a budget, serial tasks also run in a worker process, one at a time.
+
+    Yields ``(index, result, error)`` triplets, ``error`` being None or the
+    message of the exception raised by the task.
+    """
+    for i, res, error in _run_tasks(func, arglist, execution, deadline, timeout):
+        yield i, res, None if error is None else str(error)
+
+
+def _run_serial(func, args, deadline=None):
+    remaining = None
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None, TaskTimeout("Not started within the time budget of the request")
+    try:
+        with wst_pool.pool.acquire(timeout=remaining) as obj:
+            return func(obj, *args), None
+    except TimeoutError as e:
+        return None, TaskTimeout(f"{e} within the time budget of the request")
+    except Exception as e:
+        return None, e
+
+
+def _collect(index, future):
+    try:
+        return index, future.result(), None
+    except CancelledError:
+        return index, None, RuntimeError("Computation cancelled: the server is shutting down")
+    except Exception as e:
+        return index, None, e
+
+
+def imap_tasks(func, args_iter, execution=None, window=None, deadline=None, timeout=None):
+    """Streaming version of ``map_tasks`` for an iterable of any length.
+
+    The triplets come out in input order. In ``'process'`` execution at most
+    ``window`` tasks (by default twice the number of workers) are submitted
+    ahead of the one being waited for, so that only a bounded part of
+    ``args_iter`` is held in memory.
+    """
+    execution = execution or settings.EXECUTION
+    timeout = _channel_timeout(timeout)
+    if execution != 'process':
+        if not (timeout or deadline):
+            for i, args in enumerate(args_iter):
+                res, error = _run_serial(func, args, deadline)
+                yield i, res, None if error is None else str(error)
+            return
+        window = 1
+    window = window or 2 * settings.PROCESS_WORKERS
+    executor = get_executor()
+    pending = deque()
+
+    def collect():
+        i, res, error = _collect(*pending.popleft())
+        return i, res, None if error is None else str(error)
+
+    for i, args in enumerate(args_iter):
+        pending.append((i, executor.submit(_call_in_worker, func, args, timeout=timeout, deadline=deadline)))
+        if len(pending) >= window:
+            yield collect()
+    while pending:
+        yield collect()
+
+
+def iter_results(tasks, execution=None, deadline=None):
+    """Compute ``(config, compute_mode)`` tasks, yielding results as they complete.
+
+    Yields ``(index, result)`` pairs, ``index`` being the position of the
+    task in ``tasks``. Tasks found in ``result_cache``, or else in
+    ``result_store``, are not recomputed and come first. The others are
+    evaluated with ``map_tasks`` according to ``execution`` and ``deadline``;
+    the computations over their time budget give a result with a
+    ``timed_out`` flag and a timeout message. Results with warnings or
+    errors are not cached. The outcome and stage timings of
+    every result are recorded in ``metrics``.
+    The yielded results may be shared with the cache and must not be
+    modified.
+    """
+    execution = execution or settings.EXECUTION
+    # Reload first, if the data files changed, for the keys to be those of
+    # the models computing the results
+    wst_pool.pool.check_for_changes()
+    keys = [result_key(config, compute_mode) for config, compute_mode in tasks]
+    stored_keys = {}
+    todo = []
+    for i, key in enumerate(keys):
+        res = result_cache.get(key)
+        if res is None and result_store is not None:
+            stored_keys[i] = persistent_key(*tasks[i])
+            res = result_store.get(stored_keys[i])
+            if res is not None:
+                result_cache.put(key, res)
+        if res is None:
+            todo.append(i)
+        else:
+            metrics.record_result(*tasks[i], res, cached=True)
+            yield i, res
+
+    def store(i, res):
+        metrics.record_result(*tasks[i], res)
+        if not res['has_errors']:
+            result_cache.put(keys[i], res)
+            if result_store is not None:
+                result_store.put(stored_keys[i], res)
+        return i, res
+
+    for j, res, error in _run_tasks(compute_config, [tasks[i] for i in todo], execution, deadline):
+        if isinstance(error, TaskTimeout):
+            res = _timeout_result(str(error))
+        elif error is not None:
+            res = _error_result(str(error))
+        yield store(todo[j], res)
+
+
+def run_configs(configs, compute_mode, execution=None, deadline=None):
+    """Compute every configuration and return the results in input order.
+
+    See ``iter_results`` for the execution modes, time budgets and caching.
+    """
+    results = [None] * len(configs)
+    for i, res in iter_results([(config, compute_mode) for config in configs], execution, deadline):
+        results[i] = res
+    return results
@@ -0,0 +1,168 @@
+"""Exposure-time curves: the SNR over a vector of NDIT or DIT values.
+
+A curve evaluates one instrument-channel configuration at the reference
+wavelength (``Lam_Ref``, or ``SEL_CWAV`` for an emission line) for every
+value of NDIT, at the DIT of the configuration, or of DIT, at its NDIT. The
+observation is built once per channel and the whole curve follows from a few
+SNR solver calls on it:
+
+* along NDIT, signal and noise variance both scale with the number of
+  exposures, so ``SNR = SNR(NDIT=1) * sqrt(NDIT)``, and the saturation, set
+  by the DIT, is the same for the whole curve;
+* along DIT, the solver is run at the ends of the computable range and at its
+  middle to fit the photon noise model of the reference pixel (see
+  ``sweep``) at a fixed source flux::
+
+      NDIT / SNR**2 = u / DIT + w / DIT**2
+
+  and the saturation onset and the DIT beyond which the solver fails are
+  located by bisection over the values, saturation growing with the DIT.
+
+The curve also gives the exposure reaching the target ``SNR`` and where
+saturation starts.
+"""
+import numpy as np
+
+import etc_core
+import settings
+import sweep
+
+CURVE_MODE = 'exposure_curve'
+CURVE_AXES = ['NDIT', 'DIT']
+
+
+def parse_curve(axis, values):
+    """Validate the axis and values of a curve.
+
+    ``values`` is a list or a text, as for the sweep axes. They come back
+    sorted, without duplicates, NDIT values rounded to integers.
+    """
+    if axis not in CURVE_AXES:
+        raise ValueError(f"The exposure curve runs over {' or '.join(CURVE_AXES)}, not {axis}")
+    values = np.asarray(sweep.parse_axis_values(axis, values), dtype=float)
+    if axis == 'NDIT':
+        values = np.round(values)
+    values = np.unique(values)
+    if values[0] <= 0:
+        raise ValueError(f"Values of {axis} must be positive")
+    if len(values) > settings.CURVE_MAX_POINTS:
+        raise ValueError(f"The exposure curve has {len(values)} values, the maximum is {settings.CURVE_MAX_POINTS}")
+    if axis == 'NDIT':
+        return [int(v) for v in values]
+    return values.tolist()
+
+
+def _fit_dit_terms(dits, z):
+    # Relative least squares of z = u/DIT + w/DIT**2; a single sample
+    # only gives the photon noise term
+    if len(set(dits)) < 2:
+        return z[0] * dits[0], 0.
+    design = np.stack([1. / dits, 1. / dits**2], axis=-1) / z[:, None]
+    (u, w), *_ = np.linalg.lstsq(design, np.ones(len(z)), rcond=None)
+    return max(u, 0.), max(w, 0.)
+
+
+def _ndit_curve(probe, config, ndits):
+    dit = config['DIT']
+    ref = probe(dit, 1)
+    n = len(ndits)
+    curve = {'exposure': dit * ndits, 'n_solves': 1, 'ref_wave': ref['ref_wave']}
+    saturated = bool(ref['frac_sat'])
+    curve['saturated'] = np.full(n, saturated)
+    curve['saturation'] = ({'value': float(ndits[0]), 'exposure': float(dit * ndits[0]),
+                            'frac_sat': ref['frac_sat'], 'index': 0} if saturated else None)
+    if ref['snr'] is None:
+        curve.update(snr=np.full(n, np.nan), required=None, errors=[ref['message']])
+        return curve
+    curve.update(snr=ref['snr'] * np.sqrt(ndits), errors=[])
+    curve['required'] = (config['SNR'] / ref['snr'])**2 if ref['snr'] > 0 else None
+    return curve
+
+
+def _dit_curve(probe, config, dits):
+    ndit = config['NDIT']
+    n = len(dits)
+    probes = {}
+
+    def solve(i):
+        if i not in probes:
+            probes[i] = probe(dits[i], ndit)
+        return probes[i]
+
+    n_ok = sweep.first_index(n, lambda i: solve(i)['snr'] is None)
+    n_unsat = sweep.first_index(n, lambda i: bool(solve(i)['frac_sat']))
+    curve = {'exposure': ndit * dits, 'saturated': np.arange(n) >= n_unsat}
+    curve['saturation'] = ({'value': float(dits[n_unsat]), 'exposure': float(ndit * dits[n_unsat]),
+                            'frac_sat': solve(n_unsat)['frac_sat'], 'index': n_unsat}
+                           if n_unsat < n else None)
+    if n_ok == 0:
+        curve.update(snr=np.full(n, np.nan), required=None, ref_wave=None, n_solves=len(probes),
+                     errors=[solve(0)['message']])
+        return curve
+
+    samples = sorted({0, (n_ok - 1) // 2, n_ok - 1} | {i for i in probes if i < n_ok})
+    for i in samples:
+        solve(i)
+    samples = [i for i in samples if probes[i]['snr']]
+    x = dits[samples]
+    z = ndit / np.array([probes[i]['snr'] for i in samples])**2
+    u, w = _fit_dit_terms(x, z)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        snr = np.sqrt(ndit / (u / dits + w / dits**2))
+        z_target = ndit / config['SNR']**2
+        required = (u + np.sqrt(u**2 + 4 * z_target * w)) / (2 * z_target)
+    snr[n_ok:] = np.nan
+    errors = [probes[n_ok]['message']] if n_ok < n else []
+    curve.update(snr=snr, required=float(required) if np.isfinite(required) else None,
+                 ref_wave=probes[samples[0]]['ref_wave'] if samples else None,
+                 n_solves=len(probes), errors=errors)
+    return curve
+
+
+def exposure_curve(obj, config, axis, values):
+    """SNR at the reference wavelength over the NDIT or DIT values.
+
+    Parameters
+    ----------
+    obj : WST
+        Instrument model, used by this call only.
+    config : dict
+        Full parameter dictionary; its DIT (NDIT curve) or NDIT (DIT curve)
+        is kept fixed and its ``SNR`` is the target.
+    axis : str
+        ``'NDIT'`` or ``'DIT'``.
+    values : list
+        Values of the axis, as returned by ``parse_curve``.
+
+    Returns
+    -------
+    dict
+        ``axis``, ``values``, ``exposure``: total exposure time of every
+        value, ``snr``: NaN where the solver fails, ``saturated``: whether
+        some pixels saturate at every value, ``ref_wave``, ``target``: the
+        value and exposure reaching the target SNR, with the index of the
+        first value reaching it (None if none does) and whether the pixels
+        saturate there, ``saturation``: the first saturated value (None if
+        none), ``n_solves``: number of solver calls and ``errors``.
+    """
+    values = np.asarray(values, dtype=float)
+    probe = etc_core.reference_probe(obj, config, 'dit_snr')
+    if axis == 'NDIT':
+        curve = _ndit_curve(probe, config, values)
+        fixed = config['DIT']
+    else:
+        curve = _dit_curve(probe, config, values)
+        fixed = config['NDIT']
+
+    target = None
+    required = curve.pop('required')
+    if required is not None:
+        reached = np.flatnonzero(np.nan_to_num(curve['snr']) >= config['SNR'])
+        saturation = curve['saturation']
+        target = {
+            'value': float(required),
+            'exposure': float(required * fixed),
+            'index': int(reached[0]) if len(reached) else None,
+            'saturated': bool(saturation and (axis == 'NDIT' or required >= saturation['value'])),
+        }
+    return dict(curve, axis=axis, values=values, target_snr=config['SNR'], target=target)
@@ -0,0 +1,92 @@
+"""Gunicorn configuration of the production server.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is imported once in the master process (``preload_app``), which
+loads the WST models in the background. The workers are forked at once and
+answer ``/healthz`` (and "warming up" to the computations); when the master
+is done loading, it replaces them with workers forked from the loaded
+process, which share the large read-only arrays copy-on-write instead of
+loading them each. The workers are threaded, so that progress streams of
+background jobs do not hold a whole worker. Every setting comes from the
+``PYETC_WEB_*`` environment variables, see ``settings.py``.
+"""
+import gc
+import os
+import signal
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Progress and results of the background jobs must be visible to every worker
+if 'PYETC_WEB_JOB_DIR' not in os.environ:
+    os.environ['PYETC_WEB_JOB_DIR'] = tempfile.mkdtemp(prefix='pyetc_web_jobs-')
+# and so must the metrics of every worker to the one answering /metrics
+if 'PYETC_WEB_METRICS_DIR' not in os.environ:
+    os.environ['PYETC_WEB_METRICS_DIR'] = tempfile.mkdtemp(prefix='pyetc_web_metrics-')
+# Worker processes of the computations started by the master would be
+# inherited by the workers forked from it; each worker starts its own pool
+os.environ['PYETC_WEB_PROCESS_PRESTART'] = '0'
+
+import settings  # noqa: E402
+
+bind = f"{settings.HOST}:{settings.PORT}"
+workers = settings.WORKERS
+worker_class = 'gthread'
+threads = settings.WORKER_THREADS
+timeout = settings.WORKER_TIMEOUT
+graceful_timeout = settings.WORKER_GRACEFUL_TIMEOUT
+max_requests = settings.WORKER_MAX_REQUESTS
+max_requests_jitter = settings.WORKER_MAX_REQUESTS // 10
+preload_app = True
+errorlog = '-'
+
+
+def when_ready(server):
+    import app
+
+    def prepare_fork(warmup, reload_workers):
+        # Keep the garbage collector from writing to (and thus copying) the
+        # pages of the objects loaded so far
+        gc.freeze()
+        if reload_workers:
+            # Like a HUP from the outside: gracefully replace the workers
+            # forked before the models were loaded
+            server.log.info("WST models %s, reloading the workers", warmup.state)
+            os.kill(os.getpid(), signal.SIGHUP)
+
+    if app.backend_warmup.done:
+        prepare_fork(app.backend_warmup, False)
+    else:
+        app.backend_warmup.add_done_callback(lambda warmup: prepare_fork(warmup, True))
+
+
+def post_fork(server, worker):
+    import app
+    import etc_core
+
+    # Start the worker processes of the computations at once, rather than
+    # have the first requests spend their time budget waiting for them
+    if app.backend_warmup.done and etc_core.uses_worker_processes():
+        threading.Thread(target=etc_core.start_executor, daemon=True).start()
+
+
+def _private_memory_mb():
+    # Memory not shared with the other processes: the pages inherited from
+    # the master only count once a worker writes to them
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            private = sum(int(line.split()[1]) for line in f if line.startswith('Private_'))
+        return private / 1024
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 if sys.platform != 'darwin' else rss / 2**20
+
+
+def post_request(worker, req, environ, resp):
+    if settings.WORKER_MEMORY_MAX_MB and _private_memory_mb() > settings.WORKER_MEMORY_MAX_MB:
+        worker.log.warning("Worker %s above %s MB of private memory, restarting it",
+                           worker.pid, settings.WORKER_MEMORY_MAX_MB)
+        worker.alive = False
@@ -0,0 +1,270 @@
+"""Asynchronous computation jobs.
+
+The page submits its form to ``/jobs`` and immediately gets a job id back.
+The computation runs in a background worker thread and reports its progress
+as a list of events (one per finished channel), which the page follows over
+Server-Sent Events before loading the finished result. Identical submissions
+while a job is queued or running share that job instead of computing twice;
+the queue is bounded and every client may only have a few jobs in flight, so
+a burst of submissions is refused quickly instead of piling up.
+
+With several web server processes, the request following a job may reach
+another process than the one running it: jobs then also write their events
+and result to a directory shared by the processes, where the others read
+them. Coalescing and the per-client limit remain per process.
+"""
+import json
+import os
+import pickle
+import queue
+import re
+import threading
+import time
+import uuid
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot take another job."""
+
+
+class ClientLimitError(Exception):
+    """Raised when a client already has its maximum number of jobs in flight."""
+
+
+# Events after which a job emits nothing more
+FINAL_EVENTS = ('done', 'failed')
+
+
+class Job:
+    """A computation and the events it has reported so far.
+
+    Parameters
+    ----------
+    key : hashable
+        Identity of the computation, used to coalesce identical submissions.
+    client : str
+        Client that submitted the job.
+    func : callable
+        ``func(emit)`` runs the computation and returns its result; it may
+        report progress with ``emit(event, **data)``.
+    directory : str or None
+        Directory where the events and result are also written.
+    """
+
+    def __init__(self, key, client, func, directory=None):
+        self.id = uuid.uuid4().hex
+        self.directory = directory
+        self.key = key
+        self.client = client
+        self.func = func
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.finished = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in FINAL_EVENTS
+
+    def emit(self, event, **data):
+        """Record an event and wake up the clients following the job."""
+        with self._cond:
+            if self.directory:
+                with open(os.path.join(self.directory, self.id + '.events'), 'a') as f:
+                    f.write(json.dumps([event, data]) + '\n')
+            self.events.append((event, data))
+            self._cond.notify_all()
+
+    def wait_events(self, start, timeout=None):
+        """Events from number ``start`` on, waiting up to ``timeout`` for new ones."""
+        with self._cond:
+            if len(self.events) <= start and not self.done:
+                self._cond.wait(timeout)
+            return self.events[start:]
+
+    def run(self):
+        self.status = 'running'
+        self.emit('status', status='running')
+        try:
+            self.result = self.func(self.emit)
+            if self.directory:
+                # A result that cannot be written fails the job, rather
+                # than leave it running forever for the other processes
+                path = os.path.join(self.directory, self.id + '.result')
+                with open(path + '.tmp', 'wb') as f:
+                    pickle.dump(self.result, f)
+                os.replace(path + '.tmp', path)
+        except Exception as e:
+            self.error = str(e)
+            self.status = 'failed'
+            self.finished = time.monotonic()
+            self.emit('failed', error=self.error)
+        else:
+            self.status = 'done'
+            self.finished = time.monotonic()
+            self.emit('done')
+
+
+class StoredJob:
+    """Read-only view of a job of another process, through its files."""
+
+    def __init__(self, job_id, directory):
+        self.id = job_id
+        self._path = os.path.join(directory, job_id)
+
+    @property
+    def events(self):
+        try:
+            with open(self._path + '.events') as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        # A line still being written has no newline yet
+        return [tuple(json.loads(line)) for line in lines if line.endswith('\n')]
+
+    @property
+    def status(self):
+        for event, data in reversed(self.events):
+            if event in FINAL_EVENTS:
+                return event
+            if event == 'status':
+                return data['status']
+        return 'queued'
+
+    @property
+    def done(self):
+        return self.status in FINAL_EVENTS
+
+    @property
+    def error(self):
+        for event, data in self.events:
+            if event == 'failed':
+                return data['error']
+        return None
+
+    @property
+    def result(self):
+        with open(self._path + '.result', 'rb') as f:
+            return pickle.load(f)
+
+    def wait_events(self, start, timeout=None, poll=0.25):
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            events = self.events
+            if len(events) > start or (events and events[-1][0] in FINAL_EVENTS):
+                return events[start:]
+            if time.monotonic() >= deadline:
+                return []
+            time.sleep(poll)
+
+
+class JobQueue:
+    """Bounded job queue served by a few worker threads.
+
+    Parameters
+    ----------
+    workers : int
+        Number of jobs computed at the same time.
+    max_queued : int
+        Number of jobs that can wait for a worker.
+    max_per_client : int
+        Number of jobs a client may have queued or running.
+    ttl : float
+        Seconds a finished job (and its result) is kept.
+    directory : str or None
+        Directory shared with the other web server processes, see the
+        module docstring.
+    """
+
+    def __init__(self, workers=1, max_queued=32, max_per_client=2, ttl=600., directory=None):
+        self.workers = max(1, int(workers))
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_per_client = max(1, int(max_per_client))
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=max(1, int(max_queued)))
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads if this has not been done yet."""
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"etc-job-{len(self._threads)}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, key, client, func):
+        """Queue ``func`` unless an identical job is already queued or running.
+
+        Returns ``(job, coalesced)``. Raises ``ClientLimitError`` or
+        ``QueueFullError`` when the job is refused.
+        """
+        self.start()
+        with self._lock:
+            self._expire()
+            job = self._active.get(key)
+            if job is not None:
+                return job, True
+            in_flight = sum(1 for j in self._active.values() if j.client == client)
+            if in_flight >= self.max_per_client:
+                raise ClientLimitError(f"Too many computations in progress (maximum {self.max_per_client})")
+            # Only submit adds jobs and it holds the lock: the queue cannot
+            # fill up between this check and the put
+            if self._queue.full():
+                raise QueueFullError("The server is busy, please retry in a moment")
+            job = Job(key, client, func, self.directory)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            job.emit('status', status='queued', position=self._queue.qsize() + 1)
+            self._queue.put_nowait(job)
+        return job, False
+
+    def get(self, job_id):
+        """Return the job ``job_id``, or None if it is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if (job is None and self.directory and re.fullmatch('[0-9a-f]{32}', job_id)
+                and os.path.exists(os.path.join(self.directory, job_id + '.events'))):
+            job = StoredJob(job_id, self.directory)
+        return job
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id in [i for i, j in self._jobs.items()
+                       if j.finished is not None and now - j.finished > self.ttl]:
+            del self._jobs[job_id]
+        if self.directory:
+            # Files of finished jobs, of any process
+            for fname in os.listdir(self.directory):
+                path = os.path.join(self.directory, fname)
+                try:
+                    if time.time() - os.stat(path).st_mtime > self.ttl:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                with self._lock:
+                    if self._active.get(job.key) is job:
+                        del self._active[job.key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'running': sum(1 for j in self._active.values() if j.status == 'running'),
+                'retained': len(self._jobs),
+                'workers': self.workers,
+            }
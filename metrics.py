@@ -0,0 +1,311 @@
+"""Timing instrumentation and Prometheus metrics.
+
+The computation stages (WST loading, observation build, SNR and time
+solvers, serialization of the results and template rendering) are timed
+and recorded in histograms labelled with the instrument, channel and compute
+mode, exposed by ``/metrics`` in the Prometheus text format. The stages timed
+while a request is being handled are also summed per request for its
+``Server-Timing`` header.
+
+Stages timed inside the worker processes of the computations are sent back
+with their results (``timings``) and recorded by the web process with
+``record_result``. With several web processes (``settings.METRICS_DIR``),
+every process saves its metrics to its own file of that directory about
+every second, and ``render`` sums the files of all the processes. The files
+of the processes that exited are kept, so that the counters keep growing
+when workers are replaced.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import settings
+
+DEFAULT_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _changed()
+
+    def values(self):
+        """Copy of the values, by tuple of label values."""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values, saved):
+        """Add the ``(labels, value)`` pairs saved by another process to ``values``."""
+        for key, value in saved:
+            key = tuple(key)
+            values[key] = values.get(key, 0) + value
+
+    def samples(self, values=None):
+        items = sorted((self.values() if values is None else values).items())
+        for key, value in items:
+            yield self.name + _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Histogram of observed values, with cumulative buckets as in Prometheus."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+        _changed()
+
+    def values(self):
+        """Copy of the ``(bucket counts, sum)``, by tuple of label values."""
+        with self._lock:
+            return {k: (list(c), s) for k, (c, s) in self._values.items()}
+
+    def merge(self, values, saved):
+        """Add the ``(labels, (bucket counts, sum))`` saved by another process to ``values``."""
+        for key, (counts, total) in saved:
+            key = tuple(key)
+            old_counts, old_total = values.get(key, ([0] * (len(self.buckets) + 1), 0.))
+            values[key] = ([a + b for a, b in zip(old_counts, counts)], old_total + total)
+
+    def samples(self, values=None):
+        items = sorted((self.values() if values is None else values).items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield self.name + '_bucket' + _format_labels(self.labelnames, key, [('le', le)]), cumulative
+            yield self.name + '_sum' + _format_labels(self.labelnames, key), total
+            yield self.name + '_count' + _format_labels(self.labelnames, key), cumulative
+
+
+stage_seconds = Histogram('pyetc_web_stage_seconds', "Time spent in each computation stage",
+                          ['stage', 'ins', 'ch', 'mode'])
+request_seconds = Histogram('pyetc_web_request_seconds', "Time to handle a request, up to the response headers",
+                            ['endpoint', 'method', 'status'])
+computations_total = Counter('pyetc_web_computations_total',
+                             "Instrument-channel computations, by outcome (ok, error, timeout or cached)",
+                             ['ins', 'ch', 'mode', 'outcome'])
+saturated_total = Counter('pyetc_web_saturated_total', "Computations with saturated pixels (frac_sat > 0)",
+                          ['ins', 'ch', 'mode'])
+
+REGISTRY = [stage_seconds, request_seconds, computations_total, saturated_total]
+
+
+def render():
+    """All the metrics in the Prometheus text exposition format.
+
+    With ``settings.METRICS_DIR``, summed over the processes.
+    """
+    saved = _saved_by_others()
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        values = metric.values()
+        for snapshot in saved:
+            metric.merge(values, snapshot.get(metric.name, ()))
+        for name, value in metric.samples(values):
+            lines.append(f"{name} {value!r}")
+    return '\n'.join(lines) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# Metrics shared by several processes through settings.METRICS_DIR
+
+# Seconds between two saves of the metrics of a process
+SAVE_INTERVAL = 1.
+
+_dirty = False
+_saver_pid = None
+_saver_lock = threading.Lock()
+
+
+def _own_path():
+    return os.path.join(settings.METRICS_DIR, f"{os.getpid()}.json")
+
+
+def save():
+    """Save the metrics of this process to its file, if they changed."""
+    global _dirty
+    if not settings.METRICS_DIR or not _dirty:
+        return
+    _dirty = False
+    snapshot = {metric.name: [[list(k), v] for k, v in metric.values().items()] for metric in REGISTRY}
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = _own_path()
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+
+
+def _save_periodically():
+    while True:
+        time.sleep(SAVE_INTERVAL)
+        try:
+            save()
+        except OSError:
+            pass
+
+
+def _changed():
+    global _dirty, _saver_pid
+    if not settings.METRICS_DIR:
+        return
+    _dirty = True
+    if _saver_pid != os.getpid():
+        with _saver_lock:
+            if _saver_pid != os.getpid():
+                _saver_pid = os.getpid()
+                threading.Thread(target=_save_periodically, name='metrics-saver', daemon=True).start()
+                atexit.register(save)
+
+
+def _saved_by_others():
+    if not settings.METRICS_DIR:
+        return []
+    own = os.path.basename(_own_path())
+    snapshots = []
+    try:
+        names = os.listdir(settings.METRICS_DIR)
+    except OSError:
+        return []
+    for name in names:
+        if not name.endswith('.json') or name == own:
+            continue
+        try:
+            with open(os.path.join(settings.METRICS_DIR, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return snapshots
+
+
+def _forget_parent():
+    # A forked process starts with a copy of the metrics of its parent, which
+    # the parent saves itself
+    global _dirty, _saver_pid, _saver_lock
+    for metric in REGISTRY:
+        metric._values = {}
+        metric._lock = threading.Lock()
+    _dirty = False
+    _saver_pid = None
+    _saver_lock = threading.Lock()
+
+
+if settings.METRICS_DIR:
+    os.register_at_fork(after_in_child=_forget_parent)
+
+
+# ---------------------------------------------------------------------------
+# Per-request accumulation of the stage timings, for the Server-Timing header
+
+_local = threading.local()
+
+
+def start_request():
+    _local.timings = {}
+
+
+def end_request():
+    """Stop collecting and return the ``{stage: seconds}`` of the request."""
+    timings = getattr(_local, 'timings', None) or {}
+    _local.timings = None
+    return timings
+
+
+def server_timing(timings, total=None):
+    """``Server-Timing`` header value, durations in milliseconds."""
+    entries = [f"{stage};dur={seconds * 1e3:.1f}" for stage, seconds in timings.items()]
+    if total is not None:
+        entries.append(f"total;dur={total * 1e3:.1f}")
+    return ', '.join(entries)
+
+
+def observe_stage(stage, seconds, ins='', ch='', mode=''):
+    stage_seconds.observe(seconds, stage=stage, ins=ins, ch=ch, mode=mode)
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.) + seconds
+
+
+@contextmanager
+def timer(stage, **labels):
+    """Time the ``with`` block as ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def timed(timings, stage):
+    """Add the duration of the ``with`` block to ``timings[stage]``.
+
+    Used where the timings travel with a result instead of being recorded
+    directly, see ``record_result``.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.) + time.perf_counter() - start
+
+
+def record_result(config, compute_mode, res, cached=False):
+    """Record the outcome and stage timings of a ``compute_config`` result."""
+    labels = dict(ins=config['INS'], ch=config['CH'], mode=compute_mode)
+    if cached:
+        outcome = 'cached'
+    else:
+        outcome = 'timeout' if res.get('timed_out') else 'error' if res['has_errors'] else 'ok'
+        for stage, seconds in res.get('timings', {}).items():
+            observe_stage(stage, seconds, **labels)
+        if res['scalars'].get('frac_sat'):
+            saturated_total.inc(**labels)
+    computations_total.inc(outcome=outcome, **labels)
@@ -0,0 +1,224 @@
+"""In-memory memoization of ETC results.
+
+Results are keyed on a canonical, typed form of the per-channel parameters
+so that e.g. ``12``, ``12.0`` and ``"12"`` submitted by the form map to the
+same entry. The caches have a memory budget and evict the least recently
+used entries first.
+"""
+import functools
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_value(v):
+    """Return a hashable, type-tagged version of a parameter value."""
+    if v is None:
+        return ('none',)
+    if isinstance(v, (bool, np.bool_)):
+        return ('bool', bool(v))
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return ('num', float(v))
+    if isinstance(v, str):
+        v = v.strip()
+        try:
+            return ('num', float(v))
+        except ValueError:
+            return ('str', v)
+    return ('repr', repr(v))
+
+
+def canonical_key(config, keys, *extra):
+    """Build the cache key of a configuration.
+
+    Parameters
+    ----------
+    config : dict
+        Parameter dictionary.
+    keys : list of str
+        Parameters taking part in the key, missing ones count as None.
+    extra :
+        Additional hashable items, e.g. the compute mode.
+    """
+    return tuple(extra) + tuple((k, canonical_value(config.get(k))) for k in keys)
+
+
+def estimate_size(value, _seen=None):
+    """Rough estimate of the memory used by a result, in bytes."""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes + 112
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k, _seen) + estimate_size(v, _seen)
+                                          for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v, _seen) for v in value)
+    if hasattr(value, '__dict__') and not callable(value):
+        # e.g. spectra and images, whose data live in numpy attributes
+        return sys.getsizeof(value) + estimate_size(vars(value), _seen)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a memory budget.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget; the least recently used entries are evicted when the
+        estimated size of the stored values exceeds it. Values larger than
+        the whole budget are not stored.
+    sizeof : callable
+        Function returning the size of a value, in bytes.
+    """
+
+    def __init__(self, max_bytes, sizeof=estimate_size):
+        self.max_bytes = int(max_bytes)
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.nbytes -= self._data.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._data[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, old_size) = self._data.popitem(last=False)
+                self.nbytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# Parameters the sky and throughput models depend on
+CONDITION_KEYS = ['INS', 'CH', 'SKYCALC', 'MOON', 'PWV', 'FLI', 'AM', 'SEE']
+
+_MISSING = object()
+
+
+def _hashable_args(args, kwargs):
+    # Key of simple arguments, None if any argument is not a scalar: two
+    # arrays or objects cannot be told apart by their type alone
+    values = list(args) + list(kwargs.values())
+    if not all(v is None or isinstance(v, (bool, int, float, str)) for v in values):
+        return None
+    return tuple(args) + tuple(sorted(kwargs.items()))
+
+
+class ConditionCache:
+    """Share the sky and throughput models between observations.
+
+    ``install`` memoizes the given methods of a WST instance: while
+    ``build_obs_full`` runs, their return values are cached under the
+    observing conditions of the configuration being built (``CONDITION_KEYS``)
+    instead of being recomputed, so that a new source under known conditions
+    only pays for its spectrum and image. The memoized methods must depend
+    on nothing but those conditions and their arguments, and callers must
+    not modify the returned models. Calls with other arguments than scalars
+    are not cached.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Memory budget of the cache.
+    methods : list of str
+        Names of the WST methods computing condition-dependent models.
+    """
+
+    def __init__(self, max_bytes, methods):
+        self.cache = LRUCache(max_bytes)
+        self.methods = list(methods)
+
+    def install(self, obj):
+        state = {'key': None}
+        build_obs_full = obj.build_obs_full
+
+        @functools.wraps(build_obs_full)
+        def build_with_conditions(config, *args, **kwargs):
+            state['key'] = canonical_key(config, CONDITION_KEYS)
+            try:
+                return build_obs_full(config, *args, **kwargs)
+            finally:
+                state['key'] = None
+
+        obj.build_obs_full = build_with_conditions
+        installed = []
+        for name in self.methods:
+            method = getattr(obj, name, None)
+            if method is not None:
+                setattr(obj, name, self._memoize(name, method, state))
+                installed.append(name)
+        if not installed:
+            logger.warning("None of the condition cache methods (%s) exists on %s: the models are not cached",
+                           ', '.join(self.methods), type(obj).__name__)
+        return obj
+
+    def _memoize(self, name, method, state):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            arg_key = _hashable_args(args, kwargs)
+            if state['key'] is None or arg_key is None:
+                return method(*args, **kwargs)
+            key = (name, state['key'], arg_key)
+            value = self.cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = method(*args, **kwargs)
+                self.cache.put(key, value)
+            return value
+        return wrapper
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
@@ -0,0 +1,201 @@
+"""Persistent store of ETC results, shared by processes and restarts.
+
+Complements the in-memory ``result_cache`` of every process with an SQLite
+database on local disk. Results are keyed on the canonical configuration,
+the compute mode and the backend/data version, and stored compactly: debug
+lines, summary and scalars as JSON, SNR traces as zlib-compressed float32.
+The database runs in WAL mode so that many processes can read while one
+writes; when it grows over its size budget, the least recently used results
+are deleted. The total size is kept up to date by triggers, in a table of
+its own, rather than summed on every write. The store is only an optimization: any database error counts as
+a miss.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Seconds between two updates of the last use time of a stored result
+TOUCH_INTERVAL = 60.
+
+
+def store_key(canonical):
+    """Database key of a canonical result key (see ``result_cache.canonical_key``)."""
+    return hashlib.sha1(repr(canonical).encode()).hexdigest()
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def pack_result(res):
+    """Serialize a ``compute_config`` result, its traces as float32."""
+    meta = {k: res[k] for k in ('lines', 'summary', 'scalars', 'has_errors')}
+    meta['traces'] = [dict({k: v for k, v in t.items() if k not in ('x', 'y')}, n=len(t['x']))
+                      for t in res['traces']]
+    header = json.dumps(meta, default=_json_default).encode()
+    arrays = b''.join(np.asarray(t[c], dtype='<f4').tobytes() for t in res['traces'] for c in ('x', 'y'))
+    return zlib.compress(struct.pack('<I', len(header)) + header + arrays)
+
+
+def unpack_result(blob):
+    """Inverse of ``pack_result``; the trace arrays come back as float64."""
+    data = zlib.decompress(blob)
+    (n_header,) = struct.unpack_from('<I', data)
+    meta = json.loads(data[4:4 + n_header])
+    offset = 4 + n_header
+    traces = []
+    for trace in meta.pop('traces'):
+        n = trace.pop('n')
+        x = np.frombuffer(data, dtype='<f4', count=n, offset=offset).astype(float)
+        y = np.frombuffer(data, dtype='<f4', count=n, offset=offset + 4 * n).astype(float)
+        offset += 8 * n
+        traces.append(dict(trace, x=x, y=y))
+    return dict(meta, traces=traces, timings={})
+
+
+class ResultStore:
+    """SQLite-backed key-value store of results with a size budget.
+
+    Parameters
+    ----------
+    path : str
+        Database file, created if needed.
+    max_bytes : int
+        Size budget of the stored results; the least recently used ones are
+        deleted when it is exceeded.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = int(max_bytes)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _connect(self):
+        # One connection per thread and per process: sqlite3 connections can
+        # cross neither, and forked web server workers inherit this object
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # In one transaction, for the total to start from the results of
+            # a database created before it
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                             "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+                conn.execute("CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                             "size INTEGER NOT NULL)")
+                conn.execute("INSERT OR IGNORE INTO total (id, size) SELECT 0, COALESCE(SUM(size), 0) FROM results")
+                conn.execute("CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results "
+                             "BEGIN UPDATE total SET size = size + new.size; END")
+                conn.execute("CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results "
+                             "BEGIN UPDATE total SET size = size + new.size - old.size; END")
+                conn.execute("CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results "
+                             "BEGIN UPDATE total SET size = size - old.size; END")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        """Return the result stored under ``key``, or None."""
+        try:
+            conn = self._connect()
+            row = conn.execute("SELECT value, last_used FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count('misses')
+                return None
+            now = time.time()
+            if now - row[1] > TOUCH_INTERVAL:
+                conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            res = unpack_result(row[0])
+        except (sqlite3.Error, zlib.error, ValueError):
+            self._count('errors')
+            return None
+        self._count('hits')
+        return res
+
+    def put(self, key, res):
+        """Store a result, then evict old ones if over the size budget."""
+        try:
+            blob = pack_result(res)
+            if len(blob) > self.max_bytes:
+                return
+            conn = self._connect()
+            # Not INSERT OR REPLACE, whose deletion of the old row fires no trigger
+            conn.execute("INSERT INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                         "last_used = excluded.last_used",
+                         (key, blob, len(blob), time.time()))
+            self._evict(conn)
+        except (sqlite3.Error, TypeError, ValueError):
+            self._count('errors')
+
+    def _evict(self, conn):
+        (total,) = conn.execute("SELECT size FROM total").fetchone()
+        if total <= self.max_bytes:
+            return
+        # Make room for a while: down to 90% of the budget
+        excess = total - 0.9 * self.max_bytes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            freed = 0
+            keys = []
+            oldest = conn.execute("SELECT key, size FROM results ORDER BY last_used")
+            for key, size in oldest:
+                keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            oldest.close()
+            conn.executemany("DELETE FROM results WHERE key = ?", keys)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        try:
+            self._connect().execute("DELETE FROM results")
+        except sqlite3.Error:
+            self._count('errors')
+
+    def stats(self):
+        try:
+            entries, nbytes = self._connect().execute(
+                "SELECT COUNT(*), (SELECT size FROM total) FROM results").fetchone()
+        except sqlite3.Error:
+            entries = nbytes = None
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+            }
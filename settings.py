@@ -0,0 +1,153 @@
+"""Runtime settings for the WST ETC web app.
+
+Every value can be overridden with a ``PYETC_WEB_<NAME>`` environment variable.
+"""
+import os
+
+
+def _env(name, default):
+    return os.environ.get(f'PYETC_WEB_{name}', default)
+
+
+def _env_int(name, default):
+    return int(_env(name, default))
+
+
+def _env_float(name, default):
+    return float(_env(name, default))
+
+
+def _env_bool(name, default):
+    v = _env(name, None)
+    if v is None:
+        return default
+    return v.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# ETC backend: 'wst' (pyetc_wst) or 'stub' (stub_wst, a deterministic
+# stand-in with configurable costs, for benchmarks)
+BACKEND = _env('BACKEND', 'wst')
+# CPU seconds burnt by the stub when loading, computing the sky model,
+# building an observation and running a solver; spectra length in pixels
+STUB_LOAD_SECONDS = _env_float('STUB_LOAD_SECONDS', 0.5)
+STUB_SKY_SECONDS = _env_float('STUB_SKY_SECONDS', 0.02)
+STUB_BUILD_SECONDS = _env_float('STUB_BUILD_SECONDS', 0.05)
+STUB_SOLVE_SECONDS = _env_float('STUB_SOLVE_SECONDS', 0.01)
+STUB_NPIX = _env_int('STUB_NPIX', 4000)
+
+# Address of the web server and Flask debug mode (development server only)
+HOST = _env('HOST', '0.0.0.0')
+PORT = _env_int('PORT', 5001)
+DEBUG = _env_bool('DEBUG', False)
+# Number of reverse proxies in front of the server whose X-Forwarded-For and
+# X-Forwarded-Proto headers are trusted (0: none, the peer is the client)
+PROXY_HOPS = _env_int('PROXY_HOPS', 0)
+
+# Production server (gunicorn.conf.py): pre-forked worker processes, threads
+# per worker, seconds before an unresponsive worker is killed, requests
+# before a worker is recycled (0: never) and private memory in MB above
+# which a worker is recycled after its current request (0: no limit)
+WORKERS = _env_int('WORKERS', os.cpu_count() or 1)
+WORKER_THREADS = _env_int('WORKER_THREADS', 8)
+WORKER_TIMEOUT = _env_int('WORKER_TIMEOUT', 300)
+WORKER_GRACEFUL_TIMEOUT = _env_int('WORKER_GRACEFUL_TIMEOUT', 30)
+WORKER_MAX_REQUESTS = _env_int('WORKER_MAX_REQUESTS', 0)
+WORKER_MEMORY_MAX_MB = _env_float('WORKER_MEMORY_MAX_MB', 0)
+
+# WST instrument model pool
+WST_LOG_LEVEL = _env('WST_LOG', 'DEBUG')
+WST_POOL_SIZE = _env_int('POOL_SIZE', 2)
+# Directory holding the instrument/throughput/sky data; when set, the pool
+# reloads its models as soon as a file in there changes
+WST_DATA_DIR = _env('WST_DATA_DIR', None)
+WST_RELOAD_CHECK_INTERVAL = _env_float('RELOAD_CHECK_INTERVAL', 10.)
+# When set, the numpy arrays of at least MMAP_MIN_KB held by the loaded
+# models are moved to .npy files in this directory and memory-mapped, so
+# that every instance and process shares them through the page cache
+MMAP_DIR = _env('MMAP_DIR', None)
+MMAP_MIN_KB = _env_float('MMAP_MIN_KB', 1024)
+
+# How the selected instrument-channel configurations are evaluated:
+# 'serial' (one after the other) or 'process' (in parallel, in a pool of
+# worker processes each holding its own warm WST instance)
+EXECUTION = _env('EXECUTION', 'serial')
+PROCESS_WORKERS = _env_int('PROCESS_WORKERS', min(9, os.cpu_count() or 1))
+# Seconds after which a worker process still loading its WST instance is
+# considered hung and replaced
+PROCESS_START_TIMEOUT = _env_float('PROCESS_START_TIMEOUT', 600)
+# Start the worker processes when the app loads rather than on first use
+# (gunicorn.conf.py disables it: each web server worker starts its own)
+PROCESS_PRESTART = _env_bool('PROCESS_PRESTART', True)
+
+# Time budgets in seconds (0 for none) of one instrument-channel computation
+# and of a whole request. Computations over budget are killed: with a
+# budget, 'serial' execution runs them one at a time in worker processes,
+# which load their own WST instances
+CHANNEL_TIMEOUT = _env_float('CHANNEL_TIMEOUT', 0)
+REQUEST_TIMEOUT = _env_float('REQUEST_TIMEOUT', 0)
+
+# Memory budget of the in-memory result cache, in MB
+RESULT_CACHE_MAX_MB = _env_float('RESULT_CACHE_MAX_MB', 256)
+
+# SQLite file of the persistent result store shared by all the processes and
+# kept across restarts (disabled when unset), its size budget in MB and a
+# version string to change to invalidate the stored results by hand, e.g.
+# after changing the data files when WST_DATA_DIR is not set
+RESULT_STORE_PATH = _env('RESULT_STORE_PATH', None)
+RESULT_STORE_MAX_MB = _env_float('RESULT_STORE_MAX_MB', 1024)
+RESULT_STORE_VERSION = _env('RESULT_STORE_VERSION', '')
+
+# Cache of the sky and throughput models, keyed on the observing conditions
+# and channel only; the WST methods computing them are memoized
+CONDITION_CACHE_MAX_MB = _env_float('CONDITION_CACHE_MAX_MB', 128)
+CONDITION_CACHE_METHODS = [m for m in _env('CONDITION_CACHE_METHODS', 'get_sky,get_sky_skycalc').split(',') if m]
+
+# Maximum number of observation specs in one /api/compute request
+API_MAX_SPECS = _env_int('API_MAX_SPECS', 1000)
+
+# MOS catalogues: rows computed per task (the unit spread over the worker
+# processes) and maximum number of rows of an uploaded catalogue
+CATALOGUE_CHUNK_ROWS = _env_int('CATALOGUE_CHUNK_ROWS', 64)
+CATALOGUE_MAX_ROWS = _env_int('CATALOGUE_MAX_ROWS', 100000)
+
+# Maximum number of grid points computed for one parameter sweep (points
+# along the magnitude axis, which are obtained by scaling, do not count)
+SWEEP_MAX_POINTS = _env_int('SWEEP_MAX_POINTS', 500)
+
+# Maximum number of NDIT or DIT values of an exposure-time curve (the curve
+# is evaluated from a few solver calls, whatever its length)
+CURVE_MAX_POINTS = _env_int('CURVE_MAX_POINTS', 10000)
+
+# Plot traces longer than this are downsampled (LTTB) for display, the full
+# resolution being fetched when zooming in; 0 sends every point
+PLOT_MAX_POINTS = _env_int('PLOT_MAX_POINTS', 2000)
+# Memory budget of the full-resolution traces kept for zooming, in MB
+TRACE_STORE_MAX_MB = _env_float('TRACE_STORE_MAX_MB', 64)
+
+# Background computation jobs submitted by the page: worker threads, jobs
+# waiting for a worker, jobs in flight per client and seconds a finished
+# job's result is kept
+JOB_WORKERS = _env_int('JOB_WORKERS', WST_POOL_SIZE)
+JOB_QUEUE_SIZE = _env_int('JOB_QUEUE_SIZE', 32)
+JOB_MAX_PER_CLIENT = _env_int('JOB_MAX_PER_CLIENT', 2)
+JOB_TTL = _env_float('JOB_TTL', 600.)
+# Directory where the jobs also write their progress and result, needed when
+# several server processes may receive the requests following a job
+JOB_DIR = _env('JOB_DIR', None)
+# Directory where the full-resolution plot traces are kept instead of memory
+# (TRACE_STORE_MAX_MB being then a disk budget), so that the zoom requests
+# may reach any server process; by default a subdirectory of JOB_DIR
+TRACE_DIR = _env('TRACE_DIR', os.path.join(JOB_DIR, 'traces') if JOB_DIR else None)
+# Directory where every server process saves its metrics, which /metrics
+# then sums over the processes
+METRICS_DIR = _env('METRICS_DIR', None)
+
+# Compression (brotli if the brotli module is installed, else gzip) of the
+# text responses of at least COMPRESS_MIN_BYTES; streamed ones always are
+COMPRESS = _env_bool('COMPRESS', True)
+COMPRESS_MIN_BYTES = _env_int('COMPRESS_MIN_BYTES', 1024)
+
+# Local copy of Plotly.js served with the page assets, instead of
+# static/vendor/plotly.min.js or the one of the plotly package; without
+# any, the page loads it from the Plotly CDN
+PLOTLY_JS = _env('PLOTLY_JS', None)
@@ -6,6 +6,7 @@ setup(
     packages=find_packages(),
     include_package_data=True,
     install_requires=["flask"],
+    extras_require={"production": ["gunicorn"]},
     description="Web app pyetc",
     author="matteoferro",
     author_email="",
@@ -0,0 +1,827 @@
+// Add select/deselect all buttons for plot legend
+function addLegendControls(traces) {
+    var controlsDiv = document.getElementById('plot-legend-controls');
+    if (!traces || traces.length === 0) { controlsDiv.innerHTML = ''; return; }
+    controlsDiv.innerHTML = '<button id="select-all-traces" style="margin-right:8px;">Select All</button>' +
+        '<button id="deselect-all-traces">Deselect All</button>';
+    document.getElementById('select-all-traces').onclick = function() {
+        Plotly.restyle('snr-plot', {visible: true});
+    };
+    document.getElementById('deselect-all-traces').onclick = function() {
+        Plotly.restyle('snr-plot', {visible: false});
+    };
+}
+// URL of Plotly.js, served by the app when it has a local copy
+var PLOTLY_URL = document.currentScript.getAttribute('data-plotly');
+// URL of the full resolution of a plot trace, with TOKEN for its token
+var TRACE_URL = document.currentScript.getAttribute('data-trace-url');
+
+// Load Plotly.js dynamically if not present
+function loadPlotly(callback) {
+    if (window.Plotly) { callback(); return; }
+    var script = document.createElement('script');
+    script.src = PLOTLY_URL;
+    script.onload = callback;
+    document.head.appendChild(script);
+}
+
+// Decode a base64 little-endian float32 array
+function decodeF32(b64) {
+    var bin = atob(b64);
+    var bytes = new Uint8Array(bin.length);
+    for (var i = 0; i < bin.length; i++) { bytes[i] = bin.charCodeAt(i); }
+    return new Float32Array(bytes.buffer);
+}
+
+// Replace the downsampled traces of a plot by their full resolution
+// (fetched once, on the first zoom)
+function loadFullResolution(divId, traces) {
+    var pending = traces.filter(function(t) { return t.full && !t.fullLoaded; });
+    pending.forEach(function(t) {
+        t.fullLoaded = true;
+        fetch(TRACE_URL.replace('TOKEN', t.full)).then(function(r) {
+            if (!r.ok) { throw new Error(r.status); }
+            return r.arrayBuffer();
+        }).then(function(buf) {
+            var n = t.nFull;
+            Plotly.restyle(divId, {
+                x: [new Float32Array(buf, 0, n)],
+                y: [new Float32Array(buf, 4 * n, n)]
+            }, [t.plotIndex]);
+        }).catch(function() {
+            // Keep the downsampled trace (e.g. data evicted from the server)
+        });
+    });
+}
+
+// Data of the results section, rendered as JSON script tags
+function readData(id) {
+    var element = document.getElementById(id);
+    return element ? JSON.parse(element.textContent) : null;
+}
+
+// Render SNR plot if plot_data is available
+function renderSNRPlot() {
+    var plotDataRaw = readData('plot-data');
+    if (!document.getElementById('snr-plot')) { return; }
+    if (!plotDataRaw || !plotDataRaw.traces || plotDataRaw.traces.length === 0) {
+        document.getElementById('snr-plot').innerHTML = '';
+        document.getElementById('snr-plot-secondary').innerHTML = '';
+        document.getElementById('plot-legend').innerHTML = '';
+        return;
+    }
+    // Group traces by config name (deduplicate legend)
+    var configTraces = {};
+    var mainTraces = [];
+    var secondaryTraces = [];
+    var mainFull = [];
+    var secondaryFull = [];
+    plotDataRaw.traces.forEach(function(trace, idx) {
+        var cleanName = trace.name.replace(/\s*\(.*\)/, '');
+        if (!configTraces[cleanName]) {
+            configTraces[cleanName] = [];
+        }
+        configTraces[cleanName].push({
+            idx: idx,
+            secondary: !!trace.secondary
+        });
+        var plotlyTrace = {
+            x: trace.encoding === 'f32' ? decodeF32(trace.x) : trace.x,
+            y: trace.encoding === 'f32' ? decodeF32(trace.y) : trace.y,
+            name: cleanName,
+            type: 'scatter',
+            mode: 'lines',
+            line: { color: trace.color },
+            visible: true
+        };
+        var target = trace.secondary ? secondaryTraces : mainTraces;
+        var fullInfo = { full: trace.full, nFull: trace.n_full, plotIndex: target.length };
+        (trace.secondary ? secondaryFull : mainFull).push(fullInfo);
+        target.push(plotlyTrace);
+    });
+    var axisLabelFont = {
+        family: 'Segoe UI, Tahoma, Geneva, Verdana, sans-serif',
+        size: 16,
+        color: '#222',
+        weight: 'bold'
+    };
+    var layoutMain = {
+        title: 'SNR x spectral pixel',
+        xaxis: {
+            title: 'Wavelength [Å]',
+            showgrid: true,
+            gridcolor: '#e0e0e0',
+            zeroline: false,
+            linecolor: '#888',
+            linewidth: 2,
+            mirror: true,
+            griddash: 'solid',
+            titlefont: axisLabelFont
+        },
+        yaxis: {
+            title: 'SNR',
+            showgrid: true,
+            gridcolor: '#e0e0e0',
+            zeroline: false,
+            linecolor: '#888',
+            linewidth: 2,
+            mirror: true,
+            griddash: 'solid',
+            titlefont: axisLabelFont
+        },
+        showlegend: false,
+        margin: { t: 40, l: 60, r: 30, b: 50 },
+        plot_bgcolor: '#fff',
+        paper_bgcolor: '#fff',
+    };
+    var layoutSecondary = JSON.parse(JSON.stringify(layoutMain));
+    layoutSecondary.title = 'SNR x spectral coadding';
+    layoutSecondary.showlegend = false;
+    layoutSecondary.xaxis.titlefont = axisLabelFont;
+    layoutSecondary.yaxis.titlefont = axisLabelFont;
+    layoutSecondary.xaxis.title = 'Wavelength [Å]';
+    layoutSecondary.yaxis.title = 'SNR';
+    // If both plots, remove x label from top plot
+    if (secondaryTraces.length > 0) {
+        layoutMain.xaxis.title = '';
+    }
+    Plotly.newPlot('snr-plot', mainTraces, layoutMain, {responsive: true});
+    document.getElementById('snr-plot').on('plotly_relayout', function(e) {
+        if (e['xaxis.range[0]'] !== undefined) { loadFullResolution('snr-plot', mainFull); }
+    });
+    var secondaryDiv = document.getElementById('snr-plot-secondary');
+    if (secondaryTraces.length > 0) {
+        secondaryDiv.style.display = 'block';
+        Plotly.newPlot('snr-plot-secondary', secondaryTraces, layoutSecondary, {responsive: true});
+        document.getElementById('snr-plot-secondary').on('plotly_relayout', function(e) {
+            if (e['xaxis.range[0]'] !== undefined) { loadFullResolution('snr-plot-secondary', secondaryFull); }
+        });
+        // Link x-axes for zoom/pan
+        var snrPlot = document.getElementById('snr-plot');
+        var snrPlotSecondary = document.getElementById('snr-plot-secondary');
+        snrPlot.on('plotly_relayout', function(e) {
+            if (e['xaxis.range[0]'] !== undefined && e['xaxis.range[1]'] !== undefined) {
+                Plotly.relayout(snrPlotSecondary, {
+                    'xaxis.range': [e['xaxis.range[0]'], e['xaxis.range[1]']]
+                });
+            }
+        });
+        snrPlotSecondary.on('plotly_relayout', function(e) {
+            if (e['xaxis.range[0]'] !== undefined && e['xaxis.range[1]'] !== undefined) {
+                Plotly.relayout(snrPlot, {
+                    'xaxis.range': [e['xaxis.range[0]'], e['xaxis.range[1]']]
+                });
+            }
+        });
+    } else {
+        secondaryDiv.innerHTML = '';
+        secondaryDiv.style.display = 'none';
+    }
+    // Shared legend below both plots, deduplicated and clickable
+    var legendDiv = document.getElementById('plot-legend');
+    legendDiv.innerHTML = '';
+    var legendHtml = '<div style="display:flex;justify-content:center;flex-wrap:wrap;gap:18px;">';
+    var colorMap = {};
+    // Get color for each config from first trace
+    Object.keys(configTraces).forEach(function(configName) {
+        var firstIdx = configTraces[configName][0].idx;
+        var color = plotDataRaw.traces[firstIdx].color;
+        colorMap[configName] = color;
+    });
+    Object.keys(configTraces).forEach(function(configName) {
+        legendHtml += '<span class="legend-item" data-config="' + configName + '" style="display:flex;align-items:center;gap:6px;font-size:14px;cursor:pointer;user-select:none;"><span style="width:18px;height:4px;background:' + colorMap[configName] + ';display:inline-block;border-radius:2px;"></span>' + configName + '</span>';
+    });
+    legendHtml += '</div>';
+    legendDiv.innerHTML = legendHtml;
+    // Legend click handler: toggle visibility for all traces with this config in both plots
+    var visibleConfigs = {};
+    Object.keys(configTraces).forEach(function(configName) { visibleConfigs[configName] = true; });
+    Array.from(legendDiv.querySelectorAll('.legend-item')).forEach(function(item) {
+        item.addEventListener('click', function() {
+            var configName = item.getAttribute('data-config');
+            visibleConfigs[configName] = !visibleConfigs[configName];
+            // Update main plot
+            var mainVis = mainTraces.map(function(trace) {
+                return (trace.name === configName) ? visibleConfigs[configName] : trace.visible;
+            });
+            Plotly.restyle('snr-plot', {visible: mainVis});
+            // Update secondary plot
+            var secVis = secondaryTraces.map(function(trace) {
+                return (trace.name === configName) ? visibleConfigs[configName] : trace.visible;
+            });
+            if (secondaryTraces.length > 0) {
+                Plotly.restyle('snr-plot-secondary', {visible: secVis});
+            }
+            // Style legend item
+            if (visibleConfigs[configName]) {
+                item.style.opacity = '1';
+            } else {
+                item.style.opacity = '0.4';
+            }
+        });
+    });
+    }
+
+// Render parameter sweep results: a line for one swept parameter,
+// a heatmap for two, a heatmap per value of the third one otherwise
+function renderSweepPlots() {
+    var sweepData = readData('sweep-data');
+    var container = document.getElementById('sweep-plots');
+    if (!sweepData || !container) { return; }
+    sweepData.forEach(function(grid, gridIdx) {
+        var block = document.createElement('div');
+        block.style.marginBottom = '16px';
+        var plotId = 'sweep-plot-' + gridIdx;
+        var axes = grid.axes;
+        var sliceSelect = null;
+        if (axes.length === 3) {
+            sliceSelect = document.createElement('select');
+            sliceSelect.className = 'form-select';
+            axes[2].values.forEach(function(v, k) {
+                var opt = document.createElement('option');
+                opt.value = k;
+                opt.textContent = axes[2].name + ' = ' + v;
+                sliceSelect.appendChild(opt);
+            });
+            block.appendChild(sliceSelect);
+        }
+        var plotDiv = document.createElement('div');
+        plotDiv.id = plotId;
+        plotDiv.style.width = '100%';
+        plotDiv.style.height = '360px';
+        block.appendChild(plotDiv);
+        container.appendChild(block);
+        var layout = {
+            title: grid.name + ': ' + grid.quantity,
+            xaxis: { title: axes[0].name },
+            yaxis: { title: axes.length > 1 ? axes[1].name : grid.quantity },
+            margin: { t: 40, l: 60, r: 30, b: 50 },
+            plot_bgcolor: '#fff',
+            paper_bgcolor: '#fff'
+        };
+        function traceFor(sliceIdx) {
+            if (axes.length === 1) {
+                // Saturated points in red
+                var markerColors = grid.saturated.map(function(sat) { return sat ? '#d62728' : grid.color; });
+                return [{ x: axes[0].values, y: grid.values, type: 'scatter', mode: 'lines+markers',
+                          line: { color: grid.color }, marker: { color: markerColors } }];
+            }
+            // values[i][j][k] with i along x and j along y: heatmap z is indexed [j][i]
+            var z = axes[1].values.map(function(_, j) {
+                return axes[0].values.map(function(_, i) {
+                    var v = grid.values[i][j];
+                    return axes.length === 3 ? v[sliceIdx] : v;
+                });
+            });
+            return [{ x: axes[0].values, y: axes[1].values, z: z, type: 'heatmap', colorscale: 'Viridis', colorbar: { title: grid.quantity } }];
+        }
+        Plotly.newPlot(plotId, traceFor(0), layout, {responsive: true});
+        if (sliceSelect) {
+            sliceSelect.addEventListener('change', function() {
+                Plotly.react(plotId, traceFor(parseInt(sliceSelect.value)), layout);
+            });
+        }
+    });
+}
+
+// Render exposure curves: SNR against total exposure time for every
+// channel, with the target SNR and the saturated part of the curves
+function renderCurvePlot() {
+    var curveData = readData('curve-data');
+    var container = document.getElementById('curve-plot');
+    if (!curveData || !curveData.length || !container) { return; }
+    var traces = [];
+    curveData.forEach(function(curve) {
+        var text = curve.values.map(function(v) { return curve.axis + ' = ' + v; });
+        traces.push({ x: curve.exposure, y: curve.snr, text: text, name: curve.name, type: 'scatter',
+                      mode: 'lines', line: { color: curve.color } });
+        var sat = curve.snr.map(function(v, i) { return curve.saturated[i] ? v : null; });
+        if (sat.some(function(v) { return v !== null; })) {
+            traces.push({ x: curve.exposure, y: sat, text: text, name: curve.name + ' (saturated)',
+                          type: 'scatter', mode: 'markers', marker: { color: curve.color, symbol: 'x', size: 6 } });
+        }
+        if (curve.target) {
+            traces.push({ x: [curve.target.exposure], y: [curve.target_snr],
+                          text: [curve.axis + ' = ' + curve.target.value.toFixed(2)],
+                          name: curve.name + ' (target SNR)', type: 'scatter', mode: 'markers',
+                          marker: { color: curve.color, symbol: 'star', size: 12 } });
+        }
+    });
+    var layout = {
+        title: 'SNR at the reference wavelength vs total exposure time',
+        xaxis: { title: 'Total exposure time [s]' },
+        yaxis: { title: 'SNR' },
+        shapes: [{ type: 'line', xref: 'paper', x0: 0, x1: 1, y0: curveData[0].target_snr,
+                   y1: curveData[0].target_snr, line: { dash: 'dash', color: '#888', width: 1 } }],
+        margin: { t: 40, l: 60, r: 30, b: 50 },
+        plot_bgcolor: '#fff',
+        paper_bgcolor: '#fff'
+    };
+    Plotly.newPlot('curve-plot', traces, layout, {responsive: true});
+}
+
+function renderPlots() {
+    renderSNRPlot();
+    renderSweepPlots();
+    renderCurvePlot();
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Load Plotly and render plots if data exists
+    if (document.getElementById('plot-data')) loadPlotly(renderPlots);
+});
+
+// Submit the computation as a background job and follow its progress;
+// without EventSource support the form is posted as usual
+function showJobLog(text) {
+    var panel = document.querySelector('.results-content');
+    var pre = document.getElementById('job-log');
+    if (!pre) {
+        panel.innerHTML = '<pre id="job-log"></pre>';
+        pre = document.getElementById('job-log');
+    }
+    pre.textContent += text + '\n';
+}
+
+// Replace the results section by that of the finished job, the rest of the
+// page staying as it is; the address becomes that of the job's result page
+function showResults(job) {
+    fetch(job.fragment_url).then(function(response) {
+        if (!response.ok) { throw new Error(response.status); }
+        return response.text();
+    }).then(function(html) {
+        document.querySelector('.results-content').innerHTML = html;
+        history.replaceState(null, '', job.result_url);
+        loadPlotly(renderPlots);
+    }).catch(function() {
+        window.location.href = job.result_url;
+    });
+}
+
+function followJob(job) {
+    showJobLog(job.coalesced ? 'Joined an identical computation already in progress...'
+                             : 'Computation queued...');
+    var source = new EventSource(job.events_url);
+    source.addEventListener('status', function(e) {
+        var data = JSON.parse(e.data);
+        if (data.status === 'running') showJobLog('Computing...\n');
+    });
+    source.addEventListener('progress', function(e) {
+        var data = JSON.parse(e.data);
+        showJobLog('[' + data.done + '/' + data.total + '] ' + data.name + ' done\n' + data.text);
+    });
+    source.addEventListener('done', function() {
+        source.close();
+        showResults(job);
+    });
+    source.addEventListener('failed', function(e) {
+        source.close();
+        showJobLog('CRITICAL ERROR: ' + JSON.parse(e.data).error);
+    });
+    source.onerror = function() {
+        if (source.readyState === EventSource.CLOSED) showJobLog('Lost the connection to the server.');
+    };
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    var form = document.getElementById('etcForm');
+    form.addEventListener('submit', function(e) {
+        if (!window.EventSource || !window.fetch) return;
+        e.preventDefault();
+        var button = form.querySelector('.compute-btn');
+        button.disabled = true;
+        document.querySelector('.results-content').innerHTML = '<pre id="job-log"></pre>';
+        fetch(form.getAttribute('data-jobs-url'), {method: 'POST', body: new FormData(form)})
+            .then(function(response) {
+                return response.json().then(function(data) { return {ok: response.ok, data: data}; });
+            })
+            .then(function(r) {
+                button.disabled = false;
+                if (r.ok) followJob(r.data);
+                else showJobLog('ERROR: ' + r.data.error);
+            })
+            .catch(function() {
+                button.disabled = false;
+                form.submit();
+            });
+    });
+    // The catalogue is posted as usual and downloaded, with the parameters
+    // of the page form
+    var catalogueForm = document.getElementById('catalogueForm');
+    catalogueForm.addEventListener('submit', function() {
+        catalogueForm.querySelectorAll('input[type="hidden"]').forEach(function(input) { input.remove(); });
+        new FormData(form).forEach(function(value, name) {
+            var input = document.createElement('input');
+            input.type = 'hidden';
+            input.name = name;
+            input.value = value;
+            catalogueForm.appendChild(input);
+        });
+    });
+});
+// Tab switching function
+function switchTab(event, tabId) {
+    // Remove active class from all tabs and tab contents
+    const tabs = document.querySelectorAll('.tab');
+    const tabContents = document.querySelectorAll('.tab-content');
+    
+    tabs.forEach(tab => tab.classList.remove('active'));
+    tabContents.forEach(content => content.classList.remove('active'));
+    
+    // Add active class to clicked tab and corresponding content
+    event.target.classList.add('active');
+    document.getElementById(tabId).classList.add('active');
+}
+
+// Select all configurations
+function selectAll() {
+    const checkboxes = document.querySelectorAll('input[name="config"]');
+    checkboxes.forEach(cb => cb.checked = true);
+    updateConfigOptions();
+}
+
+// Deselect all configurations
+function deselectAll() {
+    const checkboxes = document.querySelectorAll('input[name="config"]');
+    checkboxes.forEach(cb => cb.checked = false);
+    updateConfigOptions();
+}
+
+// Update configuration options based on selections
+function updateConfigOptions() {
+    const checkboxes = document.querySelectorAll('input[name="config"]:checked');
+    const selectedConfigs = Array.from(checkboxes).map(cb => cb.value);
+    
+    // Check if any configuration is selected
+    const anySelected = selectedConfigs.length > 0;
+    const hasIFS = selectedConfigs.some(c => c.startsWith('ifs-'));
+    const hasMOS = selectedConfigs.some(c => c.startsWith('moshr-') || c.startsWith('moslr-'));
+    
+    // Show/hide spectral coadding
+    document.getElementById('spectral-coadding').classList.toggle('hidden', !anySelected);
+    
+    // Show/hide spatial coadding (only for IFS)
+    document.getElementById('spatial-coadding').classList.toggle('hidden', !hasIFS);
+    
+    // Show/hide object displacement (only for MOS)
+    document.getElementById('object-displacement').classList.toggle('hidden', !hasMOS);
+}
+
+// Update SED options
+function updateSEDOptions() {
+    const sedType = document.getElementById('Obj_SED').value;
+    
+    // Hide all SED option groups
+    document.getElementById('template-options').classList.add('hidden');
+    document.getElementById('blackbody-options').classList.add('hidden');
+    document.getElementById('powerlaw-options').classList.add('hidden');
+    document.getElementById('line-options').classList.add('hidden');
+    
+    // Show appropriate option group
+    if (sedType === 'template') {
+        document.getElementById('template-options').classList.remove('hidden');
+    } else if (sedType === 'bb') {
+        document.getElementById('blackbody-options').classList.remove('hidden');
+    } else if (sedType === 'pl') {
+        document.getElementById('powerlaw-options').classList.remove('hidden');
+    } else if (sedType === 'line') {
+        document.getElementById('line-options').classList.remove('hidden');
+    }
+    
+    // Update brightness section
+    updateBrightnessSection();
+    // Update compute mode to handle wavelength visibility
+    updateComputeMode();
+}
+
+// Update brightness section based on SED type and morphology
+function updateBrightnessSection() {
+    const sedType = document.getElementById('Obj_SED').value;
+    const morphology = document.getElementById('Obj_Spat_Dis').value;
+    
+    const magnitudeSection = document.getElementById('magnitude-section');
+    const fluxSection = document.getElementById('flux-section');
+    const magnitudeLabel = document.getElementById('magnitude-label');
+    const fluxLabel = document.getElementById('flux-label');
+    
+    if (sedType === 'line') {
+        // Show flux section for emission line
+        magnitudeSection.classList.add('hidden');
+        fluxSection.classList.remove('hidden');
+        
+        if (morphology === 'sb') {
+            fluxLabel.textContent = 'Flux [erg/cm²/s/arcsec²]';
+        } else {
+            fluxLabel.textContent = 'Flux [erg/cm²/s]';
+        }
+    } else {
+        // Show magnitude section for other SED types
+        magnitudeSection.classList.remove('hidden');
+        fluxSection.classList.add('hidden');
+        
+        if (morphology === 'sb') {
+            magnitudeLabel.textContent = 'Magnitude per arcsec²';
+        } else {
+            magnitudeLabel.textContent = 'Magnitude';
+        }
+    }
+}
+
+// Update morphology options
+function updateMorphologyOptions() {
+    const morphology = document.getElementById('Obj_Spat_Dis').value;
+    const sersicOptions = document.getElementById('sersic-options');
+    
+    if (morphology === 'resolved') {
+        sersicOptions.classList.remove('hidden');
+        document.getElementById('IMA').value = 'sersic';
+    } else {
+        sersicOptions.classList.add('hidden');
+    }
+    
+    // Update brightness label
+    updateBrightnessSection();
+}
+
+// Update compute mode options
+function updateComputeMode() {
+    const mode = document.getElementById('compute_mode').value;
+    const sedType = document.getElementById('Obj_SED').value;
+    
+    const ditInput = document.getElementById('dit-input');
+    const nditInput = document.getElementById('ndit-input');
+    const snrInput = document.getElementById('snr-input');
+    const wavelengthInput = document.getElementById('wavelength-input');
+    const curveInput = document.getElementById('curve-input');
+    curveInput.classList.toggle('hidden', mode !== 'exposure_curve');
+    
+    // Show/hide inputs based on mode
+    if (mode === 'dit_ndit') {
+        ditInput.classList.remove('hidden');
+        nditInput.classList.remove('hidden');
+        snrInput.classList.add('hidden');
+        wavelengthInput.classList.add('hidden');
+    } else if (mode === 'dit_snr') {
+        ditInput.classList.remove('hidden');
+        nditInput.classList.add('hidden');
+        snrInput.classList.remove('hidden');
+        // Show wavelength only if NOT emission line
+        wavelengthInput.classList.toggle('hidden', sedType === 'line');
+    } else if (mode === 'ndit_snr') {
+        ditInput.classList.add('hidden');
+        nditInput.classList.remove('hidden');
+        snrInput.classList.remove('hidden');
+        // Show wavelength only if NOT emission line
+        wavelengthInput.classList.toggle('hidden', sedType === 'line');
+    } else if (mode === 'exposure_curve') {
+        // The fixed DIT or NDIT, the target SNR and its wavelength
+        ditInput.classList.remove('hidden');
+        nditInput.classList.remove('hidden');
+        snrInput.classList.remove('hidden');
+        wavelengthInput.classList.toggle('hidden', sedType === 'line');
+    }
+}
+
+// Validation functions
+function validateCoaddWL() {
+    const input = document.getElementById('COADD_WL');
+    const error = document.getElementById('error-COADD_WL');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateObjDisp() {
+    const input = document.getElementById('OBJ_FIB_DISP');
+    const error = document.getElementById('error-OBJ_FIB_DISP');
+    const value = parseFloat(input.value);
+    
+    if (value < 0 || value > 0.3 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateRedshift() {
+    const input = document.getElementById('Z');
+    const error = document.getElementById('error-Z');
+    const value = parseFloat(input.value);
+    
+    if (value < 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateBBTemp() {
+    const input = document.getElementById('BB_Temp');
+    const error = document.getElementById('error-BB_Temp');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSELCWAV() {
+    const input = document.getElementById('SEL_CWAV');
+    const error = document.getElementById('error-SEL_CWAV');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSELFWHM() {
+    const input = document.getElementById('SEL_FWHM');
+    const error = document.getElementById('error-SEL_FWHM');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSELFLUX() {
+    const input = document.getElementById('SEL_FLUX');
+    const error = document.getElementById('error-SEL_FLUX');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSersicReff() {
+    const input = document.getElementById('Sersic_Reff');
+    const error = document.getElementById('error-Sersic_Reff');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSersicInd() {
+    const input = document.getElementById('Sersic_Ind');
+    const error = document.getElementById('error-Sersic_Ind');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateAM() {
+    const input = document.getElementById('AM');
+    const error = document.getElementById('error-AM');
+    const value = parseFloat(input.value);
+    
+    if (value < 1 || value > 3 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateFLI() {
+    const input = document.getElementById('FLI');
+    const error = document.getElementById('error-FLI');
+    const value = parseFloat(input.value);
+    
+    if (value < 0 || value > 1 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSEE() {
+    const input = document.getElementById('SEE');
+    const error = document.getElementById('error-SEE');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateDIT() {
+    const input = document.getElementById('DIT');
+    const error = document.getElementById('error-DIT');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateNDIT() {
+    const input = document.getElementById('NDIT');
+    const error = document.getElementById('error-NDIT');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || !Number.isInteger(value) || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateSNR() {
+    const input = document.getElementById('SNR');
+    const error = document.getElementById('error-SNR');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+function validateLamRef() {
+    const input = document.getElementById('Lam_Ref');
+    const error = document.getElementById('error-Lam_Ref');
+    const value = parseFloat(input.value);
+    
+    if (value <= 0 || isNaN(value)) {
+        input.classList.add('error');
+        error.classList.remove('hidden');
+    } else {
+        input.classList.remove('error');
+        error.classList.add('hidden');
+    }
+}
+
+// Initialize on page load
+document.addEventListener('DOMContentLoaded', function() {
+    updateConfigOptions();
+    updateSEDOptions();
+    updateMorphologyOptions();
+    updateComputeMode();
+    // Restore last active tab after submit
+    const lastTab = sessionStorage.getItem('activeTab');
+    if (lastTab) {
+        switchTab({target: document.querySelector('.tab[onclick*="' + lastTab + '"]')}, lastTab);
+    }
+    // Save tab on click
+    document.querySelectorAll('.tab').forEach(tab => {
+        tab.addEventListener('click', function() {
+            sessionStorage.setItem('activeTab', tab.getAttribute('onclick').match(/'(.*?)'/)[1]);
+        });
+    });
+});
@@ -0,0 +1,141 @@
+"""Deterministic stand-in for ``pyetc_wst.wst.WST``, for benchmarks.
+
+Selected with ``PYETC_WEB_BACKEND=stub``. It has the interface the app uses
+(``build_obs_full``, ``set_obs``, the SNR and time solvers of the IFS and
+MOS, ``get_sky``) and returns spectra of realistic sizes, computed from a
+simple photon-noise model so that the solvers are consistent with each
+other. Each call burns a configurable amount of CPU time holding the GIL,
+like the pure-Python parts of the real backend, so that latency and
+throughput measurements are meaningful without the WST data files.
+"""
+import time
+
+import numpy as np
+
+import settings
+
+# Wavelength range (Angstrom) of every channel
+CHANNEL_RANGES = {
+    ('ifs', 'blue'): (3700., 6100.),
+    ('ifs', 'red'): (5900., 9500.),
+    ('moslr', 'blue'): (3700., 5300.),
+    ('moslr', 'green'): (5100., 7200.),
+    ('moslr', 'red'): (7000., 9500.),
+    ('moshr', 'U'): (3800., 4100.),
+    ('moshr', 'B'): (4400., 4800.),
+    ('moshr', 'V'): (5100., 5500.),
+    ('moshr', 'I'): (8300., 8800.),
+}
+
+FULL_WELL = 1e5      # e-
+READ_NOISE = 3.      # e-
+DARK = 1e-3          # e-/s
+
+
+def _burn(seconds):
+    # Busy loop holding the GIL, unlike time.sleep
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class _Wave:
+    def __init__(self, coords):
+        self._coords = coords
+
+    def coord(self):
+        return self._coords
+
+
+class Spectrum:
+    """Spectrum with the ``wave.coord()`` and ``data.data`` accessors of mpdaf."""
+
+    def __init__(self, wave, data):
+        self.wave = _Wave(wave)
+        self.data = np.ma.masked_invalid(data)
+
+
+class WST:
+    """Stub WST instrument model, see the module docstring."""
+
+    def __init__(self, log='DEBUG', skip_dataload=False):
+        _burn(settings.STUB_LOAD_SECONDS)
+        self.obs = None
+
+    def set_obs(self, obs):
+        self.obs = obs
+
+    def get_sky(self, ins, ch, moon, fli, am):
+        """Sky and throughput, in e-/s per pixel (depends on the conditions only)."""
+        _burn(settings.STUB_SKY_SECONDS)
+        wave = self._wave(ins, ch)
+        brightness = {'darksky': 1., 'greysky': 3., 'brightsky': 10.}.get(moon, 1. + 20 * (fli or 0))
+        return 2. * brightness * (am or 1.) * (1 + 0.3 * np.sin(wave / 37.))**2
+
+    def _wave(self, ins, ch):
+        wmin, wmax = CHANNEL_RANGES.get((ins, ch), (4000., 9000.))
+        return np.linspace(wmin, wmax, settings.STUB_NPIX)
+
+    def build_obs_full(self, config):
+        _burn(settings.STUB_BUILD_SECONDS)
+        ins, ch = config['INS'], config['CH']
+        wave = self._wave(ins, ch)
+        sky = self.get_sky(ins, ch, config.get('MOON'), config.get('FLI'), config.get('AM'))
+        # Source rate in e-/s per pixel: flat continuum with absorption
+        # features, diluted by the seeing
+        mag = config.get('OBJ_MAG') or 20
+        rate = 10**(-0.4 * (mag - 20)) * 5. / max(config.get('SEE') or 0.8, 0.1)
+        rate = rate * (1 - 0.5 * np.exp(-0.5 * ((wave[:, None] - wave[::max(1, len(wave) // 8)]) / 3.)**2).sum(axis=1))
+        spe = {'wave': wave, 'rate': rate, 'coadd': int(config.get('COADD_WL') or 1)}
+        con = {'INS': ins, 'CH': ch, 'sky': sky}
+        ob = {'dit': config['DIT'], 'ndit': config['NDIT'], 'snr': config.get('SNR'),
+              'lbda': config.get('Lam_Ref') or wave.mean()}
+        self.set_obs(ob)
+        return con, ob, spe, None, spe['wave']
+
+    def _snr(self, con, spe, dit, ndit):
+        signal = spe['rate'] * dit * ndit
+        noise = np.sqrt((spe['rate'] + con['sky'] + DARK) * dit * ndit + READ_NOISE**2 * ndit)
+        return signal / noise
+
+    def _frac_sat(self, con, spe, dit):
+        return float(np.mean((spe['rate'] + con['sky']) * dit > FULL_WELL))
+
+    def snr_from_source(self, con, im, spe):
+        _burn(settings.STUB_SOLVE_SECONDS)
+        dit, ndit = self.obs['dit'], self.obs['ndit']
+        frac_sat = self._frac_sat(con, spe, dit)
+        if frac_sat > 0.5:
+            return {'message': "Saturation in more than half of the pixels", 'frac_sat': frac_sat}
+        snr = self._snr(con, spe, dit, ndit)
+        res = {'spec': {'snr': Spectrum(spe['wave'], snr)}, 'frac_sat': frac_sat}
+        coadd = spe['coadd']
+        if coadd > 1:
+            # Running coadd of the pixels, on the same wavelength grid
+            kernel = np.ones(coadd) / np.sqrt(coadd)
+            res['spec']['snr_rebin'] = Spectrum(spe['wave'], np.convolve(snr, kernel, mode='same'))
+        return res
+
+    snr_from_source_MOS = snr_from_source
+
+    def time_from_source(self, con, im, spe, dit=False):
+        """Solve for the DIT (``dit=True``) or NDIT reaching the target SNR at ``lbda``."""
+        _burn(settings.STUB_SOLVE_SECONDS)
+        ob = self.obs
+        i = int(np.abs(spe['wave'] - ob['lbda']).argmin())
+        a, b = spe['rate'][i], spe['rate'][i] + con['sky'][i] + DARK
+        target = ob['snr']
+        if dit:
+            # NDIT a**2 DIT**2 - target**2 b DIT - target**2 RON**2 = 0
+            n = ob['ndit']
+            value = (target**2 * b + np.sqrt(target**4 * b**2 + 4 * n * a**2 * target**2 * READ_NOISE**2)) / (2 * n * a**2)
+            res = {'dit': float(value), 'frac_sat': self._frac_sat(con, spe, value)}
+        else:
+            t = ob['dit']
+            value = target**2 * (b * t + READ_NOISE**2) / (a * t)**2
+            res = {'ndit': float(value), 'frac_sat': self._frac_sat(con, spe, t)}
+        if res['frac_sat'] > 0.5:
+            res['message'] = "Saturation in more than half of the pixels"
+        return res
+
+    time_from_source_MOS = time_from_source
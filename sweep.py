@@ -0,0 +1,321 @@
+"""Parameter-grid sweeps of the SNR or of the exposure time.
+
+A sweep evaluates one instrument-channel configuration over the cartesian
+grid of up to three parameters. Axes other than the source magnitude are
+enumerated as ordinary configurations, so their points go through the
+result cache, the sky/throughput cache and the worker pool like any other
+computation.
+
+The magnitude axis is not enumerated. At each point of the other axes the
+SNR at the reference wavelength is evaluated for the faintest magnitude and
+the brightest one that can be computed (and at two more DITs in
+``ndit_snr`` mode) to fit the photon noise model of that pixel::
+
+    NDIT / SNR**2 = u / (f DIT) + v / (f**2 DIT) + w / (f**2 DIT**2)
+
+where ``f`` is the source flux relative to the first fitted magnitude and
+``u``, ``v``, ``w`` the source, background (sky and dark) and read noise
+terms. The whole magnitude axis then follows in one vectorized NumPy pass.
+The magnitudes too bright to be computed (saturation) and the saturated ones
+are located by bisection, since the model ignores saturation. The shortcut
+is not used when the extraction is optimised (``OPT_SPEC``/``OPT_IMA``) or
+for emission lines, whose brightness is not set by the magnitude.
+"""
+import itertools
+
+import numpy as np
+
+import etc_core
+import settings
+
+# Parameters that can be swept
+SWEEP_PARAMS = ['OBJ_MAG', 'Z', 'SEE', 'AM', 'FLI', 'PWV', 'MOON']
+MAX_SWEEP_AXES = 3
+
+# Swept quantity and the compute_config scalar holding it, per compute mode
+QUANTITIES = {'dit_ndit': 'snr', 'dit_snr': 'ndit', 'ndit_snr': 'dit'}
+SCALAR_KEYS = {'dit_ndit': 'snr_ref', 'dit_snr': 'required_ndit', 'ndit_snr': 'required_dit'}
+
+# In ndit_snr mode, times the DIT of the magnitude fit is divided by 10 when
+# every magnitude fails at the DIT of the configuration
+MAX_FIT_DIT_STEPS = 6
+
+
+def parse_axis_values(name, values):
+    """Parse the values of a sweep axis.
+
+    ``values`` is either a list or a text, ``start:stop:num`` for ``num``
+    evenly spaced values or a comma-separated list.
+    """
+    if isinstance(values, str):
+        text = values.strip()
+        if name != 'MOON' and text.count(':') == 2:
+            start, stop, num = text.split(':')
+            try:
+                values = np.linspace(float(start), float(stop), int(num)).tolist()
+            except ValueError:
+                raise ValueError(f"Invalid range for {name}: {text}") from None
+        else:
+            values = [etc_core.parse_value(v.strip()) for v in text.split(',') if v.strip()]
+    if not isinstance(values, (list, tuple)) or not values:
+        raise ValueError(f"No values given for {name}")
+    if name != 'MOON' and not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        raise ValueError(f"Values of {name} must be numbers")
+    return list(values)
+
+
+def parse_axes(pairs):
+    """Validate ``(name, values)`` pairs and return the sweep axes."""
+    axes = []
+    for name, values in pairs:
+        if name not in SWEEP_PARAMS:
+            raise ValueError(f"Parameter {name} cannot be swept (use one of {', '.join(SWEEP_PARAMS)})")
+        if name in [a[0] for a in axes]:
+            raise ValueError(f"Parameter {name} is swept twice")
+        axes.append((name, parse_axis_values(name, values)))
+    if len(axes) > MAX_SWEEP_AXES:
+        raise ValueError(f"At most {MAX_SWEEP_AXES} parameters can be swept")
+    return axes
+
+
+def _fit_flux_terms(z_a, z_b, fb):
+    # NDIT/SNR**2 = alpha/f + beta/f**2, sampled at f=1 and f=fb
+    beta = (z_b - z_a / fb) / (1. / fb**2 - 1. / fb)
+    alpha = z_a - beta
+    return alpha, beta
+
+
+def _noise_design(f, dit):
+    f = np.asarray(f, dtype=float)
+    dit = np.asarray(dit, dtype=float)
+    return np.stack([1. / (f * dit), 1. / (f**2 * dit), 1. / (f**2 * dit**2)], axis=-1)
+
+
+def _solve_dit(u, v, w, f, z_target):
+    # z_target = NDIT/SNR**2 = u/(f DIT) + v/(f**2 DIT) + w/(f**2 DIT**2), solved for DIT
+    a = u / f + v / f**2
+    c = w / f**2
+    return (a + np.sqrt(a**2 + 4 * z_target * c)) / (2 * z_target)
+
+
+def first_index(n, predicate):
+    """Smallest ``i`` in ``[0, n)`` for which the monotonic ``predicate`` holds, else ``n``."""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if predicate(mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def scale_magnitudes(obj, config, compute_mode, mags):
+    """Swept quantity over the magnitudes ``mags``, other parameters fixed.
+
+    The model is fitted on the faintest magnitude and the brightest one the
+    solver can compute at the DIT of the configuration, found by bisection:
+    the solver fails (e.g. on saturation) from some brightness on. In
+    ``ndit_snr`` mode, where the DIT is solved, the fit uses shorter DITs
+    if even the faintest magnitude fails at that one; the brighter
+    magnitudes are extrapolated, the solved
+    DIT getting shorter with the brightness, and the faintest magnitudes
+    fail instead when their long DIT saturates. The magnitudes that fail,
+    and those where pixels saturate, which the model ignores, are located
+    by bisection at the DIT of every magnitude.
+
+    Returns
+    -------
+    dict
+        ``values``: the quantity at every magnitude, NaN where the solver
+        fails, ``saturated``: whether some pixels saturate at every
+        magnitude and ``errors``: the solver message for the failing ones.
+    """
+    mags = np.asarray(mags, dtype=float)
+    # Faintest first
+    order = np.unique(mags)[::-1]
+    position = {m: k for k, m in enumerate(order)}
+    index = [position[m] for m in mags]
+    n = len(order)
+    ndit = config['NDIT']
+    dit = config['DIT']
+
+    # One observation build per magnitude, evaluated at several DITs, the
+    # results at the DIT of the fit being kept
+    probes = {}
+    at_fit = {}
+    fit_dit = dit
+
+    def probe(k, dit=None):
+        if k not in probes:
+            probes[k] = etc_core.reference_probe(obj, dict(config, OBJ_MAG=float(order[k])), compute_mode)
+        if dit is None:
+            if k not in at_fit:
+                at_fit[k] = probes[k](fit_dit, ndit)
+            return at_fit[k]
+        return probes[k](dit, ndit)
+
+    n_ok = first_index(n, lambda k: probe(k)['snr'] is None)
+    for _ in range(MAX_FIT_DIT_STEPS if compute_mode == 'ndit_snr' else 0):
+        if n_ok:
+            break
+        fit_dit /= 10
+        at_fit.clear()
+        n_ok = first_index(n, lambda k: probe(k)['snr'] is None)
+    if n_ok == 0:
+        saturated = np.full(n, bool(probe(0)['frac_sat']))
+        return {'values': np.full(len(mags), np.nan), 'saturated': saturated[index],
+                'errors': [probe(0)['message']]}
+    f = 10**(-0.4 * (order - order[0]))
+    fb = f[n_ok - 1]
+    z_a = ndit / probe(0)['snr']**2
+    z_b = ndit / probe(n_ok - 1)['snr']**2
+    if n_ok == 1:
+        alpha, beta = z_a, 0.
+    else:
+        alpha, beta = _fit_flux_terms(z_a, z_b, fb)
+    values = np.full(n, np.nan)
+    errors = []
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if compute_mode != 'ndit_snr':
+            if compute_mode == 'dit_ndit':
+                values[:n_ok] = np.sqrt(ndit / (alpha / f[:n_ok] + beta / f[:n_ok]**2))
+            else:
+                # dit_snr: NDIT/SNR**2 does not depend on NDIT
+                values[:n_ok] = config['SNR']**2 * (alpha / f[:n_ok] + beta / f[:n_ok]**2)
+            if n_ok < n:
+                errors.append(probe(n_ok)['message'])
+            # Saturation grows with the brightness at a fixed DIT
+            n_unsat = first_index(n, lambda k: bool(probe(k)['frac_sat']))
+            saturated = np.arange(n) >= n_unsat
+            return {'values': values[index], 'saturated': saturated[index], 'errors': errors}
+
+        # ndit_snr: the read noise term only shows at short DITs, so sample
+        # the SNR again near the DITs solving the problem without it, then
+        # fit the three terms on all the samples (relative least squares)
+        z_target = ndit / config['SNR']**2
+        u0, v0 = alpha * fit_dit, beta * fit_dit
+        d_a, d_b = _solve_dit(u0, v0, 0., np.array([1., fb]), z_target)
+        samples = [(1., fit_dit, z_a), (fb, fit_dit, z_b)]
+        for k, fk, dk in [(0, 1., d_a), (n_ok - 1, fb, d_b)]:
+            snr = probe(k, dk)['snr']
+            if snr:
+                samples.append((fk, dk, ndit / snr**2))
+        fs, ds, zs = np.array(samples).T
+        design = _noise_design(fs, ds) / zs[:, None]
+        (u, v, w), *_ = np.linalg.lstsq(design, np.ones(len(zs)), rcond=None)
+        values = _solve_dit(u, max(v, 0.), max(w, 0.), f, z_target)
+
+    # At the solved DITs, the longest ones (faintest magnitudes) fail or
+    # saturate first
+    def at_solved(k):
+        return probe(k, float(values[k])) if np.isfinite(values[k]) else {'snr': None, 'frac_sat': None,
+                                                                           'message': "No DIT reaches the SNR"}
+
+    n_bad = first_index(n, lambda k: at_solved(k)['snr'] is not None)
+    n_sat = first_index(n, lambda k: not at_solved(k)['frac_sat'])
+    if n_bad:
+        errors.append(at_solved(n_bad - 1)['message'])
+        values[:n_bad] = np.nan
+    saturated = np.arange(n) < n_sat
+    return {'values': values[index], 'saturated': saturated[index], 'errors': errors}
+
+
+def run_sweep(config, compute_mode, axes, execution=None, deadline=None):
+    """Evaluate a configuration over the grid of the sweep axes.
+
+    Parameters
+    ----------
+    config : dict
+        Full parameter dictionary, the swept parameters being overridden.
+    compute_mode : str
+        Selects the swept quantity: SNR at the reference wavelength
+        (``dit_ndit``), required NDIT (``dit_snr``) or DIT (``ndit_snr``).
+    axes : list of (str, list)
+        Sweep axes, as returned by ``parse_axes``.
+    deadline : float or None
+        Time budget of the request, see ``etc_core.request_deadline``.
+
+    Returns
+    -------
+    dict
+        ``quantity``, ``axes`` (names and values), ``values``: array of
+        shape ``(len(values_1), ...)``, NaN where the computation failed,
+        ``saturated``: boolean array of the same shape, true where some
+        pixels saturate, ``n_points``: number of grid points actually computed and
+        ``errors``: messages of the failed points.
+    """
+    names = [name for name, _ in axes]
+    shape = tuple(len(values) for _, values in axes)
+    out = np.full(shape, np.nan)
+    saturated = np.zeros(shape, dtype=bool)
+    errors = []
+
+    mag_axis = names.index('OBJ_MAG') if 'OBJ_MAG' in names else None
+    if (mag_axis is not None and len(set(axes[mag_axis][1])) > 1
+            and config.get('Obj_SED') != 'line'
+            and not config.get('OPT_SPEC') and not config.get('OPT_IMA')):
+        outer = [i for i in range(len(axes)) if i != mag_axis]
+    else:
+        mag_axis = None
+        outer = list(range(len(axes)))
+
+    points = list(itertools.product(*[range(shape[i]) for i in outer]))
+    if len(points) > settings.SWEEP_MAX_POINTS:
+        raise ValueError(f"Sweep needs {len(points)} computations, the maximum is {settings.SWEEP_MAX_POINTS}")
+    point_configs = []
+    for point in points:
+        c = dict(config)
+        for i, j in zip(outer, point):
+            c[names[i]] = axes[i][1][j]
+        point_configs.append(c)
+
+    def grid_index(point):
+        index = [slice(None)] * len(axes)
+        for i, j in zip(outer, point):
+            index[i] = j
+        return tuple(index)
+
+    if mag_axis is not None:
+        mags = axes[mag_axis][1]
+        tasks = [(c, compute_mode, mags) for c in point_configs]
+        for k, res, error in etc_core.map_tasks(scale_magnitudes, tasks, execution, deadline):
+            if error is not None:
+                errors.append(error)
+            else:
+                out[grid_index(points[k])] = res['values']
+                saturated[grid_index(points[k])] = res['saturated']
+                errors.extend(res['errors'])
+    else:
+        tasks = [(c, compute_mode) for c in point_configs]
+        for k, res in etc_core.iter_results(tasks, execution, deadline):
+            value = res['scalars'].get(SCALAR_KEYS[compute_mode])
+            saturated[grid_index(points[k])] = bool(res['scalars'].get('frac_sat'))
+            if value is None:
+                errors.append(res['scalars'].get('message') or '\n'.join(res['lines']))
+            else:
+                out[grid_index(points[k])] = value
+
+    return {
+        'quantity': QUANTITIES[compute_mode],
+        'axes': [{'name': name, 'values': list(values)} for name, values in axes],
+        'values': out,
+        'saturated': saturated,
+        'n_points': len(points),
+        'errors': errors,
+    }
+
+
+def grid_payload(res):
+    """The ``values`` grid of a ``run_sweep`` result as nested lists, for JSON.
+
+    The points that failed are None (``null``), NaN not being valid JSON.
+    Raises ``ValueError`` if the grid does not have the shape of the axes,
+    which the page and API clients rely on to draw it.
+    """
+    values = res['values']
+    values = np.where(np.isfinite(values), values, None).tolist()
+    shape = tuple(len(axis['values']) for axis in res['axes'])
+    if np.shape(values) != shape:
+        raise ValueError(f"Sweep grid of shape {np.shape(values)} for axes of shape {shape}")
+    return values
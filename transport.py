@@ -0,0 +1,208 @@
+"""Compact transport of the SNR plot traces to the browser.
+
+Traces are sent as base64-encoded little-endian float32 arrays instead of
+decimal JSON text, and long traces are reduced to screen resolution with the
+Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape of
+the curve (peaks and absorption features). The full-resolution arrays are
+kept in ``trace_store`` and served as raw float32 when the user zooms in:
+in memory, or in a directory (``settings.TRACE_DIR``) when the zoom requests
+may reach another server process.
+"""
+import base64
+import hashlib
+import os
+import re
+import threading
+import uuid
+
+import numpy as np
+
+import settings
+from result_cache import LRUCache
+
+
+class TraceDirectory:
+    """Full-resolution traces kept in files of a directory.
+
+    The directory may be shared by several processes. Beyond ``max_bytes``
+    the least recently used files are deleted, recency being their
+    modification time, which ``get`` and ``in`` update.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, token):
+        if not re.fullmatch('[0-9a-f]{40}', token):
+            return None
+        return os.path.join(self.directory, token + '.f32')
+
+    def __contains__(self, token):
+        path = self._path(token)
+        if path is None:
+            return False
+        try:
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    def get(self, token, default=None):
+        path = self._path(token)
+        if path is None:
+            return default
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return default
+        return data
+
+    def put(self, token, data):
+        path = self._path(token)
+        if path is None or len(data) > self.max_bytes:
+            return
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+
+# Full-resolution traces, keyed by the token sent with their downsampled version
+if settings.TRACE_DIR:
+    trace_store = TraceDirectory(settings.TRACE_DIR, settings.TRACE_STORE_MAX_MB * 2**20)
+else:
+    trace_store = LRUCache(settings.TRACE_STORE_MAX_MB * 2**20, sizeof=len)
+
+
+def encode_f32(array):
+    """Encode an array as base64 little-endian float32."""
+    return base64.b64encode(np.asarray(array, dtype='<f4').tobytes()).decode('ascii')
+
+
+def _bucket_argmax(values, starts, counts):
+    # Index of the first maximum of every bucket of consecutive values
+    values = np.nan_to_num(values)
+    maxima = np.maximum.reduceat(values, starts)
+    hits = np.flatnonzero(values >= np.repeat(maxima, counts))
+    return hits[np.searchsorted(hits, starts)]
+
+
+def lttb(x, y, n_out):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    Vectorized over the buckets: the point of a bucket is the one making
+    the largest triangle with the average of the next bucket and the point
+    chosen in the previous bucket, itself taken from a first pass anchored
+    on the average of the previous bucket. Unlike the sequential algorithm,
+    a choice thus does not depend on the final choice in the previous
+    bucket, which changes the point kept in a few percent of the buckets
+    for a similar shape.
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Trace coordinates, ``x`` sorted.
+    n_out : int
+        Number of points to keep (at least 3).
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted indices of the selected points, first and last included.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # NaNs (e.g. masked pixels) must not win the area comparisons
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    x = np.asarray(x, dtype=float)
+    # Buckets of the inner points, [edges[i], edges[i + 1])
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:n - 1], starts) / counts
+    mean_y = np.add.reduceat(y[:n - 1], starts) / counts
+    # Average of the next bucket, the last point for the last bucket
+    next_x = np.repeat(np.append(mean_x[1:], x[-1]), counts)
+    next_y = np.repeat(np.append(mean_y[1:], y[-1]), counts)
+    px = x[1:n - 1]
+    py = y[1:n - 1]
+
+    def select(anchor_x, anchor_y):
+        ax = np.repeat(anchor_x, counts)
+        ay = np.repeat(anchor_y, counts)
+        area = np.abs((ax - next_x) * (py - ay) - (ax - px) * (next_y - ay))
+        return _bucket_argmax(area, starts - 1, counts) + 1
+
+    chosen = select(np.append(x[0], mean_x[:-1]), np.append(y[0], mean_y[:-1]))
+    previous = np.append(0, chosen[:-1])
+    chosen = select(x[previous], y[previous])
+    return np.concatenate([[0], chosen, [n - 1]])
+
+
+def full_data(trace):
+    """Full-resolution payload of a trace: its float32 ``x`` then ``y``."""
+    return np.concatenate([np.asarray(trace['x'], dtype='<f4'), np.asarray(trace['y'], dtype='<f4')]).tobytes()
+
+
+def encode_trace(trace, max_points=None):
+    """Prepare a plot trace with numpy ``x``/``y`` arrays for the page.
+
+    ``x`` and ``y`` are replaced by their float32 base64 encoding, downsampled
+    to ``max_points`` points (``settings.PLOT_MAX_POINTS`` by default, 0 to
+    keep every point). A downsampled trace gets the ``full`` token of its
+    full-resolution version in ``trace_store``.
+    """
+    if max_points is None:
+        max_points = settings.PLOT_MAX_POINTS
+    x = np.asarray(trace['x'])
+    y = np.asarray(trace['y'])
+    encoded = dict(trace, encoding='f32', n_full=len(x), full=None)
+    if max_points and len(x) > max_points:
+        data = full_data(trace)
+        token = hashlib.sha1(data).hexdigest()
+        if token not in trace_store:
+            trace_store.put(token, data)
+        encoded['full'] = token
+        keep = lttb(x, y, max_points)
+        x = x[keep]
+        y = y[keep]
+    encoded['x'] = encode_f32(x)
+    encoded['y'] = encode_f32(y)
+    return encoded
+
+
+def plot_traces(res):
+    """Encoded plot traces of a ``compute_config`` result, for the page.
+
+    ``res`` is left as it is: it may be held by the result cache, whose size
+    accounting would miss anything added to it. The full-resolution traces
+    of a result served again are only written to ``trace_store`` if they
+    were evicted since.
+    """
+    return [encode_trace(trace) for trace in res['traces']]
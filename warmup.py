@@ -0,0 +1,83 @@
+"""Background loading of the WST instrument models.
+
+Importing the backend and loading its data take a while, during which a
+server loading them at import time could not answer anything, not even the
+health checks of a load balancer. The app loads them in a background thread
+instead: the server answers at once, ``/healthz`` as soon as the process is
+up, ``/readyz`` once the models are loaded, and the computation routes reply
+"warming up" until then.
+"""
+import threading
+import time
+import traceback
+
+
+class Warmup:
+    """Runs ``load()`` once, in a background thread, and reports its state.
+
+    The state is ``idle``, ``loading``, ``ready`` or ``failed`` (with the
+    ``error`` message) once ``load`` has returned or raised.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.state = 'idle'
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._callbacks = []
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    @property
+    def done(self):
+        return self.state in ('ready', 'failed')
+
+    def start(self):
+        """Start loading in the background if this has not been done yet."""
+        with self._lock:
+            if self.state != 'idle':
+                return
+            self.state = 'loading'
+            self.started = time.monotonic()
+        threading.Thread(target=self._run, name='etc-warmup', daemon=True).start()
+
+    def _run(self):
+        error = None
+        try:
+            self.load()
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        with self._lock:
+            self.error = error
+            self.state = 'failed' if error else 'ready'
+            self.finished = time.monotonic()
+            callbacks, self._callbacks = self._callbacks, []
+        self._done.set()
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Call ``callback(self)`` once loading is over, at once if it is already."""
+        with self._lock:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Wait until loading is over; return whether the models are ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        if self.started is None:
+            seconds = None
+        else:
+            seconds = (self.finished or time.monotonic()) - self.started
+        return {'status': self.state, 'seconds': seconds, 'error': self.error}
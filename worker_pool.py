@@ -0,0 +1,329 @@
+"""Pool of killable worker processes with per-task time budgets.
+
+Like ``concurrent.futures.ProcessPoolExecutor``, but every worker process has
+its own pipe and feeder thread, so that a task running over its time budget
+can be stopped by killing its process alone: the task fails with
+``TaskTimeout``, the tasks of the other workers go on, and a fresh process
+takes the place of the killed one at once. This works whatever the task is
+doing, pure Python or long NumPy calls, which a thread cannot interrupt.
+
+Tasks may also carry the deadline of the request they belong to: a task
+still queued at its deadline fails without being started, a running one is
+killed when it is reached. The time a task waits for its worker to finish
+starting (a replaced worker loads its models again) counts against both.
+
+``WorkerPool.restart`` replaces all the processes, once done with their
+current task, e.g. for them to load data files that changed.
+
+The processes are spawned rather than forked from the web server: a fork of
+a threaded process may inherit locks held by its other threads and hang. (A
+fork server would not do either: it would be shared by the web server
+workers forked after it started.)
+"""
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+
+
+class TaskTimeout(Exception):
+    """Raised for a task stopped or skipped because of its time budget."""
+
+
+class WorkerDied(Exception):
+    """Raised for a task whose worker process died (e.g. out of memory)."""
+
+
+# Queue item waking up the idle workers after a restart()
+_RESTART = 'restart'
+
+
+def _worker_main(conn, initializer):
+    # A fork of a web server worker inherits its signal handlers, which would
+    # keep terminate() from stopping this process
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if initializer is not None:
+        initializer()
+    conn.send(('ready', None))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args = task
+        try:
+            reply = ('ok', func(*args))
+        except Exception as e:
+            reply = ('error', e)
+        try:
+            conn.send(reply)
+        except Exception as e:
+            # Unpicklable result or exception
+            conn.send(('error', RuntimeError(f"Cannot send the result back: {e}")))
+
+
+class _Worker:
+    """A worker process and its end of the pipe."""
+
+    def __init__(self, context, initializer, generation=0):
+        self.generation = generation
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, initializer), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.started = time.monotonic()
+        self.ready = False
+        self._ready_lock = threading.Lock()
+
+    def wait_ready(self, timeout=None):
+        """Wait until the initializer has run.
+
+        Returns True once it has, False if the process died and None if it
+        is still running after ``timeout`` seconds. Several threads may
+        wait at the same time: only one of them reads the pipe.
+        """
+        if self.ready:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._ready_lock.acquire(timeout=-1 if timeout is None else timeout):
+            return None
+        try:
+            if not self.ready:
+                if not self.conn.poll(None if deadline is None else max(0., deadline - time.monotonic())):
+                    return None
+                self.conn.recv()
+                self.ready = True
+        except (EOFError, OSError):
+            return False
+        finally:
+            self._ready_lock.release()
+        return True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self, timeout=5.):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class WorkerPool:
+    """Fixed number of worker processes serving a queue of tasks.
+
+    Parameters
+    ----------
+    size : int
+        Number of worker processes.
+    initializer : callable or None
+        Run once in every new worker process, before its first task. It
+        must be a module-level function.
+    start_timeout : float or None
+        Seconds after which a worker process whose initializer has not
+        returned is considered hung, and killed and replaced.
+    """
+
+    def __init__(self, size, initializer=None, start_timeout=None):
+        self.size = max(1, int(size))
+        self.initializer = initializer
+        self.start_timeout = start_timeout or None
+        self._context = multiprocessing.get_context('spawn')
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = [None] * self.size
+        self._threads = []
+        self._shutdown = False
+        self.generation = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+    def start(self, wait=False):
+        """Start the worker processes; with ``wait``, until they are initialized."""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("The worker pool is shut down")
+            if not self._threads:
+                for slot in range(self.size):
+                    self._workers[slot] = _Worker(self._context, self.initializer, self.generation)
+                    thread = threading.Thread(target=self._serve, args=(slot,), name=f"etc-worker-{slot}",
+                                              daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        if wait:
+            for worker in list(self._workers):
+                if worker is not None:
+                    worker.wait_ready(self._start_remaining(worker))
+
+    def submit(self, func, *args, timeout=None, deadline=None):
+        """Run ``func(*args)`` in a worker process; return its ``Future``.
+
+        ``timeout`` is the time budget of the task once started, in seconds,
+        and ``deadline`` a ``time.monotonic()`` time by which it must be
+        done, None for no limit.
+        """
+        self.start()
+        future = Future()
+        with self._lock:
+            # Not after shutdown() emptied the queue, where no one would take it
+            if self._shutdown:
+                raise RuntimeError("The worker pool is shut down")
+            self._tasks.put((future, func, args, timeout, deadline))
+        return future
+
+    def restart(self):
+        """Replace every worker process once done with its current task.
+
+        The tasks taken from the queue from now on run in new processes.
+        """
+        with self._lock:
+            self.generation += 1
+            started = bool(self._threads)
+        if started:
+            for _ in range(self.size):
+                self._tasks.put(_RESTART)
+
+    def _replace(self, slot, worker, kill=True):
+        if kill:
+            worker.kill()
+        else:
+            worker.stop()
+        with self._lock:
+            if kill:
+                self.restarts += 1
+            if self._shutdown:
+                self._workers[slot] = None
+                return None
+            # Started at once, so that it is initialized by the next task
+            self._workers[slot] = _Worker(self._context, self.initializer, self.generation)
+            return self._workers[slot]
+
+    def _start_remaining(self, worker):
+        # Seconds left before a worker still starting is considered hung
+        if self.start_timeout is None:
+            return None
+        return max(0., worker.started + self.start_timeout - time.monotonic())
+
+    def _wait_ready(self, slot, worker, limit):
+        # Wait for the worker to be ready within the time limit of a task.
+        # Returns the worker of the slot, None if it is not ready in time,
+        # and raises WorkerDied if it died or hung while starting.
+        wait = self._start_remaining(worker)
+        hang = limit is None or (wait is not None and wait <= limit)
+        if not hang:
+            wait = limit
+        ready = worker.wait_ready(wait)
+        if ready:
+            return worker
+        if ready is None and not hang:
+            return None
+        self._replace(slot, worker)
+        raise WorkerDied("ETC worker process " + ("died" if ready is False else "hung") + " while starting")
+
+    def _serve(self, slot):
+        worker = self._workers[slot]
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            if worker is not None and worker.generation != self.generation:
+                # Started before restart(): idle now, stopped gracefully
+                worker = self._replace(slot, worker, kill=False)
+            if task is _RESTART:
+                continue
+            future, func, args, timeout, deadline = task
+            if worker is None:
+                # Not replaced, the pool shutting down: cancelled like the
+                # tasks still queued
+                future.cancel()
+                continue
+            if not future.set_running_or_notify_cancel():
+                continue
+            if deadline is not None and deadline <= time.monotonic():
+                future.set_exception(TaskTimeout("Not started within the time budget of the request"))
+                continue
+            # The budget that ends first, which the wait for a starting
+            # worker counts against
+            limit, budget = timeout, 'computation'
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    future.set_exception(TaskTimeout("Not started within the time budget of the request"))
+                    continue
+                if limit is None or remaining < limit:
+                    limit, budget = remaining, 'request'
+            total = limit
+            if not worker.ready:
+                waited = time.monotonic()
+                try:
+                    ready = self._wait_ready(slot, worker, limit)
+                except WorkerDied as e:
+                    worker = self._workers[slot]
+                    future.set_exception(e)
+                    continue
+                waited = time.monotonic() - waited
+                if ready is None or (limit is not None and waited >= limit):
+                    future.set_exception(TaskTimeout(
+                        f"Not started within {limit:.3g} s: the ETC worker process is still starting"))
+                    continue
+                if limit is not None:
+                    limit -= waited
+            try:
+                worker.conn.send((func, args))
+                if not worker.conn.poll(limit):
+                    with self._lock:
+                        self.timeouts += 1
+                    worker = self._replace(slot, worker)
+                    future.set_exception(TaskTimeout(f"Cancelled after {total:.3g} s, the time budget of the {budget}"))
+                    continue
+                status, value = worker.conn.recv()
+            except (EOFError, OSError):
+                worker = self._replace(slot, worker)
+                future.set_exception(WorkerDied("ETC worker process died during the computation"))
+                continue
+            if status == 'ok':
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        if worker is not None:
+            worker.stop()
+
+    def shutdown(self):
+        """Stop the worker processes; queued tasks are cancelled."""
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            threads = list(self._threads)
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None and task is not _RESTART:
+                task[0].cancel()
+        for _ in threads:
+            self._tasks.put(None)
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.size,
+                'queued': self._tasks.qsize(),
+                'timeouts': self.timeouts,
+                'restarts': self.restarts,
+                'generation': self.generation,
+            }
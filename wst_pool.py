@@ -0,0 +1,253 @@
+"""Process-wide pool of preloaded WST instrument models.
+
+Building a ``WST`` object reads all the instrument, throughput and sky data
+from disk, so it is done once and the instances are shared by every request.
+A ``WST`` object keeps per-observation state between ``build_obs_full`` and
+the SNR/time solvers, hence each request borrows an instance for itself
+instead of sharing one concurrently.
+"""
+import hashlib
+import importlib.metadata
+import os
+import queue
+import threading
+import time
+import types
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics
+import settings
+from result_cache import ConditionCache
+
+# Sky and throughput models shared by all the instances of this process
+condition_cache = ConditionCache(settings.CONDITION_CACHE_MAX_MB * 2**20,
+                                 settings.CONDITION_CACHE_METHODS)
+
+
+def backend_class():
+    """The WST class of the configured backend (``settings.BACKEND``)."""
+    if settings.BACKEND == 'stub':
+        from stub_wst import WST
+    else:
+        from pyetc_wst.wst import WST
+    return WST
+
+
+def load_wst():
+    """Build a fully loaded WST instrument model."""
+    WST = backend_class()
+    with metrics.timer('wst_load'):
+        obj = WST(log=settings.WST_LOG_LEVEL, skip_dataload=False)
+        if settings.MMAP_DIR:
+            memmap_arrays(obj, settings.MMAP_DIR, settings.MMAP_MIN_KB * 1024)
+        return condition_cache.install(obj)
+
+
+def _memmap_array(array, directory):
+    digest = hashlib.sha1(repr((array.dtype.str, array.shape)).encode())
+    digest.update(np.ascontiguousarray(array).data)
+    path = os.path.join(directory, digest.hexdigest() + '.npy')
+    if not os.path.exists(path):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+    return np.load(path, mmap_mode='c')
+
+
+def memmap_arrays(obj, directory, min_bytes=2**20):
+    """Replace the large numpy arrays held by ``obj`` with memory maps.
+
+    The attributes of ``obj`` are walked recursively, through dicts, lists
+    and object attributes, and every plain ``ndarray`` of at least
+    ``min_bytes`` is saved to ``directory``, under a hash of its content,
+    and replaced by a copy-on-write memory map of that file. Identical
+    arrays of several instances or processes then share the same pages of
+    the page cache, which survive worker restarts. Writes to the arrays stay
+    private to the process. Returns the number of bytes mapped.
+    """
+    os.makedirs(directory, exist_ok=True)
+    seen = set()
+    mapped = 0
+
+    def convert(value):
+        nonlocal mapped
+        if isinstance(value, np.ndarray):
+            # Subclasses (masked arrays, quantities...) are left alone
+            if type(value) is np.ndarray and value.nbytes >= min_bytes and not value.dtype.hasobject:
+                mapped += value.nbytes
+                return _memmap_array(value, directory)
+            return value
+        visit(value)
+        return value
+
+    def visit(value):
+        if id(value) in seen:
+            return
+        seen.add(id(value))
+        if type(value) is dict:
+            for k, v in list(value.items()):
+                value[k] = convert(v)
+        elif type(value) is list:
+            for i, v in enumerate(value):
+                value[i] = convert(v)
+        elif (hasattr(value, '__dict__') and not callable(value)
+              and not isinstance(value, (type, types.ModuleType))):
+            visit(vars(value))
+
+    visit(obj)
+    return mapped
+
+
+class WSTPool:
+    """Fixed-size pool of WST instances with reload support.
+
+    Parameters
+    ----------
+    size : int
+        Number of instances, i.e. the number of requests that can compute
+        at the same time.
+    factory : callable
+        Function returning a new instance, ``load_wst`` by default.
+    data_dir : str or None
+        Directory watched for changes. When any file in it is added, removed
+        or modified the pool is rebuilt on the next checkout, or the next
+        ``check_for_changes``.
+    check_interval : float
+        Minimum number of seconds between two scans of ``data_dir``.
+    """
+
+    def __init__(self, size=1, factory=load_wst, data_dir=None, check_interval=10.):
+        self.size = max(1, int(size))
+        self.factory = factory
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._idle = None
+        self._signature = None
+        self._last_check = 0.
+
+    @property
+    def started(self):
+        return self._idle is not None
+
+    @property
+    def signature(self):
+        """Signature of the data files the models of the current generation were loaded from."""
+        return self._signature
+
+    def start(self):
+        """Build the instances if this has not been done yet."""
+        if self._idle is None:
+            with self._lock:
+                if self._idle is None:
+                    self._fill()
+
+    def reload(self):
+        """Rebuild every instance, e.g. after the data files changed.
+
+        Requests already holding an instance finish with it; new checkouts
+        get the fresh instances. ``generation`` is incremented even if the
+        pool is not started, for the worker processes, which load their own
+        instances, to be restarted (see ``etc_core.get_executor``).
+        """
+        with self._lock:
+            condition_cache.clear()
+            self.generation += 1
+            if self._idle is not None:
+                self._fill()
+            else:
+                self._signature = self._data_signature()
+                self._last_check = time.monotonic()
+
+    def _fill(self):
+        signature = self._data_signature()
+        instances = [self.factory() for _ in range(self.size)]
+        idle = queue.LifoQueue()
+        for obj in instances:
+            idle.put(obj)
+        self._signature = signature
+        self._last_check = time.monotonic()
+        self._idle = idle
+
+    def _data_signature(self):
+        if not self.data_dir:
+            return None
+        entries = []
+        for root, _, files in os.walk(self.data_dir):
+            for fname in files:
+                path = os.path.join(root, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st.st_mtime_ns, st.st_size))
+        # Stable across processes, unlike hash(): used in persistent keys
+        return hashlib.sha1(repr(sorted(entries)).encode()).hexdigest()
+
+    def check_for_changes(self):
+        """Reload the pool if the watched data files changed.
+
+        The first check of a pool not started records the signature of the
+        data files, which the worker processes starting then load.
+        """
+        if not self.data_dir or time.monotonic() - self._last_check < self.check_interval:
+            return False
+        with self._lock:
+            if time.monotonic() - self._last_check < self.check_interval:
+                return False
+            self._last_check = time.monotonic()
+            signature = self._data_signature()
+            if self._signature is None:
+                self._signature = signature
+            if signature == self._signature:
+                return False
+        self.reload()
+        return True
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow an instance for the duration of the ``with`` block."""
+        self.start()
+        self.check_for_changes()
+        # Instances go back to the queue they came from: after a reload the
+        # old queue is simply dropped once its last borrower is done.
+        idle = self._idle
+        try:
+            obj = idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No WST instance available") from None
+        try:
+            yield obj
+        finally:
+            idle.put(obj)
+
+
+pool = WSTPool(size=settings.WST_POOL_SIZE,
+               data_dir=settings.WST_DATA_DIR,
+               check_interval=settings.WST_RELOAD_CHECK_INTERVAL)
+
+_code_version = None
+
+
+def backend_version():
+    """Identifier of the backend code and data, for results stored on disk.
+
+    Made of the backend and its version, the signature of the data files
+    the models of the current ``pool.generation`` were loaded from (not of
+    the files now on disk, which may have changed since the last
+    ``check_for_changes``) and ``settings.RESULT_STORE_VERSION``.
+    """
+    global _code_version
+    if _code_version is None:
+        if settings.BACKEND == 'stub':
+            _code_version = f"stub-{settings.STUB_NPIX}"
+        else:
+            try:
+                _code_version = f"pyetc_wst-{importlib.metadata.version('pyetc_wst')}"
+            except importlib.metadata.PackageNotFoundError:
+                _code_version = 'pyetc_wst'
+    return f"{_code_version}:{pool.signature or ''}:{settings.RESULT_STORE_VERSION}"